@@ -15,6 +15,7 @@ from rest_framework_simplejwt.tokens import RefreshToken
 
 from .authentication import get_totp_uri, verify_totp
 from .models import CustomUser, PasswordResetToken, Role, SessionTerminationCode, UserSession
+from ai_security.mixins import RealtimeScoringMixin
 from audit.mixins import AuditMixin
 from .permissions import IsSuperAdmin, IsLeader, ROLE_CREATION_MAP, LEADER_ROLES
 from .security import SecurityManager, get_client_ip
@@ -429,7 +430,7 @@ class ProfileView(APIView):
         return Response(UserSerializer(request.user).data)
 
 
-class PublicKeyView(APIView):
+class PublicKeyView(RealtimeScoringMixin, APIView):
     """Store the current user's public key for E2E encryption."""
     permission_classes = [IsAuthenticated]
 
@@ -458,7 +459,7 @@ class PublicKeyView(APIView):
         })
 
 
-class UserPublicKeyView(APIView):
+class UserPublicKeyView(RealtimeScoringMixin, APIView):
     """Get any user's public key by UUID (for encrypting data for them)."""
     permission_classes = [IsAuthenticated]
 
@@ -480,7 +481,7 @@ class UserPublicKeyView(APIView):
         })
 
 
-class E2ERecipientsView(APIView):
+class E2ERecipientsView(RealtimeScoringMixin, APIView):
     """Get public keys of all users who should receive encrypted keys for a document."""
     permission_classes = [IsAuthenticated]
 
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class AiSecurityConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'ai_security'
+
+    def ready(self):
+        import ai_security.signals  # noqa: F401
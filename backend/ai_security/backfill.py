@@ -0,0 +1,185 @@
+"""
+Historical feature backfill.
+
+Replays ActivityLog, LoginAttempt, DocumentAccessLog and PasswordResetToken
+history through the feature-store accumulator and produces one FEATURE_NAMES
+vector per (user, sliding window). Results are written as compressed .npz
+shards (one per replayed day and window width) that training loads instead of
+recomputing them. Each shard records its window width: counts over a 1-hour
+window are on a different scale than over 24 hours, so training only merges
+shards as wide as its own window.
+"""
+import glob
+import logging
+import os
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+
+from .feature_store import NULL_IP, accumulate, merge_buckets
+from .features import FEATURE_NAMES
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+SLAB_SECONDS = 24 * 3600
+SHARD_PATTERN = 'features_*.npz'
+
+
+def history_events(start, end):
+    """Yield feature-store events for everything recorded in [start, end).
+
+    Each source is streamed with .iterator(), which uses a server-side cursor
+    on PostgreSQL, so memory stays bounded regardless of the history size.
+    """
+    from accounts.models import LoginAttempt, PasswordResetToken
+    from documents.models import DocumentAccessLog
+    from .models import ActivityLog
+
+    period = {'created_at__gte': start, 'created_at__lt': end}
+    logs = ActivityLog.objects.filter(user__isnull=False, **period).order_by().values_list(
+        'user_id', 'created_at', 'request_path', 'request_method', 'response_status', 'ip_address',
+    )
+    for user_id, created_at, path, method, status, ip in logs.iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            'kind': 'request', 'user_id': user_id, 'ts': created_at.timestamp(),
+            'path': path or '', 'method': method or '', 'status': status or 0, 'ip': ip or NULL_IP,
+        }
+
+    failures = LoginAttempt.objects.filter(
+        user__isnull=False, success=False, **period,
+    ).order_by().values_list('user_id', 'created_at')
+    for user_id, created_at in failures.iterator(chunk_size=CHUNK_SIZE):
+        yield {'kind': 'login_failure', 'user_id': user_id, 'ts': created_at.timestamp()}
+
+    accesses = DocumentAccessLog.objects.filter(user__isnull=False, **period).order_by().values_list(
+        'user_id', 'created_at', 'action', 'document_id', 'document__security_level',
+    )
+    for user_id, created_at, action, document_id, level in accesses.iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            'kind': 'document_access', 'user_id': user_id, 'ts': created_at.timestamp(),
+            'action': action, 'document_id': document_id, 'security_level': level,
+        }
+
+    resets = PasswordResetToken.objects.filter(
+        confirmed_at__isnull=False, **period,
+    ).order_by().values_list('user_id', 'created_at', 'confirmed_at')
+    for user_id, created_at, confirmed_at in resets.iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            'kind': 'password_reset', 'user_id': user_id, 'ts': created_at.timestamp(),
+            'delay_min': (confirmed_at - created_at).total_seconds() / 60.0,
+        }
+
+
+def window_vector(buckets, hour_of_day):
+    """Build the feature vector of one window from its accumulated buckets."""
+    counter_hashes, download_hashes, spans = [], [], []
+    endpoints, ips = set(), set()
+    for b in buckets:
+        counters = dict(b['counters'])
+        if b['reset'] is not None:
+            counters['reset_at'], counters['reset_delay'] = b['reset']
+        counter_hashes.append(counters)
+        download_hashes.append(b['downloads'])
+        if b['first'] is not None:
+            spans.append([('first', b['first']), ('last', b['last'])])
+        endpoints |= b['endpoints']
+        ips |= b['ips']
+    return merge_buckets(counter_hashes, download_hashes, spans, len(endpoints), len(ips), hour_of_day)
+
+
+def iter_windows(start, end, window_seconds=3600, step_seconds=3600):
+    """Replay history and yield ``(day, user_ids, window_ends, matrix)`` once per day.
+
+    Windows are ``window_seconds`` wide and end on every ``step_seconds``
+    boundary after ``start`` up to ``end``; ``window_ends`` holds their end as
+    epoch seconds. Only windows with at least one event for the user produce
+    a row.
+    """
+    if window_seconds % step_seconds:
+        raise ValueError('window_seconds must be a multiple of step_seconds')
+    span = window_seconds // step_seconds
+    slab = max(step_seconds, SLAB_SECONDS // step_seconds * step_seconds)
+    first = int(start.timestamp()) // step_seconds
+    last = -(-int(end.timestamp()) // step_seconds)  # ceil
+    pending = {}  # user_id -> {bucket index: bucket}
+
+    # The first windows also need the buckets before ``start``
+    lo = first - span + 1
+    while lo < last:
+        # Slabs end on day boundaries so re-runs produce the same shards
+        per_slab = slab // step_seconds
+        hi = min(last - 1, (max(first, lo) // per_slab + 1) * per_slab - 1)
+        acc = accumulate(history_events(
+            datetime.fromtimestamp(lo * step_seconds, tz=dt_timezone.utc),
+            datetime.fromtimestamp((hi + 1) * step_seconds, tz=dt_timezone.utc),
+        ), width=step_seconds)
+        for (user_id, index), b in acc.items():
+            pending.setdefault(user_id, {})[index] = b
+
+        emit_lo = max(first, lo)
+        user_ids, window_ends, rows = [], [], []
+        for user_id, buckets in pending.items():
+            ends = sorted({
+                index + offset for index in buckets for offset in range(span)
+                if emit_lo <= index + offset <= hi
+            })
+            for k in ends:
+                window = [buckets[i] for i in range(k - span + 1, k + 1) if i in buckets]
+                end_ts = (k + 1) * step_seconds
+                hour = datetime.fromtimestamp(end_ts, tz=dt_timezone.utc).hour
+                user_ids.append(user_id)
+                window_ends.append(end_ts)
+                rows.append(window_vector(window, hour))
+
+        # Keep only the buckets that later windows still overlap
+        keep_from = hi - span + 2
+        for user_id in list(pending):
+            pending[user_id] = {i: b for i, b in pending[user_id].items() if i >= keep_from}
+            if not pending[user_id]:
+                del pending[user_id]
+
+        matrix = np.array(rows, dtype=np.float32).reshape(len(rows), len(FEATURE_NAMES))
+        day = datetime.fromtimestamp(emit_lo * step_seconds, tz=dt_timezone.utc)
+        yield day, user_ids, np.array(window_ends, dtype=np.int64), matrix
+        lo = hi + 1
+
+
+def write_shard(directory, name, user_ids, window_ends, matrix, window_seconds):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'features_{name}.npz')
+    np.savez_compressed(
+        path,
+        features=matrix,
+        user_ids=np.array([str(u) for u in user_ids], dtype='U36'),
+        window_ends=window_ends,
+        window_seconds=np.int64(window_seconds),
+        feature_names=np.array(FEATURE_NAMES),
+    )
+    return path
+
+
+def iter_dataset(directory, window_seconds=None):
+    """Yield the feature matrix of each shard in ``directory``, one shard in memory at a time.
+
+    With ``window_seconds``, shards of another window width, and shards
+    written before widths were recorded, are skipped.
+    """
+    for path in sorted(glob.glob(os.path.join(directory, SHARD_PATTERN))):
+        with np.load(path) as shard:
+            if list(shard['feature_names']) != FEATURE_NAMES:
+                logger.warning('Skipping %s: feature layout does not match FEATURE_NAMES', path)
+                continue
+            width = int(shard['window_seconds']) if 'window_seconds' in shard.files else None
+            if window_seconds is not None and width != window_seconds:
+                logger.warning('Skipping %s: %s-second windows, expected %s', path, width, window_seconds)
+                continue
+            yield shard['features']
+
+
+def load_dataset(directory, window_seconds=None):
+    """Load and concatenate the feature matrices of the shards in ``directory``."""
+    matrices = list(iter_dataset(directory, window_seconds))
+    if not matrices:
+        return np.empty((0, len(FEATURE_NAMES)), dtype=np.float32)
+    return np.concatenate(matrices)
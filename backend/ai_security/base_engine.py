@@ -0,0 +1,142 @@
+"""Scoring interface shared by the Isolation Forest and streaming detectors."""
+import logging
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from .features import FEATURE_NAMES
+
+logger = logging.getLogger(__name__)
+
+
+class BaseAnomalyEngine(ABC):
+    """Scoring interface shared by the anomaly detectors.
+
+    Subclasses implement ``is_trained`` and predict_batch(), which returns
+    decision scores (lower = more anomalous, negative = anomaly); the
+    normalized scores, explanations and evaluation derive from it. Engines
+    missing either cannot be instantiated.
+    """
+
+    @property
+    @abstractmethod
+    def is_trained(self):
+        """True once the engine can score."""
+
+    @abstractmethod
+    def predict_batch(self, feature_matrix):
+        """Decision scores for every row of ``feature_matrix``."""
+
+    def predict(self, features_vector):
+        """Return anomaly score for a single feature vector. Lower = more anomalous."""
+        features_vector = list(features_vector)
+        if len(features_vector) != len(FEATURE_NAMES):
+            raise ValueError(
+                f'Feature dimension mismatch: expected {len(FEATURE_NAMES)}, got {len(features_vector)}'
+            )
+        return float(self.predict_batch([features_vector])[0])
+
+    def predict_normalized(self, features_vector):
+        """Return normalized anomaly score (0-1, higher = more anomalous)."""
+        raw_score = self.predict(features_vector)
+        # Decision scores: negative = anomaly, positive = normal
+        # Normalize using offset_score for more stable bounds
+        normalized = max(0.0, min(1.0, 0.5 - raw_score / 2.0))
+        return round(normalized, 6)
+
+    def predict_normalized_batch(self, feature_matrix):
+        """Vectorized predict_normalized() for every row of a matrix."""
+        raw_scores = self.predict_batch(feature_matrix)
+        return np.round(np.clip(0.5 - raw_scores / 2.0, 0.0, 1.0), 6)
+
+    def is_anomaly(self, features_vector, threshold=-0.5):
+        """Return True if feature vector is an anomaly."""
+        score = self.predict(features_vector)
+        return score < threshold
+
+    def explain_features(self, features_vector, method='perturbation'):
+        """Return feature importance explanation."""
+        return self.explain_batch([features_vector], method=method)[0]
+
+    def explain_batch(self, feature_matrix, method='perturbation'):
+        """Explain every row of a matrix; returns one explanation dict per row.
+
+        ``perturbation``: score change when a feature is zeroed. All perturbed
+        rows are stacked and scored in a single call. Engines may support
+        further methods (see IsolationForestEngine).
+        """
+        if not self.is_trained:
+            raise ValueError('Model not trained.')
+
+        X = np.asarray(feature_matrix, dtype=np.float64)
+        contributions = self._contributions(X, method)
+
+        return [
+            {
+                name: {'contribution': round(float(contrib[i]), 4), 'value': row[i]}
+                for i, name in enumerate(FEATURE_NAMES)
+            }
+            for row, contrib in zip(X.tolist(), contributions)
+        ]
+
+    def _contributions(self, X, method):
+        if method == 'perturbation':
+            return self._perturbation_contributions(X)
+        raise ValueError(f'Unknown explanation method: {method}')
+
+    def _perturbation_contributions(self, X):
+        n, n_features = X.shape
+        perturbed = np.repeat(X[:, np.newaxis, :], n_features, axis=1)
+        diagonal = np.arange(n_features)
+        perturbed[:, diagonal, diagonal] = 0.0
+        scores = self.predict_batch(np.vstack([X, perturbed.reshape(-1, n_features)]))
+        base, modified = scores[:n], scores[n:].reshape(n, n_features)
+        return base[:, np.newaxis] - modified
+
+    def evaluate(self, feature_matrix, y_true=None):
+        """Evaluate model on given data. Returns precision, recall, F1 metrics.
+
+        If y_true is provided, computes real supervised metrics.
+        Otherwise, falls back to unsupervised statistics.
+        """
+        if not self.is_trained:
+            return {}
+
+        try:
+            from sklearn.metrics import precision_score, recall_score, f1_score
+
+            scores = self.predict_batch(feature_matrix)
+            # Same rule as IsolationForest.predict, without scoring twice
+            predictions = np.where(scores < 0, -1, 1)
+
+            # IsolationForest: -1 = anomaly, 1 = normal → convert to 0/1
+            y_pred = (predictions == -1).astype(int)
+
+            n_anomalies = int(y_pred.sum())
+            n_total = len(predictions)
+            anomaly_rate = n_anomalies / n_total if n_total > 0 else 0
+            avg_score = float(scores.mean())
+            std_score = float(scores.std())
+
+            result = {
+                'total_samples': n_total,
+                'detected_anomalies': n_anomalies,
+                'anomaly_rate': round(anomaly_rate, 4),
+                'avg_score': round(avg_score, 4),
+                'std_score': round(std_score, 4),
+            }
+
+            if y_true is not None:
+                y_true = np.array(y_true)
+                result['precision'] = round(float(precision_score(y_true, y_pred, zero_division=0)), 4)
+                result['recall'] = round(float(recall_score(y_true, y_pred, zero_division=0)), 4)
+                result['f1'] = round(float(f1_score(y_true, y_pred, zero_division=0)), 4)
+            else:
+                result['precision'] = None
+                result['recall'] = None
+                result['f1'] = None
+
+            return result
+        except Exception as e:
+            logger.error('Model evaluation failed: %s', e)
+            return {}
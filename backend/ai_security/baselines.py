@@ -0,0 +1,151 @@
+"""
+Per-user behavioural baselines.
+
+The Isolation Forest compares each user with the whole population; a
+baseline compares the user with their own history. Every user has an
+exponentially weighted mean and variance per feature, stored as one float32
+row (UserBaseline.vector) and updated in constant time, at most once per
+UPDATE_INTERVAL_MINUTES since consecutive scans see overlapping windows:
+
+    mean' = mean + alpha * d
+    var'  = (1 - alpha) * (var + alpha * d * d),  d = x - mean
+
+Scans measure each vector against the baseline before updating it. The
+largest per-feature z-score becomes a 0..1 deviation score, and it is
+blended into the forest score once the baseline has seen MIN_OBSERVATIONS
+vectors. One query loads the baselines of a scan batch and one upsert
+writes them back.
+"""
+import logging
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .features import FEATURE_NAMES
+
+logger = logging.getLogger(__name__)
+
+N_FEATURES = len(FEATURE_NAMES)
+# Smallest standard deviation per feature, so steady users are not flagged for noise
+MIN_STD = np.array([
+    {'error_rate': 0.05, 'hour_of_day': 2.0}.get(name, 1.0) for name in FEATURE_NAMES
+], dtype=np.float32)
+
+
+def _config():
+    return getattr(settings, 'AI_SECURITY', {}).get('BASELINES', {})
+
+
+def is_enabled():
+    return bool(_config().get('ENABLED', False))
+
+
+def pack(mean, var):
+    return np.concatenate([mean, var]).astype(np.float32).tobytes()
+
+
+def unpack(data):
+    row = np.frombuffer(bytes(data), dtype=np.float32)
+    return row[:N_FEATURES], row[N_FEATURES:]
+
+
+def load(user_ids, updated_before=None):
+    """Baselines of ``user_ids`` as (means, variances, observations, due) arrays.
+
+    Users without a baseline get zeros. ``due`` marks the baselines last
+    updated before ``updated_before`` (or never).
+    """
+    from .models import UserBaseline
+
+    index = {str(user_id): i for i, user_id in enumerate(user_ids)}
+    mean = np.zeros((len(user_ids), N_FEATURES), dtype=np.float32)
+    var = np.zeros((len(user_ids), N_FEATURES), dtype=np.float32)
+    observations = np.zeros(len(user_ids), dtype=np.int64)
+    due = np.ones(len(user_ids), dtype=bool)
+    rows = UserBaseline.objects.filter(user_id__in=list(user_ids)).values_list(
+        'user_id', 'vector', 'observations', 'updated_at',
+    )
+    for user_id, vector, count, updated_at in rows:
+        i = index[str(user_id)]
+        mean[i], var[i] = unpack(vector)
+        observations[i] = count
+        due[i] = updated_before is None or updated_at < updated_before
+    return mean, var, observations, due
+
+
+def deviation(X, mean, var, observations):
+    """Per-row (score, max |z|, index of that feature) against the baselines. Pure function.
+
+    Rows whose baseline has fewer than MIN_OBSERVATIONS vectors score 0.
+    """
+    config = _config()
+    X = np.asarray(X, dtype=np.float32)
+    z = np.abs(X - mean) / np.maximum(np.sqrt(var), MIN_STD)
+    worst = z.argmax(axis=1)
+    max_z = z[np.arange(len(X)), worst]
+    # No score below Z_FREE, approaching 1 as |z| grows past it
+    score = 1.0 - np.exp(-np.maximum(max_z - config.get('Z_FREE', 2.0), 0.0) / config.get('Z_SCALE', 3.0))
+    score[observations < config.get('MIN_OBSERVATIONS', 8)] = 0.0
+    return score, max_z, worst
+
+
+def update(X, mean, var, observations):
+    """Fold one vector per row into the baselines. Pure function."""
+    alpha = _config().get('ALPHA', 0.05)
+    X = np.asarray(X, dtype=np.float32)
+    d = X - mean
+    new_mean = mean + alpha * d
+    new_var = (1 - alpha) * (var + alpha * d * d)
+    # A user's first vector starts the baseline
+    first = observations == 0
+    new_mean[first] = X[first]
+    new_var[first] = 0.0
+    return new_mean, new_var, observations + 1
+
+
+def observe(user_ids, X, forest_scores):
+    """Blend baseline deviation into ``forest_scores`` and update the baselines of ``user_ids``.
+
+    Returns the blended scores and one ``{score, max_z, feature}`` dict per
+    row (None while the baseline is warming up). Rows at or above
+    SKIP_UPDATE_ABOVE keep their baseline unchanged, so an ongoing attack is
+    not learned as normal behaviour.
+    """
+    from .models import UserBaseline
+
+    config = _config()
+    forest_scores = np.asarray(forest_scores, dtype=np.float64)
+    if not len(user_ids):
+        return forest_scores, []
+
+    now = timezone.now()
+    mean, var, observations, due = load(
+        user_ids, updated_before=now - timedelta(minutes=config.get('UPDATE_INTERVAL_MINUTES', 60)),
+    )
+    score, max_z, worst = deviation(X, mean, var, observations)
+    warm = observations >= config.get('MIN_OBSERVATIONS', 8)
+    weight = config.get('WEIGHT', 0.3)
+    blended = np.where(warm, (1 - weight) * forest_scores + weight * score, forest_scores)
+    details = [
+        {'score': round(float(score[i]), 4), 'max_z': round(float(max_z[i]), 2), 'feature': FEATURE_NAMES[worst[i]]}
+        if warm[i] else None
+        for i in range(len(user_ids))
+    ]
+
+    learn = due & (blended < config.get('SKIP_UPDATE_ABOVE', 0.7))
+    new_mean, new_var, new_observations = update(X, mean, var, observations)
+    UserBaseline.objects.bulk_create(
+        [
+            UserBaseline(
+                user_id=user_ids[i], vector=pack(new_mean[i], new_var[i]),
+                observations=int(new_observations[i]), updated_at=now,
+            )
+            for i in np.flatnonzero(learn).tolist()
+        ],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['vector', 'observations', 'updated_at'],
+    )
+    return np.round(blended, 6), details
@@ -0,0 +1,272 @@
+"""
+Feature-distribution drift between the training data and scanned traffic.
+
+Each model version gets a reference: per-feature quantile cut points, the
+share of rows falling in each bin, and mean/std. The reference is built from
+the same kind of vectors scans score (1-hour windows, replayed for every hour
+of the last day), not from the 24-hour training vectors, whose counts are on
+a different scale; observations from another window width are never
+compared with it. Replaying a day of history is slow on large tenants, so
+the build_drift_reference task does it after training or promotion and
+stores the result on the active config (``parameters['drift_reference']``).
+Bundles saved before then may carry their own reference. Every scan
+batch folds its vectors into running statistics on the active
+AIModelConfig: Welford mean/variance, merged across batches with Chan's
+formula, and per-bin counts over the reference cut points, a quantile
+sketch that merges by addition. PSI and KS per feature follow directly from
+the bin counts. Old observations are halved away once the window is full,
+so the statistics track recent traffic.
+
+retrain_reason() turns this into the retraining decision used by the
+retrain_if_needed task: retrain on drift, or when the model is too old.
+"""
+import logging
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .features import FEATURE_NAMES
+
+logger = logging.getLogger(__name__)
+
+BINS = 10
+# Bin shares are clipped to this before taking logarithms
+PSI_EPSILON = 1e-4
+
+
+def _config():
+    return getattr(settings, 'AI_SECURITY', {}).get('DRIFT', {})
+
+
+def is_enabled():
+    return bool(_config().get('ENABLED', True))
+
+
+def reference_from(feature_matrix, window_hours):
+    """Reference distribution of ``window_hours``-wide feature vectors."""
+    X = np.asarray(feature_matrix, dtype=np.float64)
+    cuts = []
+    proportions = []
+    for column in X.T:
+        # Count features are mostly zero, so many quantiles coincide
+        column_cuts = np.unique(np.quantile(column, np.linspace(0, 1, BINS + 1)[1:-1]))
+        cuts.append(column_cuts.tolist())
+        proportions.append((_bin_counts(column_cuts, column) / len(column)).tolist())
+    return {
+        'window_hours': window_hours,
+        'samples': len(X),
+        'cuts': cuts,
+        'proportions': proportions,
+        'mean': X.mean(axis=0).tolist(),
+        'std': X.std(axis=0).tolist(),
+    }
+
+
+def scan_reference(window_hours=1, days=1, now=None):
+    """Reference from ``window_hours`` windows ending on every hour of the last ``days``.
+
+    Windows are replayed from history (see backfill.iter_windows), so they
+    cover the whole day like the scans do. Returns None without activity.
+    """
+    from .backfill import iter_windows
+
+    end = now or timezone.now()
+    matrices = [
+        matrix for _, _, _, matrix in iter_windows(
+            end - timedelta(days=days), end, window_seconds=window_hours * 3600, step_seconds=3600,
+        )
+    ]
+    X = np.concatenate(matrices) if matrices else np.empty((0, len(FEATURE_NAMES)))
+    X = X[X.any(axis=1)]
+    return reference_from(X, window_hours) if len(X) else None
+
+
+def _bin_counts(cuts, column):
+    return np.bincount(np.searchsorted(cuts, column, side='right'), minlength=len(cuts) + 1)
+
+
+def batch_stats(reference, feature_matrix):
+    """Running statistics of one batch of vectors, in the form merge() combines."""
+    X = np.asarray(feature_matrix, dtype=np.float64)
+    mean = X.mean(axis=0)
+    return {
+        'n': float(len(X)),
+        'mean': mean.tolist(),
+        'm2': ((X - mean) ** 2).sum(axis=0).tolist(),
+        'counts': [_bin_counts(np.asarray(cuts), column).tolist() for cuts, column in zip(reference['cuts'], X.T)],
+    }
+
+
+def merge(a, b):
+    """Combine two sets of running statistics (Chan et al.'s parallel variance)."""
+    if not a or not a['n']:
+        return b
+    n = a['n'] + b['n']
+    mean_a, mean_b = np.asarray(a['mean']), np.asarray(b['mean'])
+    delta = mean_b - mean_a
+    return {
+        'n': n,
+        'mean': (mean_a + delta * b['n'] / n).tolist(),
+        'm2': (np.asarray(a['m2']) + np.asarray(b['m2']) + delta ** 2 * a['n'] * b['n'] / n).tolist(),
+        'counts': [(np.asarray(x) + np.asarray(y)).tolist() for x, y in zip(a['counts'], b['counts'])],
+    }
+
+
+def decay(stats, factor):
+    """Down-weight ``stats`` by ``factor``; the mean is unchanged."""
+    return {
+        'n': stats['n'] * factor,
+        'mean': stats['mean'],
+        'm2': [value * factor for value in stats['m2']],
+        'counts': [[count * factor for count in counts] for counts in stats['counts']],
+    }
+
+
+def psi(expected, actual):
+    """Population stability index between two bin-share vectors."""
+    expected = np.clip(np.asarray(expected, dtype=np.float64), PSI_EPSILON, None)
+    actual = np.clip(np.asarray(actual, dtype=np.float64), PSI_EPSILON, None)
+    return float(((actual - expected) * np.log(actual / expected)).sum())
+
+
+def ks(expected, actual):
+    """Kolmogorov-Smirnov distance between two binned distributions, evaluated at the cut points."""
+    return float(np.abs(np.cumsum(actual) - np.cumsum(expected)).max())
+
+
+def measure(reference, stats):
+    """Per-feature drift of ``stats`` against ``reference`` and whether it exceeds the thresholds."""
+    config = _config()
+    features = {}
+    for i, name in enumerate(FEATURE_NAMES):
+        counts = np.asarray(stats['counts'][i], dtype=np.float64)
+        actual = counts / counts.sum() if counts.sum() else counts
+        features[name] = {
+            'psi': round(psi(reference['proportions'][i], actual), 4),
+            'ks': round(ks(reference['proportions'][i], actual), 4),
+            'mean': round(stats['mean'][i], 4),
+            'std': round(float(np.sqrt(stats['m2'][i] / stats['n'])) if stats['n'] else 0.0, 4),
+            'reference_mean': round(reference['mean'][i], 4),
+            'reference_std': round(reference['std'][i], 4),
+        }
+    max_psi = max(f['psi'] for f in features.values())
+    max_ks = max(f['ks'] for f in features.values())
+    drifted = stats['n'] >= config.get('MIN_SAMPLES', 500) and (
+        max_psi > config.get('PSI_THRESHOLD', 0.2) or max_ks > config.get('KS_THRESHOLD', 0.15)
+    )
+    return {'max_psi': max_psi, 'max_ks': max_ks, 'drifted': bool(drifted), 'features': features}
+
+
+def schedule_reference(version):
+    """Queue build_drift_reference for model ``version`` once the current transaction commits."""
+    if not is_enabled():
+        return
+    from django.db import transaction
+    from .tasks import build_drift_reference
+
+    def queue():
+        # The model is already active; a broker outage only delays drift tracking
+        try:
+            build_drift_reference.delay(version)
+        except Exception as e:
+            logger.warning('Drift reference for model %s not queued: %s', version, e)
+
+    transaction.on_commit(queue)
+
+
+def store_reference(version, reference):
+    """Store ``reference`` for model ``version`` on the active config; False if another model is active."""
+    from django.db import transaction
+    from .models import AIModelConfig
+
+    with transaction.atomic():
+        config = AIModelConfig.objects.select_for_update().filter(
+            model_type='isolation_forest', is_active=True,
+        ).first()
+        if config is None or config.parameters.get('version') != version:
+            return False
+        config.parameters['drift_reference'] = {**reference, 'model_version': version}
+        config.save(update_fields=['parameters', 'updated_at'])
+    return True
+
+
+def _reference(engine, config):
+    record = config.parameters.get('drift_reference')
+    if record and record.get('model_version') == engine.version:
+        return record
+    # Bundles saved before references were built separately carry their own
+    return getattr(engine, 'reference', None)
+
+
+def observe(engine, feature_matrix, window_hours):
+    """Fold scanned ``window_hours`` vectors into the drift statistics of the active Isolation Forest config.
+
+    Models without a reference yet (still being built, or the streaming
+    detector) and references of another window width are skipped.
+    Statistics restart whenever the active model version changes.
+    """
+    if not len(feature_matrix) or getattr(engine, 'version', None) is None:
+        return None
+
+    from django.db import transaction
+    from .models import AIModelConfig
+
+    window = _config().get('WINDOW_SIZE', 20000)
+    with transaction.atomic():
+        config = AIModelConfig.objects.select_for_update().filter(
+            model_type='isolation_forest', is_active=True,
+        ).first()
+        if config is None:
+            return None
+        reference = _reference(engine, config)
+        if not reference:
+            return None
+        if reference.get('window_hours') != window_hours:
+            logger.debug('Drift reference covers %s-hour windows, not %s; skipping.',
+                         reference.get('window_hours'), window_hours)
+            return None
+        batch = batch_stats(reference, feature_matrix)
+        record = config.parameters.get('drift') or {}
+        stats = record.get('stats') if record.get('model_version') == engine.version else None
+        if stats and stats['n'] + batch['n'] > window:
+            stats = decay(stats, 0.5)
+        stats = merge(stats, batch)
+        config.parameters['drift'] = {
+            'model_version': engine.version,
+            'updated_at': timezone.now().isoformat(),
+            'samples': round(stats['n'], 1),
+            **measure(reference, stats),
+            'stats': stats,
+        }
+        config.save(update_fields=['parameters', 'updated_at'])
+    return config.parameters['drift']
+
+
+def summary(config):
+    """Drift record of ``config`` without the raw statistics, for the model status API."""
+    record = (config.parameters or {}).get('drift')
+    if not record:
+        return None
+    return {key: value for key, value in record.items() if key != 'stats'}
+
+
+def retrain_reason(config, now=None):
+    """Why the model should be retrained now ('no_model', 'max_age', 'drift'), or None.
+
+    The age is counted from the later of training and promotion.
+    """
+    if config is None or not config.last_trained_at:
+        return 'no_model'
+    now = now or timezone.now()
+    # A promoted (or rolled back) model counts as fresh from its promotion on
+    promoted_at = parse_datetime((config.parameters or {}).get('promoted_at') or '')
+    age_from = max(config.last_trained_at, promoted_at) if promoted_at else config.last_trained_at
+    if now - age_from >= timedelta(hours=_config().get('MAX_AGE_HOURS', 24 * 7)):
+        return 'max_age'
+    record = (config.parameters or {}).get('drift') or {}
+    if record.get('drifted') and record.get('model_version') == config.parameters.get('version'):
+        return 'drift'
+    return None
@@ -8,28 +8,108 @@ from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 
 from django.conf import settings
+from django.utils import timezone
 
+from .base_engine import BaseAnomalyEngine
 from .features import FEATURE_NAMES
+from .scorer import CompiledForest
+from .training import as_float32, reservoir_sample
 
 logger = logging.getLogger(__name__)
 
 MODEL_DIR = os.path.join(settings.BASE_DIR, 'ml_models')
 MAX_MODEL_VERSIONS = 5
+# Larger batches are scored by sklearn, whose tree traversal is faster at scale
+COMPILED_MAX_BATCH = 128
+# Text file naming the bundle that load() uses by default
+LATEST_POINTER = 'LATEST'
+BUNDLE_FORMAT = 1
+# Private per-tree state of sklearn's IsolationForest (1.5) that _grow() trims with estimators_.
+# _seeds is left alone: a warm-start fit already replaces it with the new trees' seeds only.
+_TRIMMED_ATTRIBUTES = ('_average_path_length_per_tree', '_decision_path_lengths')
+
+
+def latest_path():
+    """Path of the bundle the LATEST pointer refers to.
+
+    Falls back to the unversioned isolation_forest.joblib written before
+    bundles existed.
+    """
+    try:
+        with open(os.path.join(MODEL_DIR, LATEST_POINTER)) as f:
+            target = f.read().strip()
+    except OSError:
+        target = ''
+    # Bundles inside MODEL_DIR are stored by name, anything else by absolute path
+    return os.path.join(MODEL_DIR, target or 'isolation_forest.joblib')
+
+
+def atomic_write(path, write):
+    """Call ``write(tmp_path)`` and rename the result over ``path``."""
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _set_latest(filepath):
+    directory, name = os.path.split(os.path.abspath(filepath))
+    target = name if directory == os.path.abspath(MODEL_DIR) else os.path.abspath(filepath)
+
+    def write(tmp_path):
+        with open(tmp_path, 'w') as f:
+            f.write(target + '\n')
+    atomic_write(os.path.join(MODEL_DIR, LATEST_POINTER), write)
+
+
+def _known_per_tree_state(model):
+    """True if the per-tree state of ``model`` is exactly what _grow() trims."""
+    per_tree = {
+        name for name, value in vars(model).items()
+        if isinstance(value, (list, tuple, np.ndarray)) and len(value) == len(model.estimators_)
+    } - {'_seeds'}
+    if per_tree == {'estimators_', 'estimators_features_', *_TRIMMED_ATTRIBUTES}:
+        return True
+    logger.warning('Unexpected IsolationForest per-tree state %s; refitting instead.', sorted(per_tree))
+    return False
 
 
-class IsolationForestEngine:
+class IsolationForestEngine(BaseAnomalyEngine):
 
-    def __init__(self, contamination=0.05, n_estimators=200, max_samples=256, random_state=42):
+    def __init__(self, contamination=0.05, n_estimators=200, max_samples=256, random_state=42,
+                 n_jobs=-1, max_training_samples=None, warm_start_trees=50):
         self.contamination = contamination
         self.n_estimators = n_estimators
         self.max_samples = max_samples
         self.random_state = random_state
+        self.n_jobs = n_jobs
+        # Larger training sets are reservoir-sampled down to this many rows
+        self.max_training_samples = max_training_samples
+        self.warm_start_trees = warm_start_trees
         self.model = None
         self.scaler = None
-
-    def train(self, feature_matrix):
-        """Train Isolation Forest on feature matrix (numpy array or list of lists)."""
-        X = np.array(feature_matrix)
+        self.compiled = None
+        # Drift reference bundled by older models; newer ones keep it on the config (drift.store_reference)
+        self.reference = None
+        self.version = None
+        self.metrics = {}
+
+    @property
+    def is_trained(self):
+        return self.model is not None
+
+    def train(self, feature_matrix, warm_start=False):
+        """Train Isolation Forest on feature matrix (array, memmap or list of lists).
+
+        Rows are used as float32, so float32 arrays and memory-mapped datasets
+        are not copied. Trees are fitted on all cores (``n_jobs``). With
+        ``warm_start`` an already trained forest is grown instead, see _grow().
+        """
+        X = as_float32(feature_matrix)
         if len(X) < 10:
             logger.warning('Not enough training samples (%d). Skipping.', len(X))
             return False
@@ -39,6 +119,14 @@ class IsolationForestEngine:
                 f'Feature dimension mismatch: expected {len(FEATURE_NAMES)}, got {X.shape[1]}'
             )
 
+        if self.max_training_samples and len(X) > self.max_training_samples:
+            X = reservoir_sample([X], self.max_training_samples, random_state=self.random_state)
+
+        if warm_start and self.model is not None:
+            grown = self._grow(X)
+            if grown is not None:
+                return grown
+
         self.scaler = StandardScaler()
         X_scaled = self.scaler.fit_transform(X)
 
@@ -47,165 +135,235 @@ class IsolationForestEngine:
             n_estimators=self.n_estimators,
             max_samples=min(self.max_samples, len(X)),
             random_state=self.random_state,
+            n_jobs=self.n_jobs,
         )
         self.model.fit(X_scaled)
+        self.compiled = None
+        self._path_weights_cache = None
         logger.info('Isolation Forest trained on %d samples.', len(X))
         return True
 
-    def predict(self, features_vector):
-        """Return anomaly score for a single feature vector. Lower = more anomalous."""
+    def _grow(self, X):
+        """Fit ``warm_start_trees`` new trees on X and retire as many of the oldest.
+
+        The forest keeps ``n_estimators`` trees, so it slides over the windows
+        it is grown on. The scaler stays as fitted, since the existing trees
+        split in its space; offset_ is recomputed on X. Retiring trees edits
+        IsolationForest's private per-tree state (_TRIMMED_ATTRIBUTES); if
+        that state is not what this code knows, returns None and train()
+        refits instead.
+        """
+        model = self.model
+        if not _known_per_tree_state(model):
+            return None
+        if len(X) < model.max_samples_:
+            logger.warning(
+                'Window of %d samples is smaller than max_samples (%d). Skipping.', len(X), model.max_samples_,
+            )
+            return False
+
+        X_scaled = self.scaler.transform(X) if self.scaler is not None else X
+        model.set_params(
+            warm_start=True,
+            n_estimators=len(model.estimators_) + self.warm_start_trees,
+            max_samples=model.max_samples_,
+            n_jobs=self.n_jobs,
+        )
+        model.fit(X_scaled)
+        if not _known_per_tree_state(model):
+            return None
+
+        excess = len(model.estimators_) - self.n_estimators
+        if excess > 0:
+            model.estimators_ = model.estimators_[excess:]
+            model.estimators_features_ = model.estimators_features_[excess:]
+            for name in _TRIMMED_ATTRIBUTES:
+                setattr(model, name, getattr(model, name)[excess:])
+            model.set_params(n_estimators=len(model.estimators_))
+            model.offset_ = np.percentile(model.score_samples(X_scaled), 100.0 * self.contamination)
+
+        self.compiled = None
+        self._path_weights_cache = None
+        logger.info('Isolation Forest grown by %d trees on %d samples.', self.warm_start_trees, len(X))
+        return True
+
+    def predict_batch(self, feature_matrix):
+        """Return anomaly scores for every row of an (n x features) matrix in one call."""
         if self.model is None:
             raise ValueError('Model not trained. Call train() or load() first.')
 
-        features_vector = list(features_vector)
-        if len(features_vector) != len(FEATURE_NAMES):
+        X = np.asarray(feature_matrix, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != len(FEATURE_NAMES):
             raise ValueError(
-                f'Feature dimension mismatch: expected {len(FEATURE_NAMES)}, got {len(features_vector)}'
+                f'Feature dimension mismatch: expected (n, {len(FEATURE_NAMES)}), got {X.shape}'
             )
-
-        X = np.array([features_vector])
+        if not len(X):
+            return np.empty(0, dtype=np.float64)
+        if self.compiled is not None and len(X) <= COMPILED_MAX_BATCH:
+            return self.compiled.decision_function(X)
         if self.scaler is not None:
             X = self.scaler.transform(X)
-        score = self.model.decision_function(X)[0]
-        return float(score)
-
-    def predict_normalized(self, features_vector):
-        """Return normalized anomaly score (0-1, higher = more anomalous)."""
-        raw_score = self.predict(features_vector)
-        # IF decision_function: negative = anomaly, positive = normal
-        # Normalize using offset_score for more stable bounds
-        normalized = max(0.0, min(1.0, 0.5 - raw_score / 2.0))
-        return round(normalized, 6)
-
-    def is_anomaly(self, features_vector, threshold=-0.5):
-        """Return True if feature vector is an anomaly."""
-        score = self.predict(features_vector)
-        return score < threshold
-
-    def explain_features(self, features_vector):
-        """Return feature importance explanation."""
-        if self.model is None:
-            raise ValueError('Model not trained.')
-
-        explanations = {}
-        base_score = self.predict(features_vector)
-
-        for i, name in enumerate(FEATURE_NAMES):
-            modified = list(features_vector)
-            modified[i] = 0.0
-            modified_score = self.predict(modified)
-            explanations[name] = {
-                'contribution': round(float(base_score - modified_score), 4),
-                'value': features_vector[i],
-            }
-
-        return explanations
-
-    def evaluate(self, feature_matrix, y_true=None):
-        """Evaluate model on given data. Returns precision, recall, F1 metrics.
-
-        If y_true is provided, computes real supervised metrics.
-        Otherwise, falls back to unsupervised statistics.
+        return self.model.decision_function(X)
+
+    def _contributions(self, X, method):
+        # ``path``: share of each feature in isolating the row, taken from the
+        # training samples each split on its tree paths cut away. Needs no
+        # extra scoring.
+        if method == 'path':
+            return self._path_contributions(X)
+        return super()._contributions(X, method)
+
+    def _path_contributions(self, X):
+        n_features = X.shape[1]
+        X_scaled = self.scaler.transform(X) if self.scaler is not None else X
+        X_scaled = np.asarray(X_scaled, dtype=np.float32)
+        totals = np.zeros((len(X), n_features))
+        for tree, features, weights in self._path_weights(n_features):
+            # Trees only see a feature subset when max_features < 1.0
+            X_tree = X_scaled[:, features] if len(features) < n_features else X_scaled
+            totals += tree.decision_path(X_tree) @ weights
+        sums = totals.sum(axis=1, keepdims=True)
+        return np.divide(totals, sums, out=np.zeros_like(totals), where=sums > 0)
+
+    def _path_weights(self, n_features):
+        """Per tree, a (nodes x features) matrix crediting the split that led to each node.
+
+        Entering a node from its parent credits the parent's split feature with
+        log(parent samples / node samples), i.e. how much of the training data
+        that split cut away. Along a path these sum to log(root / leaf samples).
+        """
+        cached = getattr(self, '_path_weights_cache', None)
+        if cached is not None and cached[0] is self.model:
+            return cached[1]
+
+        result = []
+        for tree, features in zip(self.model.estimators_, self.model.estimators_features_):
+            structure = tree.tree_
+            subset = len(features) < n_features
+            samples = structure.n_node_samples.astype(np.float64)
+            weights = np.zeros((structure.node_count, n_features))
+            for node in range(structure.node_count):
+                left, right = structure.children_left[node], structure.children_right[node]
+                if left == -1:
+                    continue
+                feature = structure.feature[node]
+                feature = features[feature] if subset else feature
+                for child in (left, right):
+                    weights[child, feature] = np.log(samples[node] / samples[child])
+            result.append((tree, features, weights))
+        self._path_weights_cache = (self.model, result)
+        return result
+
+    def save(self, filepath=None, version_tag=None, metrics=None):
+        """Write the model as a single bundle and return its path.
+
+        The bundle holds the model, scaler, compiled scorer, feature schema,
+        metrics and the training distribution used for drift monitoring. It
+        is written to a temporary file and renamed into place, so readers see
+        either the previous file or the complete new one. Saves into
+        MODEL_DIR also move the LATEST pointer to the new bundle.
         """
-        if self.model is None:
-            return {}
-
-        try:
-            from sklearn.metrics import precision_score, recall_score, f1_score
-
-            X = np.array(feature_matrix)
-            if self.scaler is not None:
-                X = self.scaler.transform(X)
-
-            predictions = self.model.predict(X)
-            scores = self.model.decision_function(X)
-
-            # IsolationForest: -1 = anomaly, 1 = normal → convert to 0/1
-            y_pred = (predictions == -1).astype(int)
-
-            n_anomalies = int(y_pred.sum())
-            n_total = len(predictions)
-            anomaly_rate = n_anomalies / n_total if n_total > 0 else 0
-            avg_score = float(scores.mean())
-            std_score = float(scores.std())
-
-            result = {
-                'total_samples': n_total,
-                'detected_anomalies': n_anomalies,
-                'anomaly_rate': round(anomaly_rate, 4),
-                'avg_score': round(avg_score, 4),
-                'std_score': round(std_score, 4),
-            }
-
-            if y_true is not None:
-                y_true = np.array(y_true)
-                result['precision'] = round(float(precision_score(y_true, y_pred, zero_division=0)), 4)
-                result['recall'] = round(float(recall_score(y_true, y_pred, zero_division=0)), 4)
-                result['f1'] = round(float(f1_score(y_true, y_pred, zero_division=0)), 4)
-            else:
-                result['precision'] = None
-                result['recall'] = None
-                result['f1'] = None
-
-            return result
-        except Exception as e:
-            logger.error('Model evaluation failed: %s', e)
-            return {}
-
-    def save(self, filepath=None, version_tag=None):
-        """Save model and scaler to disk with optional versioning."""
         if self.model is None:
             raise ValueError('No model to save.')
-        os.makedirs(MODEL_DIR, exist_ok=True)
-
-        if version_tag:
-            model_filename = f'isolation_forest_{version_tag}.joblib'
-            scaler_filename = f'scaler_{version_tag}.joblib'
-        else:
-            model_filename = 'isolation_forest.joblib'
-            scaler_filename = 'scaler.joblib'
-
-        filepath = filepath or os.path.join(MODEL_DIR, model_filename)
-        scaler_path = os.path.join(MODEL_DIR, scaler_filename)
-
-        joblib.dump(self.model, filepath)
-        if self.scaler is not None:
-            joblib.dump(self.scaler, scaler_path)
 
-        # Also save as "latest" for easy loading
-        latest_path = os.path.join(MODEL_DIR, 'isolation_forest.joblib')
-        latest_scaler = os.path.join(MODEL_DIR, 'scaler.joblib')
-        joblib.dump(self.model, latest_path)
-        if self.scaler is not None:
-            joblib.dump(self.scaler, latest_scaler)
-
-        # Cleanup old versions (keep MAX_MODEL_VERSIONS)
-        self._cleanup_old_versions()
-
-        logger.info('Model saved to %s (version: %s)', filepath, version_tag or 'latest')
+        version_tag = version_tag or timezone.now().strftime('%Y%m%d_%H%M%S')
+        into_store = filepath is None
+        if into_store:
+            os.makedirs(MODEL_DIR, exist_ok=True)
+            filepath = os.path.join(MODEL_DIR, f'isolation_forest_{version_tag}.joblib')
+
+        self.compiled = CompiledForest.from_model(self.model, self.scaler)
+        self.version = version_tag
+        self.metrics = metrics or {}
+        bundle = {
+            'format': BUNDLE_FORMAT,
+            'version': version_tag,
+            'created_at': timezone.now().isoformat(),
+            'feature_names': list(FEATURE_NAMES),
+            'params': {
+                'contamination': self.contamination,
+                'n_estimators': self.n_estimators,
+                'max_samples': self.max_samples,
+            },
+            'metrics': self.metrics,
+            'model': self.model,
+            'scaler': self.scaler,
+            'compiled': self.compiled.to_dict(),
+            'reference': self.reference,
+        }
+        compress = getattr(settings, 'AI_SECURITY', {}).get('MODEL_BUNDLE_COMPRESS', 0)
+        atomic_write(filepath, lambda tmp: joblib.dump(bundle, tmp, compress=compress))
+
+        if into_store:
+            _set_latest(filepath)
+            # Cleanup old versions (keep MAX_MODEL_VERSIONS)
+            self._cleanup_old_versions()
+
+        logger.info('Model saved to %s (version: %s)', filepath, version_tag)
         return filepath
 
-    def load(self, filepath=None):
-        """Load model and scaler from disk."""
-        filepath = filepath or os.path.join(MODEL_DIR, 'isolation_forest.joblib')
-        scaler_path = os.path.join(MODEL_DIR, 'scaler.joblib')
+    def load(self, filepath=None, mmap_mode=None):
+        """Load a model bundle, by default the one LATEST points to.
+
+        With ``mmap_mode='r'`` the compiled scorer's arrays in an uncompressed
+        bundle are memory-mapped read-only, so processes share their pages.
+        The sklearn trees copy their node arrays when unpickled and stay
+        private to each process. Files written
+        before bundles existed (a bare model plus scaler.joblib) still load.
+        """
+        filepath = filepath or latest_path()
 
         if not os.path.exists(filepath):
             logger.warning('Model file not found at %s', filepath)
             return False
 
         try:
-            self.model = joblib.load(filepath)
-            if os.path.exists(scaler_path):
-                self.scaler = joblib.load(scaler_path)
+            data = joblib.load(filepath, mmap_mode=mmap_mode)
+            if isinstance(data, dict):
+                self._load_bundle(data)
+            else:
+                self._load_legacy(data, filepath, mmap_mode)
             logger.info('Model loaded from %s', filepath)
             return True
         except Exception as e:
             logger.error('Failed to load model from %s: %s', filepath, e)
             self.model = None
             self.scaler = None
+            self.compiled = None
             return False
 
+    def _load_bundle(self, data):
+        if data.get('format') != BUNDLE_FORMAT:
+            raise ValueError(f'Unsupported model bundle format: {data.get("format")}')
+        if list(data.get('feature_names') or []) != list(FEATURE_NAMES):
+            raise ValueError(
+                f'Model was trained on features {data.get("feature_names")}, expected {list(FEATURE_NAMES)}'
+            )
+        self.model = data['model']
+        self.scaler = data['scaler']
+        self.compiled = CompiledForest.from_dict(data['compiled'])
+        params = data.get('params') or {}
+        self.contamination = params.get('contamination', self.contamination)
+        self.n_estimators = params.get('n_estimators', self.n_estimators)
+        self.max_samples = params.get('max_samples', self.max_samples)
+        self.reference = data.get('reference')
+        self.version = data.get('version')
+        self.metrics = data.get('metrics') or {}
+
+    def _load_legacy(self, model, filepath, mmap_mode):
+        name = os.path.basename(filepath)
+        scaler_path = os.path.join(MODEL_DIR, 'scaler.joblib')
+        if name.startswith('isolation_forest_'):
+            versioned = os.path.join(os.path.dirname(filepath), name.replace('isolation_forest_', 'scaler_', 1))
+            if os.path.exists(versioned):
+                scaler_path = versioned
+        self.model = model
+        self.scaler = joblib.load(scaler_path, mmap_mode=mmap_mode) if os.path.exists(scaler_path) else None
+        self.compiled = CompiledForest.from_model(self.model, self.scaler)
+        self.reference = None
+        self.version = None
+        self.metrics = {}
+
     @staticmethod
     def list_versions():
         """List all available model versions sorted by date (newest first)."""
@@ -223,24 +381,22 @@ class IsolationForestEngine:
         return versions
 
     def rollback(self, version_tag):
-        """Rollback to a specific model version."""
-        filepath = os.path.join(MODEL_DIR, f'isolation_forest_{version_tag}.joblib')
-        scaler_path = os.path.join(MODEL_DIR, f'scaler_{version_tag}.joblib')
+        """Make a saved model version the active one again (see shadow.rollback).
 
+        Scans and inline scoring follow the active AIModelConfig, so the
+        version is activated there through the model store; LATEST is moved
+        too, for load() without a path.
+        """
+        from . import shadow
+
+        filepath = os.path.join(MODEL_DIR, f'isolation_forest_{version_tag}.joblib')
         if not os.path.exists(filepath):
             raise FileNotFoundError(f'Model version {version_tag} not found')
+        if not self.load(filepath):
+            raise ValueError(f'Model version {version_tag} could not be loaded')
 
-        self.model = joblib.load(filepath)
-        if os.path.exists(scaler_path):
-            self.scaler = joblib.load(scaler_path)
-
-        # Copy to latest
-        latest_path = os.path.join(MODEL_DIR, 'isolation_forest.joblib')
-        latest_scaler = os.path.join(MODEL_DIR, 'scaler.joblib')
-        joblib.dump(self.model, latest_path)
-        if self.scaler is not None:
-            joblib.dump(self.scaler, latest_scaler)
-
+        shadow.rollback(version_tag)
+        _set_latest(filepath)
         logger.info('Rolled back to model version %s', version_tag)
         return True
 
@@ -249,13 +405,17 @@ class IsolationForestEngine:
         """Remove old model versions beyond MAX_MODEL_VERSIONS."""
         pattern = os.path.join(MODEL_DIR, 'isolation_forest_*.joblib')
         files = sorted(glob.glob(pattern), reverse=True)
+        latest = latest_path()
         for old_file in files[MAX_MODEL_VERSIONS:]:
+            if os.path.abspath(old_file) == os.path.abspath(latest):
+                continue
             try:
                 os.remove(old_file)
-                # Also remove corresponding scaler
-                scaler_file = old_file.replace('isolation_forest_', 'scaler_')
-                if os.path.exists(scaler_file):
-                    os.remove(scaler_file)
+                # Also remove the scaler and compiled scorer written by older versions
+                for prefix in ('scaler_', 'compiled_'):
+                    related = os.path.join(MODEL_DIR, os.path.basename(old_file).replace('isolation_forest_', prefix, 1))
+                    if os.path.exists(related):
+                        os.remove(related)
                 logger.info('Removed old model version: %s', os.path.basename(old_file))
             except OSError as e:
                 logger.warning('Failed to remove old model %s: %s', old_file, e)
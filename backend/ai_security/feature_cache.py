@@ -0,0 +1,86 @@
+"""
+Shared cache of per-user feature vectors.
+
+Vectors are cached under (window length, time bucket, user), so training,
+the evaluation endpoint and the scanner reuse each other's work while they
+run within the same bucket. Buckets scale with the window: a vector of a
+24h window may be up to an hour old, a 1h window's up to BUCKET_SECONDS.
+"""
+import logging
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+from .features import FEATURE_NAMES, extract_features_bulk
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = f'ai:fv:{len(FEATURE_NAMES)}'
+
+
+def _config():
+    return getattr(settings, 'AI_SECURITY', {}).get('FEATURE_CACHE', {})
+
+
+def bucket_width(hours):
+    """Bucket length in seconds for a window of ``hours``."""
+    return max(int(_config().get('BUCKET_SECONDS', 300)), int(hours * 3600) // 24)
+
+
+def _key(hours, bucket, user_id):
+    return f'{KEY_PREFIX}:{hours}:{bucket}:{user_id}'
+
+
+def get_feature_matrix(hours=1, user_ids=None):
+    """Cached drop-in for extract_features_bulk(); returns ``(user_ids, matrix)``.
+
+    Only the users missing from the cache are extracted. Cache failures are
+    logged and treated as misses.
+    """
+    config = _config()
+    if not config.get('ENABLED', True):
+        return extract_features_bulk(hours=hours, user_ids=user_ids)
+
+    from accounts.models import CustomUser
+
+    if user_ids is None:
+        user_ids = list(CustomUser.objects.filter(is_active=True).values_list('id', flat=True))
+    else:
+        user_ids = list(user_ids)
+    if not user_ids:
+        return extract_features_bulk(hours=hours, user_ids=user_ids)
+
+    width = bucket_width(hours)
+    bucket = int(time.time() // width)
+    keys = {user_id: _key(hours, bucket, user_id) for user_id in user_ids}
+    cache = caches[config.get('ALIAS', 'default')]
+    try:
+        cached = cache.get_many(list(keys.values()))
+    except Exception as e:
+        logger.error('Failed to read feature cache: %s', e)
+        cached = {}
+
+    matrix = np.zeros((len(user_ids), len(FEATURE_NAMES)), dtype=np.float64)
+    missing = []
+    for i, user_id in enumerate(user_ids):
+        vector = cached.get(keys[user_id])
+        if vector is None:
+            missing.append(i)
+        else:
+            matrix[i] = vector
+    if not missing:
+        return user_ids, matrix
+
+    _, computed = extract_features_bulk(hours=hours, user_ids=[user_ids[i] for i in missing])
+    matrix[missing] = computed
+
+    try:
+        cache.set_many(
+            {keys[user_ids[i]]: computed[j].tolist() for j, i in enumerate(missing)},
+            timeout=int(config.get('TTL', 2 * width)),
+        )
+    except Exception as e:
+        logger.error('Failed to write feature cache (%d vectors): %s', len(missing), e)
+    return user_ids, matrix
@@ -0,0 +1,362 @@
+"""
+Incremental per-user feature counters kept in Redis.
+
+Events are folded into per-user, fixed-width time buckets as they are persisted
+(activity log flush, login attempts, document access, password resets), so the
+scanner can assemble the FEATURE_NAMES vectors for a rolling window by summing a
+few buckets per user instead of re-reading the raw log tables.
+
+Key layout (one set of keys per user and bucket, all expiring after retention):
+    ai:fs:<user>:<bucket>        hash of counters
+    ai:fs:<user>:<bucket>:hep    HyperLogLog of request paths
+    ai:fs:<user>:<bucket>:hip    HyperLogLog of client IPs
+    ai:fs:<user>:<bucket>:dl     hash of download counts per document
+    ai:fs:<user>:<bucket>:span   sorted set holding first/last event timestamps
+plus ai:fs:active, a sorted set of user ids scored by their latest event time.
+With real-time scoring enabled, every write also refreshes
+    ai:fs:<user>:vec             the user's 1-hour vector as float32 bytes
+so inline scoring reads one key instead of assembling the window.
+"""
+import logging
+import re
+import time
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .features import FEATURE_NAMES
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'ai:fs'
+# Sorted set of user ids scored by the timestamp of their latest event
+ACTIVE_KEY = f'{KEY_PREFIX}:active'
+ADMIN_PATH_RE = re.compile(r'/(users|ip-restrictions)/')
+ADMIN_METHODS = ('POST', 'PATCH', 'DELETE')
+SENSITIVE_LEVELS = ('confidential', 'secret')
+NULL_IP = '-'
+
+_client = None
+
+
+def _config():
+    return getattr(settings, 'AI_SECURITY', {}).get('FEATURE_STORE', {})
+
+
+def is_enabled():
+    return bool(_config().get('ENABLED', False))
+
+
+def bucket_seconds():
+    return int(_config().get('BUCKET_SECONDS', 300))
+
+
+def get_client():
+    """Return the shared Redis client for the feature store."""
+    global _client
+    if _client is None:
+        import redis
+        url = _config().get('URL') or settings.CELERY_BROKER_URL
+        _client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+    return _client
+
+
+def _key(user_id, bucket, suffix=''):
+    key = f'{KEY_PREFIX}:{user_id}:{bucket}'
+    return f'{key}:{suffix}' if suffix else key
+
+
+def _vector_key(user_id):
+    return f'{KEY_PREFIX}:{user_id}:vec'
+
+
+# --- Ingest -----------------------------------------------------------------
+
+def request_event(log_data, ts=None):
+    """Build a feature-store event from the kwargs used to create an ActivityLog."""
+    user = log_data.get('user')
+    if user is None:
+        return None
+    return {
+        'kind': 'request',
+        'user_id': user.pk,
+        'ts': ts or time.time(),
+        'path': log_data.get('request_path') or '',
+        'method': log_data.get('request_method') or '',
+        'status': log_data.get('response_status') or 0,
+        'ip': log_data.get('ip_address') or NULL_IP,
+    }
+
+
+def _new_bucket():
+    return {
+        'counters': Counter(),
+        'endpoints': set(),
+        'ips': set(),
+        'downloads': Counter(),
+        'first': None,
+        'last': None,
+        'reset': None,
+        'seen': 0,
+    }
+
+
+def accumulate(events, width=None):
+    """Fold events into per-(user, bucket) increments. Pure function."""
+    width = width or bucket_seconds()
+    acc = {}
+    for event in events:
+        if not event:
+            continue
+        slot = (str(event['user_id']), int(event['ts'] // width))
+        b = acc.get(slot)
+        if b is None:
+            b = acc[slot] = _new_bucket()
+        counters = b['counters']
+        kind = event['kind']
+        b['seen'] = max(b['seen'], event['ts'])
+
+        if kind == 'request':
+            path, method, status = event['path'], event['method'], event['status']
+            counters['requests'] += 1
+            if '/documents/' in path:
+                counters['docs_accessed'] += 1
+            if status >= 400:
+                counters['errors'] += 1
+            if '/share/' in path and method == 'POST':
+                counters['share_actions'] += 1
+            if ADMIN_PATH_RE.search(path) and method in ADMIN_METHODS:
+                counters['admin_actions'] += 1
+            if '/e2e/' in path and status >= 400:
+                counters['e2e_key_failures'] += 1
+            b['endpoints'].add(path)
+            b['ips'].add(event['ip'])
+            ts = event['ts']
+            b['first'] = ts if b['first'] is None else min(b['first'], ts)
+            b['last'] = ts if b['last'] is None else max(b['last'], ts)
+        elif kind == 'login_failure':
+            counters['failed_logins'] += 1
+        elif kind == 'document_access':
+            if event['action'] == 'download':
+                counters['docs_downloaded'] += 1
+                b['downloads'][str(event['document_id'])] += 1
+            if event['security_level'] in SENSITIVE_LEVELS:
+                counters['sensitive_docs_accessed'] += 1
+        elif kind == 'password_reset':
+            if b['reset'] is None or event['ts'] >= b['reset'][0]:
+                b['reset'] = (event['ts'], event['delay_min'])
+    return acc
+
+
+def _write(client, acc):
+    ttl = int(_config().get('RETENTION_HOURS', 25) * 3600)
+    pipe = client.pipeline(transaction=False)
+    for (user_id, bucket), b in acc.items():
+        key = _key(user_id, bucket)
+        touched = [key]
+        for field, amount in b['counters'].items():
+            pipe.hincrby(key, field, amount)
+        if b['reset'] is not None:
+            pipe.hset(key, mapping={'reset_at': b['reset'][0], 'reset_delay': b['reset'][1]})
+        if b['endpoints']:
+            pipe.pfadd(_key(user_id, bucket, 'hep'), *b['endpoints'])
+            touched.append(_key(user_id, bucket, 'hep'))
+        if b['ips']:
+            pipe.pfadd(_key(user_id, bucket, 'hip'), *b['ips'])
+            touched.append(_key(user_id, bucket, 'hip'))
+        for doc_id, amount in b['downloads'].items():
+            pipe.hincrby(_key(user_id, bucket, 'dl'), doc_id, amount)
+        if b['downloads']:
+            touched.append(_key(user_id, bucket, 'dl'))
+        if b['first'] is not None:
+            span = _key(user_id, bucket, 'span')
+            # LT/GT only guard updates of existing members, new ones are added
+            pipe.zadd(span, {'first': b['first']}, lt=True)
+            pipe.zadd(span, {'last': b['last']}, gt=True)
+            touched.append(span)
+        for k in touched:
+            pipe.expire(k, ttl)
+
+    last_seen = {}
+    for (user_id, _), b in acc.items():
+        last_seen[user_id] = max(last_seen.get(user_id, 0), b['seen'])
+    if last_seen:
+        pipe.zadd(ACTIVE_KEY, last_seen, gt=True)
+        pipe.zremrangebyscore(ACTIVE_KEY, '-inf', time.time() - ttl)
+
+    from . import rescoring
+    if rescoring.is_enabled():
+        rescoring.mark_dirty(pipe, acc)
+    pipe.execute()
+
+
+def record_events(events):
+    """Persist events into the feature store. Never raises."""
+    if not is_enabled():
+        return
+    events = [e for e in events if e]
+    if not events:
+        return
+    try:
+        acc = accumulate(events)
+        _write(get_client(), acc)
+    except Exception as e:
+        logger.error('Failed to update feature store (%d events): %s', len(events), e)
+        return
+
+    from . import realtime
+    if realtime.is_enabled():
+        store_vectors(sorted({user_id for user_id, _ in acc}))
+
+
+def record_activity(log_entries):
+    """Record a flushed batch of ActivityLog kwargs."""
+    if not is_enabled():
+        return
+    now = time.time()
+    record_events([request_event(data, ts=now) for data in log_entries])
+
+
+# --- Read -------------------------------------------------------------------
+
+def _as_str(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def merge_buckets(counter_hashes, download_hashes, spans, endpoint_count, ip_count, hour_of_day):
+    """Combine raw per-bucket data of one user into a feature vector. Pure function."""
+    totals = Counter()
+    reset_at, reset_delay = None, 0.0
+    for h in counter_hashes:
+        h = {_as_str(field): value for field, value in h.items()}
+        if 'reset_at' in h:
+            at = float(h.pop('reset_at'))
+            delay = float(h.pop('reset_delay', 0))
+            if reset_at is None or at >= reset_at:
+                reset_at, reset_delay = at, delay
+        for field, value in h.items():
+            totals[field] += int(value)
+
+    downloads = Counter()
+    for h in download_hashes:
+        for doc_id, value in h.items():
+            downloads[_as_str(doc_id)] += int(value)
+
+    first = last = None
+    for span in spans:
+        for member, score in span:
+            member = _as_str(member)
+            if member == 'first':
+                first = score if first is None else min(first, score)
+            elif member == 'last':
+                last = score if last is None else max(last, score)
+
+    requests = totals['requests']
+    duration = 0.0
+    if requests >= 2 and first is not None and last is not None:
+        duration = round((last - first) / 60.0, 2)
+
+    features = {
+        'failed_logins': totals['failed_logins'],
+        'requests_count': requests,
+        'docs_accessed': totals['docs_accessed'],
+        'docs_downloaded': totals['docs_downloaded'],
+        'hour_of_day': hour_of_day,
+        'error_rate': round(totals['errors'] / requests, 4) if requests else 0.0,
+        'unique_endpoints': endpoint_count,
+        'session_duration_min': duration,
+        'sensitive_docs_accessed': totals['sensitive_docs_accessed'],
+        'distinct_ips': ip_count,
+        'share_actions': totals['share_actions'],
+        'admin_actions': totals['admin_actions'],
+        'password_reset_delay_min': round(reset_delay, 2),
+        'e2e_key_failures': totals['e2e_key_failures'],
+        'repeated_doc_downloads': max(downloads.values()) if downloads else 0,
+    }
+    return [features[name] for name in FEATURE_NAMES]
+
+
+def active_user_ids(hours=1):
+    """Return ids of users with events in the last N hours, or None if unavailable."""
+    if not is_enabled():
+        return None
+    try:
+        members = get_client().zrangebyscore(ACTIVE_KEY, time.time() - hours * 3600, '+inf')
+    except Exception as e:
+        logger.error('Failed to read active users from feature store: %s', e)
+        return None
+    return [_as_str(member) for member in members]
+
+
+def get_feature_matrix(user_ids, hours=1, client=None):
+    """Assemble the feature matrix for ``user_ids`` from stored counters.
+
+    The window is aligned to bucket boundaries, so it may reach up to one
+    bucket further back than ``hours``. Returns None if the store is disabled
+    or unreachable, so callers can fall back to extract_features_bulk().
+    ``client`` overrides the shared Redis client, e.g. one with tighter timeouts.
+    """
+    if not is_enabled():
+        return None
+    user_ids = list(user_ids)
+    width = bucket_seconds()
+    now = time.time()
+    buckets = range(int((now - hours * 3600) // width), int(now // width) + 1)
+    hour_of_day = timezone.now().hour
+
+    try:
+        client = client or get_client()
+        pipe = client.pipeline(transaction=False)
+        for user_id in user_ids:
+            for bucket in buckets:
+                pipe.hgetall(_key(user_id, bucket))
+                pipe.hgetall(_key(user_id, bucket, 'dl'))
+                pipe.zrange(_key(user_id, bucket, 'span'), 0, -1, withscores=True)
+            # PFCOUNT over several keys counts their union without storing it
+            pipe.pfcount(*[_key(user_id, bucket, 'hep') for bucket in buckets])
+            pipe.pfcount(*[_key(user_id, bucket, 'hip') for bucket in buckets])
+        results = pipe.execute()
+    except Exception as e:
+        logger.error('Failed to read feature store: %s', e)
+        return None
+
+    matrix = np.zeros((len(user_ids), len(FEATURE_NAMES)), dtype=np.float64)
+    per_user = 3 * len(buckets) + 2
+    for i in range(len(user_ids)):
+        chunk = results[i * per_user:(i + 1) * per_user]
+        raw = chunk[:-2]
+        matrix[i] = merge_buckets(
+            counter_hashes=raw[0::3],
+            download_hashes=raw[1::3],
+            spans=raw[2::3],
+            endpoint_count=chunk[-2],
+            ip_count=chunk[-1],
+            hour_of_day=hour_of_day,
+        )
+    return matrix
+
+
+def store_vectors(user_ids, client=None):
+    """Precompute the 1-hour vectors of ``user_ids`` for get_vector(). Never raises."""
+    client = client or get_client()
+    matrix = get_feature_matrix(user_ids, hours=1, client=client)
+    if matrix is None:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for user_id, row in zip(user_ids, matrix.astype(np.float32)):
+            # Without new events the window is empty an hour later
+            pipe.set(_vector_key(user_id), row.tobytes(), ex=3600)
+        pipe.execute()
+    except Exception as e:
+        logger.error('Failed to store feature vectors (%d users): %s', len(user_ids), e)
+
+
+def get_vector(user_id, client=None):
+    """The precomputed 1-hour vector of ``user_id``, or None if there is none. Raises on read errors."""
+    data = (client or get_client()).get(_vector_key(user_id))
+    vector = np.frombuffer(data, dtype=np.float32).astype(np.float64) if data is not None else None
+    # Vectors written for another feature layout are ignored until rewritten
+    return vector if vector is not None and len(vector) == len(FEATURE_NAMES) else None
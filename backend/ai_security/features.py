@@ -1,10 +1,9 @@
 from datetime import timedelta
 
-from django.db.models import Count, Max
+import numpy as np
+from django.db.models import Count, Q
 from django.utils import timezone
 
-from .models import ActivityLog
-
 FEATURE_NAMES = [
     'failed_logins',
     'requests_count',
@@ -23,129 +22,151 @@ FEATURE_NAMES = [
     'repeated_doc_downloads',
 ]
 
+FLOAT_FEATURES = {'error_rate', 'session_duration_min', 'password_reset_delay_min'}
+
+
+def active_user_ids(hours=1):
+    """Return ids of active users that produced any event in the last N hours."""
+    from accounts.models import LoginAttempt, PasswordResetToken
+    from documents.models import DocumentAccessLog
+    from .models import ActivityLog
 
-def extract_user_features(user, hours=1):
-    """Extract 15 behavioral features for a user over the last N hours."""
     since = timezone.now() - timedelta(hours=hours)
-    logs = ActivityLog.objects.filter(user=user, created_at__gte=since)
+    sources = [
+        ActivityLog.objects.filter(created_at__gte=since, user__isnull=False),
+        LoginAttempt.objects.filter(created_at__gte=since, user__isnull=False, success=False),
+        DocumentAccessLog.objects.filter(created_at__gte=since, user__isnull=False),
+        PasswordResetToken.objects.filter(created_at__gte=since, confirmed_at__isnull=False),
+    ]
+    seen = set()
+    for qs in sources:
+        seen.update(qs.order_by().values_list('user_id', flat=True).distinct())
+    return filter_active_user_ids(seen)
+
+
+def filter_active_user_ids(user_ids):
+    """Keep only ids of active users, in a stable order."""
+    from accounts.models import CustomUser
+
+    user_ids = list(user_ids)
+    if not user_ids:
+        return []
+    return list(
+        CustomUser.objects.filter(id__in=user_ids, is_active=True)
+        .order_by('id').values_list('id', flat=True)
+    )
 
-    total = logs.count()
 
-    # 1. Failed login attempts
-    from accounts.models import LoginAttempt
-    failed_logins = LoginAttempt.objects.filter(
-        user=user, success=False, created_at__gte=since,
-    ).count()
+def extract_user_features(user, hours=1):
+    """Extract 15 behavioral features for a user over the last N hours."""
+    _, matrix = extract_features_bulk(hours=hours, user_ids=[user.pk])
+    return vector_to_features(matrix[0])
 
-    # 2. Total requests count
-    requests_count = total
 
-    # 3. Documents accessed
-    docs_accessed = logs.filter(request_path__contains='/documents/').count()
+def extract_features_bulk(hours=1, user_ids=None):
+    """Extract the feature matrix for many users with a handful of grouped queries.
 
-    # 4. Documents downloaded
+    Returns ``(user_ids, matrix)`` where ``matrix[i]`` is the feature vector
+    (ordered as FEATURE_NAMES) of ``user_ids[i]``. When ``user_ids`` is None,
+    all active users are included. ActivityLog-based features are read from
+    rollups where available (see ai_security.rollups).
+    """
+    from accounts.models import CustomUser, LoginAttempt, PasswordResetToken
     from documents.models import DocumentAccessLog
-    docs_downloaded = DocumentAccessLog.objects.filter(
-        user=user, action='download', created_at__gte=since,
-    ).count()
+    from .rollups import user_activity
 
-    # 5. Hour of day (0-23)
-    hour_of_day = timezone.now().hour
+    now = timezone.now()
+    since = now - timedelta(hours=hours)
 
-    # 6. Error rate (4xx/5xx responses ratio)
-    if total > 0:
-        error_count = logs.filter(response_status__gte=400).count()
-        error_rate = round(error_count / total, 4)
-    else:
-        error_rate = 0.0
-
-    # 7. Unique endpoints accessed
-    unique_endpoints = logs.values('request_path').distinct().count()
-
-    # 8. Session duration (time between first and last activity)
-    if total >= 2:
-        first_log = logs.order_by('created_at').first()
-        last_log = logs.order_by('-created_at').first()
-        if first_log and last_log:
-            duration = (last_log.created_at - first_log.created_at).total_seconds() / 60.0
-        else:
-            duration = 0.0
-    else:
-        duration = 0.0
-
-    # 9. Sensitive documents accessed (confidential/secret)
-    from documents.models import Document
-    sensitive_docs_accessed = DocumentAccessLog.objects.filter(
-        user=user,
-        created_at__gte=since,
-        document__security_level__in=['confidential', 'secret'],
-    ).count()
-
-    # 10. Distinct IPs
-    distinct_ips = logs.values('ip_address').distinct().count()
-
-    # 11. Share actions (POST to /share/ endpoints)
-    share_actions = logs.filter(
-        request_path__contains='/share/',
-        request_method='POST',
-    ).count()
-
-    # 12. Admin actions (/users/ or /ip-restrictions/ with POST/PATCH/DELETE)
-    admin_actions = logs.filter(
-        request_path__regex=r'/(users|ip-restrictions)/',
-        request_method__in=['POST', 'PATCH', 'DELETE'],
-    ).count()
-
-    # 13. Password reset delay (minutes between request and confirmation)
-    from accounts.models import PasswordResetToken
-    last_reset = PasswordResetToken.objects.filter(
-        user=user,
-        confirmed_at__isnull=False,
-        created_at__gte=since,
-    ).order_by('-created_at').first()
-
-    if last_reset and last_reset.confirmed_at:
-        password_reset_delay_min = round(
-            (last_reset.confirmed_at - last_reset.created_at).total_seconds() / 60.0, 2
+    if user_ids is None:
+        user_ids = list(
+            CustomUser.objects.filter(is_active=True).values_list('id', flat=True)
         )
+        user_filter = {'user__is_active': True}
     else:
-        password_reset_delay_min = 0.0
-
-    # 14. E2E key failures (requests to /e2e/ with 4xx+ response)
-    e2e_key_failures = logs.filter(
-        request_path__contains='/e2e/',
-        response_status__gte=400,
-    ).count()
-
-    # 15. Repeated document downloads (max downloads of a single document)
-    repeated_result = DocumentAccessLog.objects.filter(
-        user=user,
-        action='download',
-        created_at__gte=since,
-    ).values('document').annotate(
-        cnt=Count('id'),
-    ).aggregate(max_cnt=Max('cnt'))
-    repeated_doc_downloads = repeated_result['max_cnt'] or 0
+        user_ids = list(user_ids)
+        user_filter = {'user_id__in': user_ids}
+
+    col = {name: i for i, name in enumerate(FEATURE_NAMES)}
+    row = {uid: i for i, uid in enumerate(user_ids)}
+    matrix = np.zeros((len(user_ids), len(FEATURE_NAMES)), dtype=np.float64)
+    if not user_ids:
+        return user_ids, matrix
+
+    matrix[:, col['hour_of_day']] = now.hour
+
+    for user_id, item in user_activity(since, now, user_filter).items():
+        i = row.get(user_id)
+        if i is None:
+            continue
+        total = item['request_count']
+        matrix[i, col['requests_count']] = total
+        matrix[i, col['docs_accessed']] = item['docs_accessed']
+        matrix[i, col['error_rate']] = round(item['error_count'] / total, 4) if total else 0.0
+        matrix[i, col['unique_endpoints']] = item['endpoints']
+        if total >= 2:
+            duration = (item['last_at'] - item['first_at']).total_seconds() / 60.0
+            matrix[i, col['session_duration_min']] = round(duration, 2)
+        matrix[i, col['distinct_ips']] = item['ips']
+        matrix[i, col['share_actions']] = item['share_actions']
+        matrix[i, col['admin_actions']] = item['admin_actions']
+        matrix[i, col['e2e_key_failures']] = item['e2e_key_failures']
+
+    failed = LoginAttempt.objects.filter(
+        success=False, created_at__gte=since, **user_filter,
+    ).values('user').annotate(cnt=Count('id'))
+    for item in failed:
+        i = row.get(item['user'])
+        if i is not None:
+            matrix[i, col['failed_logins']] = item['cnt']
+
+    doc_access = DocumentAccessLog.objects.filter(
+        created_at__gte=since, **user_filter,
+    ).values('user').annotate(
+        docs_downloaded=Count('id', filter=Q(action='download')),
+        sensitive_docs_accessed=Count('id', filter=Q(
+            document__security_level__in=['confidential', 'secret'],
+        )),
+    )
+    for item in doc_access:
+        i = row.get(item['user'])
+        if i is not None:
+            matrix[i, col['docs_downloaded']] = item['docs_downloaded']
+            matrix[i, col['sensitive_docs_accessed']] = item['sensitive_docs_accessed']
+
+    per_document = DocumentAccessLog.objects.filter(
+        action='download', created_at__gte=since, **user_filter,
+    ).values('user', 'document').annotate(cnt=Count('id'))
+    for item in per_document:
+        i = row.get(item['user'])
+        if i is not None and item['cnt'] > matrix[i, col['repeated_doc_downloads']]:
+            matrix[i, col['repeated_doc_downloads']] = item['cnt']
+
+    # Latest confirmed reset per user (rows come newest first for each user)
+    resets = PasswordResetToken.objects.filter(
+        confirmed_at__isnull=False, created_at__gte=since, **user_filter,
+    ).order_by('user', '-created_at').values_list('user', 'created_at', 'confirmed_at')
+    seen = set()
+    for uid, created_at, confirmed_at in resets:
+        i = row.get(uid)
+        if i is None or uid in seen:
+            continue
+        seen.add(uid)
+        matrix[i, col['password_reset_delay_min']] = round(
+            (confirmed_at - created_at).total_seconds() / 60.0, 2
+        )
 
-    return {
-        'failed_logins': failed_logins,
-        'requests_count': requests_count,
-        'docs_accessed': docs_accessed,
-        'docs_downloaded': docs_downloaded,
-        'hour_of_day': hour_of_day,
-        'error_rate': error_rate,
-        'unique_endpoints': unique_endpoints,
-        'session_duration_min': round(duration, 2),
-        'sensitive_docs_accessed': sensitive_docs_accessed,
-        'distinct_ips': distinct_ips,
-        'share_actions': share_actions,
-        'admin_actions': admin_actions,
-        'password_reset_delay_min': password_reset_delay_min,
-        'e2e_key_failures': e2e_key_failures,
-        'repeated_doc_downloads': repeated_doc_downloads,
-    }
+    return user_ids, matrix
 
 
 def features_to_vector(features_dict):
     """Convert features dict to ordered list for ML model."""
     return [features_dict.get(name, 0.0) for name in FEATURE_NAMES]
+
+
+def vector_to_features(vector):
+    """Convert an ordered feature vector back to a JSON-friendly features dict."""
+    return {
+        name: float(value) if name in FLOAT_FEATURES else int(value)
+        for name, value in zip(FEATURE_NAMES, vector)
+    }
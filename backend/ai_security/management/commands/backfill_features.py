@@ -0,0 +1,44 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ai_security.backfill import iter_windows, write_shard
+from ai_security.tasks import TRAINING_WINDOW_HOURS
+
+
+class Command(BaseCommand):
+    help = 'Replay activity history over sliding windows and write training feature shards (.npz)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='How many days of history to replay')
+        parser.add_argument(
+            '--window-hours', type=int, default=TRAINING_WINDOW_HOURS,
+            help='Feature window width in hours; training only uses shards as wide as its own window',
+        )
+        parser.add_argument('--step-minutes', type=int, default=60, help='Distance between window ends')
+        parser.add_argument('--output', default='', help='Directory for the .npz shards')
+
+    def handle(self, *args, **options):
+        window_seconds = options['window_hours'] * 3600
+        step_seconds = options['step_minutes'] * 60
+        if step_seconds <= 0 or window_seconds <= 0 or window_seconds % step_seconds:
+            raise CommandError('--window-hours must be a positive multiple of --step-minutes')
+
+        output = options['output'] or getattr(settings, 'AI_SECURITY', {}).get('TRAINING_DATASET_DIR') \
+            or os.path.join(settings.BASE_DIR, 'ml_datasets')
+        end = timezone.now()
+        start = (end - timedelta(days=options['days'])).replace(hour=0, minute=0, second=0, microsecond=0)
+
+        total = 0
+        for day, user_ids, window_ends, matrix in iter_windows(start, end, window_seconds, step_seconds):
+            if not len(matrix):
+                continue
+            name = f"{day:%Y%m%d}_{options['window_hours']}h"
+            path = write_shard(output, name, user_ids, window_ends, matrix, window_seconds)
+            total += len(matrix)
+            self.stdout.write(f'  {day:%Y-%m-%d}: {len(matrix)} windows -> {path}')
+
+        self.stdout.write(self.style.SUCCESS(f'Done. {total} feature vectors written to {output}.'))
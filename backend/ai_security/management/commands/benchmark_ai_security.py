@@ -0,0 +1,437 @@
+"""
+End-to-end benchmark of the ai_security pipeline on seeded data.
+
+Seeds benchmark users (``@bench.local``) whose activity follows the
+ai_module step1 profiles, expressed as ActivityLog rows built from the
+seed_demo action and IP pools, then times extract_user_features,
+train_isolation_forest, scan_recent_activity and explain_features. Each stage
+reports p50/p95 latency, queries per run and peak RSS; the report is written
+as JSON and can be compared against an earlier baseline.
+
+The timed stages run in a transaction that is rolled back, with model files
+in a temporary directory and admin alerts disabled, so they leave no trace.
+The seeded users and logs are kept for later runs (--skip-seed) until
+--cleanup removes them.
+"""
+import csv
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import resource
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from unittest.mock import patch
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.management.commands.seed_demo import (
+    ANOMALOUS_ACTIONS,
+    IP_POOL,
+    NORMAL_ACTIONS,
+    SUSPICIOUS_IPS,
+    USER_AGENTS,
+    _DisableAutoNowAdd,
+)
+from accounts.models import CustomUser, LoginAttempt
+from ai_security.models import ActivityLog, ActivityRollup, AnomalyReport
+
+BENCH_DOMAIN = '@bench.local'
+INSERT_BATCH = 50000
+ERROR_STATUSES = (401, 403, 404)
+# ActivityLog fields written by the seeder, in COPY column order
+LOG_FIELDS = (
+    'id', 'user', 'action', 'resource', 'resource_type', 'resource_id', 'ip_address', 'user_agent',
+    'request_method', 'request_path', 'response_status', 'details', 'metadata', 'created_at',
+)
+STAGES = ('extract_user_features', 'train_isolation_forest', 'scan_recent_activity', 'explain_features')
+
+
+def _load_generator(path):
+    if not os.path.exists(path):
+        raise CommandError(f'Profile generator {path} not found; pass --generator.')
+    spec = importlib.util.spec_from_file_location('step1_dataset_generator', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # ru_maxrss is the peak of the whole process (KiB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if platform.system() == 'Darwin' else peak * 1024
+
+
+class _PeakRSS:
+    """Samples the resident set size on a background thread while the block runs."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = _rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+def _measure(call, runs):
+    """Call ``call(arg)`` for every ``arg`` in ``runs``; returns the stage statistics."""
+    timings, queries = [], []
+    with _PeakRSS() as rss:
+        for arg in runs:
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                call(arg)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(captured.captured_queries))
+    return {
+        'runs': len(timings),
+        'p50_ms': round(float(np.percentile(timings, 50)), 3),
+        'p95_ms': round(float(np.percentile(timings, 95)), 3),
+        'mean_ms': round(float(np.mean(timings)), 3),
+        'queries': int(np.median(queries)),
+        'peak_rss_mb': round(rss.peak / 2 ** 20, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Seed benchmark activity and time feature extraction, training, scanning and explanations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Benchmark users to seed')
+        parser.add_argument('--logs', type=int, default=1000000, help='ActivityLog rows to seed')
+        parser.add_argument('--hours', type=int, default=24, help='Seeded activity spans the last N hours')
+        parser.add_argument('--active-ratio', type=float, default=0.2,
+                            help='Share of users active in the last hour (scanned every run)')
+        parser.add_argument('--samples', type=int, default=50,
+                            help='Users timed by extract_user_features and explain_features')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs of training and scanning')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--generator', default=str(
+            settings.BASE_DIR.parent / 'ai_module' / 'step1_dataset_generator.py'
+        ), help='ai_module step1 dataset generator providing the user profiles')
+        parser.add_argument('--skip-seed', action='store_true', help='Benchmark the already seeded data')
+        parser.add_argument('--output', default='ai_security_benchmark.json', help='JSON report path')
+        parser.add_argument('--compare', default='', help='Baseline JSON report to compare against')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed slowdown over the baseline before a stage counts as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded benchmark data and exit')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            self._cleanup()
+            return
+
+        random.seed(options['seed'])
+        if not options['skip_seed']:
+            self._cleanup()
+            self._seed(options)
+
+        users = list(CustomUser.objects.filter(email__endswith=BENCH_DOMAIN).values_list('pk', flat=True))
+        if not users:
+            raise CommandError('No benchmark data; run without --skip-seed first.')
+        log_count = ActivityLog.objects.filter(user__email__endswith=BENCH_DOMAIN).count()
+
+        results = self._run_stages(users, options)
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'users': len(users),
+                'logs': log_count,
+                'hours': options['hours'],
+                'samples': options['samples'],
+                'repeat': options['repeat'],
+                'database': connection.vendor,
+                'cpu_count': os.cpu_count(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'ai_security': {
+                    key: getattr(settings, 'AI_SECURITY', {}).get(key, {}).get('ENABLED')
+                    for key in ('FEATURE_CACHE', 'FEATURE_STORE', 'STREAMING')
+                },
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+        self._print(report)
+        self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+        if options['compare']:
+            self._compare(report, options)
+
+    # --- Seeding ----------------------------------------------------------------
+
+    def _cleanup(self):
+        bench_users = CustomUser.objects.filter(email__endswith=BENCH_DOMAIN)
+        if not bench_users.exists():
+            return
+        users = bench_users.count()
+        logs, _ = ActivityLog.objects.filter(user__in=bench_users).delete()
+        ActivityRollup.objects.filter(user__in=bench_users).delete()
+        AnomalyReport.objects.filter(user__in=bench_users).delete()
+        bench_users.delete()
+        self.stdout.write(f'Removed benchmark data ({users} users, {logs} logs).')
+
+    def _seed(self, options):
+        generator = _load_generator(options['generator'])
+        n_users, n_logs = options['users'], options['logs']
+        now = timezone.now()
+        start = time.perf_counter()
+
+        # One step1 profile per user; ~10% of them anomalous, like the generated dataset
+        profiles = []
+        for _ in range(n_users):
+            roll = random.random()
+            if roll < 0.1:
+                profiles.append(generator.generate_anomalous_record())
+            elif roll < 0.2:
+                profiles.append(generator.generate_borderline_normal_record())
+            else:
+                profiles.append(generator.generate_normal_record())
+
+        password = make_password(None)
+        users = CustomUser.objects.bulk_create([
+            CustomUser(
+                email=f'bench-{i}{BENCH_DOMAIN}', first_name='Bench', last_name=str(i),
+                password=password, is_2fa_enabled=False,
+            )
+            for i in range(n_users)
+        ], batch_size=1000)
+
+        # Users get log rows in proportion to their profile's requests_count
+        weights = np.array([p['requests_count'] for p in profiles], dtype=np.float64)
+        counts = np.floor(weights / weights.sum() * n_logs).astype(int)
+        counts[:n_logs - counts.sum()] += 1
+
+        batch, failures, written = [], [], 0
+        for user, profile, count in zip(users, profiles, counts.tolist()):
+            session_start, session_end = self._session(profile, now, options)
+            batch.extend(self._log_rows(user, profile, count, session_start, session_end))
+            for _ in range(profile['failed_logins']):
+                failures.append(LoginAttempt(
+                    user=user, email=user.email, ip_address=random.choice(SUSPICIOUS_IPS), success=False,
+                    created_at=session_start + (session_end - session_start) * random.random(),
+                ))
+            if len(batch) >= INSERT_BATCH:
+                written += self._write_logs(batch)
+                batch = []
+                self.stdout.write(f'  {written}/{n_logs} logs')
+        written += self._write_logs(batch)
+        with _DisableAutoNowAdd(LoginAttempt, 'created_at'):
+            LoginAttempt.objects.bulk_create(failures, batch_size=5000)
+
+        # Readers trust rollups below the watermark; cover the seeded period as the rollup task would
+        from ai_security.rollups import bucket_floor, rollup_range, rollup_watermark
+        watermark = rollup_watermark()
+        if watermark is not None:
+            hour = bucket_floor(now - timedelta(hours=options['hours'] + 1))
+            while hour < watermark:
+                rollup_range(hour, min(hour + timedelta(hours=1), watermark))
+                hour += timedelta(hours=1)
+
+        self.stdout.write(
+            f'Seeded {n_users} users, {written} logs and {len(failures)} failed logins '
+            f'in {time.perf_counter() - start:.1f}s'
+        )
+
+    @staticmethod
+    def _session(profile, now, options):
+        """(start, end) of the user's activity: the last hour or at the profile's hour of day."""
+        duration = timedelta(minutes=max(profile['session_duration_min'], 1))
+        if random.random() < options['active_ratio']:
+            end = now - timedelta(seconds=random.randint(0, 300))
+            return max(end - duration, now - timedelta(hours=1)), end
+        days_back = random.randint(0, max(options['hours'] // 24 - 1, 0))
+        start = (now - timedelta(days=days_back)).replace(
+            hour=profile['hour_of_day'], minute=random.randint(0, 59), second=0, microsecond=0,
+        )
+        while start > now - timedelta(hours=1):
+            start -= timedelta(days=1)
+        start = max(start, now - timedelta(hours=options['hours']))
+        return start, min(start + duration, now - timedelta(hours=1))
+
+    @staticmethod
+    def _log_rows(user, profile, count, session_start, session_end):
+        anomalous = profile['is_anomaly'] == 1
+        ips = random.sample(SUSPICIOUS_IPS if anomalous else IP_POOL, min(profile['distinct_ips'], 5))
+        documents = [str(uuid.uuid4()) for _ in range(max(profile['docs_accessed'], 1))]
+        user_agent = random.choice(USER_AGENTS)
+        span = (session_end - session_start).total_seconds()
+        rows = []
+        for _ in range(count):
+            pool = ANOMALOUS_ACTIONS if anomalous and random.random() < 0.5 else NORMAL_ACTIONS
+            action, method, path, status = random.choice(pool)
+            document = random.choice(documents) if '{id}' in path else ''
+            if random.random() < profile['error_rate']:
+                status = random.choice(ERROR_STATUSES)
+            rows.append((
+                uuid.uuid4(), user.pk, action, 'document' if document else 'system',
+                'Document' if document else '', document, random.choice(ips), user_agent,
+                method, path.replace('{id}', document), status,
+                session_start + timedelta(seconds=span * random.random()),
+            ))
+        return rows
+
+    @staticmethod
+    def _write_logs(rows):
+        if not rows:
+            return 0
+        if connection.vendor == 'postgresql':
+            # COPY is an order of magnitude faster than INSERT at tens of millions of rows
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in rows:
+                writer.writerow(row[:11] + ('{"benchmark": true}', '{}', row[11].isoformat()))
+            buffer.seek(0)
+            columns = ', '.join(ActivityLog._meta.get_field(name).column for name in LOG_FIELDS)
+            with connection.cursor() as cursor:
+                # In CSV mode an unquoted empty field is NULL by default; resource_type and
+                # resource_id are NOT NULL and mostly empty, so only \N means NULL here
+                cursor.copy_expert(
+                    f"COPY {ActivityLog._meta.db_table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                    buffer,
+                )
+        else:
+            with _DisableAutoNowAdd(ActivityLog, 'created_at'):
+                ActivityLog.objects.bulk_create([
+                    ActivityLog(
+                        id=row[0], user_id=row[1], action=row[2], resource=row[3], resource_type=row[4],
+                        resource_id=row[5], ip_address=row[6], user_agent=row[7], request_method=row[8],
+                        request_path=row[9], response_status=row[10], details={'benchmark': True},
+                        created_at=row[11],
+                    )
+                    for row in rows
+                ], batch_size=5000)
+        return len(rows)
+
+    # --- Timed stages -----------------------------------------------------------
+
+    def _run_stages(self, user_ids, options):
+        from celery import current_app
+        from ai_security import engine as engine_module, registry
+        from ai_security.features import extract_user_features
+        from ai_security.feature_cache import get_feature_matrix
+        from ai_security.tasks import _explain_method, scan_recent_activity, train_isolation_forest
+
+        sample_ids = random.sample(user_ids, min(options['samples'], len(user_ids)))
+        sample_users = list(CustomUser.objects.filter(pk__in=sample_ids))
+        runs = range(options['repeat'])
+        results = {}
+
+        def train(_):
+            result = train_isolation_forest.apply().get()
+            if result['status'] != 'success':
+                raise CommandError(f'Training did not succeed: {result}')
+
+        def scan(_):
+            # Every run scores the same activity; its reports are rolled back
+            with transaction.atomic():
+                scan_recent_activity.apply().get()
+                transaction.set_rollback(True)
+
+        eager = current_app.conf.task_always_eager
+        with tempfile.TemporaryDirectory() as model_dir, \
+                patch.object(engine_module, 'MODEL_DIR', model_dir), \
+                patch('ai_security.model_store.cache_dir', return_value=os.path.join(model_dir, 'store')), \
+                patch('ai_security.response.AnomalyResponseHandler.send_alerts'):
+            # Scan batches run inline instead of being sent to workers
+            current_app.conf.task_always_eager = True
+            try:
+                with transaction.atomic():
+                    results['extract_user_features'] = _measure(
+                        lambda user: extract_user_features(user, hours=1), sample_users,
+                    )
+                    self.stdout.write('  extract_user_features done')
+                    results['train_isolation_forest'] = _measure(train, runs)
+                    self.stdout.write('  train_isolation_forest done')
+                    results['scan_recent_activity'] = _measure(scan, runs)
+                    self.stdout.write('  scan_recent_activity done')
+
+                    engine = registry.get_active_engine()
+                    _, matrix = get_feature_matrix(hours=24, user_ids=sample_ids)
+                    method = _explain_method()
+                    results['explain_features'] = _measure(
+                        lambda row: engine.explain_features(row.tolist(), method=method), matrix,
+                    )
+                    transaction.set_rollback(True)
+            finally:
+                current_app.conf.task_always_eager = eager
+                registry.clear()
+        return results
+
+    # --- Reporting --------------------------------------------------------------
+
+    def _print(self, report):
+        meta = report['meta']
+        self.stdout.write(f'{meta["users"]} users, {meta["logs"]} logs on {meta["database"]}')
+        self.stdout.write(
+            f'{"stage":<24} {"runs":>5} {"p50 ms":>10} {"p95 ms":>10} {"queries":>8} {"peak RSS MB":>12}'
+        )
+        for stage in STAGES:
+            r = report['results'][stage]
+            self.stdout.write(
+                f'{stage:<24} {r["runs"]:>5} {r["p50_ms"]:>10.2f} {r["p95_ms"]:>10.2f} '
+                f'{r["queries"]:>8} {r["peak_rss_mb"]:>12.1f}'
+            )
+
+    def _compare(self, report, options):
+        with open(options['compare']) as f:
+            baseline = json.load(f)
+        for key in ('users', 'logs', 'database'):
+            if baseline['meta'].get(key) != report['meta'][key]:
+                self.stdout.write(self.style.WARNING(
+                    f'Baseline {key} differs: {baseline["meta"].get(key)} vs {report["meta"][key]}'
+                ))
+
+        limit = 1 + options['tolerance']
+        regressions = []
+        self.stdout.write(f'{"stage":<24} {"p50 change":>11} {"p95 change":>11} {"queries":>12}')
+        for stage in STAGES:
+            current, base = report['results'][stage], baseline['results'].get(stage)
+            if not base:
+                continue
+            p50 = current['p50_ms'] / base['p50_ms'] if base['p50_ms'] else 1.0
+            p95 = current['p95_ms'] / base['p95_ms'] if base['p95_ms'] else 1.0
+            slower = p50 > limit or p95 > limit or current['queries'] > base['queries']
+            if slower:
+                regressions.append(stage)
+            line = (
+                f'{stage:<24} {(p50 - 1) * 100:>+10.1f}% {(p95 - 1) * 100:>+10.1f}% '
+                f'{base["queries"]:>5} -> {current["queries"]:<4}'
+            )
+            self.stdout.write(self.style.ERROR(line) if slower else line)
+
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+        elif options['fail_on_regression']:
+            raise CommandError(f'Regressions against the baseline: {", ".join(regressions)}')
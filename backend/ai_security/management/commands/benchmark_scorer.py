@@ -0,0 +1,41 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from ai_security.engine import IsolationForestEngine
+from ai_security.features import FEATURE_NAMES
+from ai_security.scorer import CompiledForest
+
+
+class Command(BaseCommand):
+    help = 'Compare sklearn and compiled numpy IsolationForest scoring latency on synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=5000, help='Training rows')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs per batch size')
+        parser.add_argument('--batch-sizes', default='1,10,100,1000', help='Comma-separated batch sizes')
+
+    def handle(self, *args, **options):
+        rng = np.random.RandomState(42)
+        engine = IsolationForestEngine()
+        engine.train(rng.lognormal(size=(options['samples'], len(FEATURE_NAMES))))
+        compiled = CompiledForest.from_model(engine.model, engine.scaler)
+
+        def sklearn_score(X):
+            return engine.model.decision_function(engine.scaler.transform(X))
+
+        self.stdout.write(f'{"batch":>8} {"sklearn ms":>12} {"compiled ms":>12} {"speedup":>8} {"max diff":>10}')
+        for size in [int(s) for s in options['batch_sizes'].split(',')]:
+            X = rng.lognormal(size=(size, len(FEATURE_NAMES)))
+            timings = []
+            for score in (sklearn_score, compiled.decision_function):
+                score(X)  # warm up
+                start = time.perf_counter()
+                for _ in range(options['repeat']):
+                    score(X)
+                timings.append((time.perf_counter() - start) / options['repeat'] * 1000)
+            diff = float(np.abs(sklearn_score(X) - compiled.decision_function(X)).max())
+            self.stdout.write(
+                f'{size:>8} {timings[0]:>12.3f} {timings[1]:>12.3f} {timings[0] / timings[1]:>7.1f}x {diff:>10.1e}'
+            )
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_security import sweep
+from ai_security.models import AIModelConfig
+
+
+class Command(BaseCommand):
+    help = 'Evaluate the Isolation Forest parameter grid on labelled data and promote the best configuration'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', action='append', choices=['feedback', 'synthetic'],
+            help='Labelled data to use (repeatable; default: both)',
+        )
+        parser.add_argument('--n-jobs', type=int, default=-1, help='Configurations evaluated in parallel')
+        parser.add_argument('--test-size', type=float, default=0.3, help='Held-out share of the dataset')
+        parser.add_argument('--no-promote', action='store_true', help='Only record the results')
+
+    def handle(self, *args, **options):
+        sources = options['source'] or ('feedback', 'synthetic')
+        X, y = sweep.labelled_dataset(sources)
+        anomalies = int((y == -1).sum())
+        if len(X) < 50 or anomalies < 5:
+            raise CommandError(f'Not enough labelled data: {len(X)} rows, {anomalies} anomalies.')
+
+        parameters = AIModelConfig.objects.filter(
+            model_type='isolation_forest', is_active=True,
+        ).values_list('parameters', flat=True).first()
+        current = sweep.active_hyperparameters(parameters)
+        configurations = sweep.parameter_grid(
+            include=current, tune_contamination=sweep.tunes_contamination(sources),
+        )
+        self.stdout.write(f'{len(configurations)} configurations, {len(X)} rows ({anomalies} anomalies)')
+
+        start = time.perf_counter()
+        results = sweep.run_sweep(
+            X, y, configurations, n_jobs=options['n_jobs'], test_size=options['test_size'],
+        )
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f'{"contam.":>8} {"trees":>6} {"samples":>8} {"precision":>10} {"recall":>8} {"f1":>7} '
+            f'{"avg prec":>9} {"train ms":>9} {"us/row":>8}'
+        )
+        for result in results:
+            params = result['params']
+            marker = '  (current)' if params == current else ''
+            self.stdout.write(
+                f'{params["contamination"]:>8} {params["n_estimators"]:>6} {params["max_samples"]:>8} '
+                f'{result["precision"]:>10.3f} {result["recall"]:>8.3f} {result["f1_score"]:>7.3f} '
+                f'{result["average_precision"]:>9.3f} {result["train_ms"]:>9.1f} '
+                f'{result["score_us_per_row"]:>8.2f}{marker}'
+            )
+        self.stdout.write(f'Sweep finished in {elapsed:.1f}s')
+
+        _, promoted = sweep.record_sweep(results, samples=len(X), promote=not options['no_promote'])
+        if promoted:
+            self.stdout.write(self.style.SUCCESS(
+                f'Promoted {results[0]["params"]}; the next train_isolation_forest run uses it.'
+            ))
+        else:
+            self.stdout.write('Active hyperparameters kept.')
@@ -6,6 +6,7 @@ from datetime import timedelta
 from django.http import JsonResponse
 from django.utils import timezone
 
+from . import feature_store, streaming
 from .models import ActivityLog
 
 logger = logging.getLogger(__name__)
@@ -51,6 +52,10 @@ class _LogBuffer:
             )
         except Exception as e:
             logger.error('Failed to flush activity log buffer (%d items): %s', len(to_write), e)
+            return
+
+        feature_store.record_activity(to_write)
+        streaming.queue_update(to_write)
 
 
 _log_buffer = _LogBuffer()
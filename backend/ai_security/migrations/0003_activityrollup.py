@@ -0,0 +1,41 @@
+# Generated by Django 4.2.16 on 2026-10-18 00:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ai_security', '0002_add_database_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('bucket_start', models.DateTimeField()),
+                ('request_count', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('docs_accessed', models.PositiveIntegerField(default=0)),
+                ('share_actions', models.PositiveIntegerField(default=0)),
+                ('admin_actions', models.PositiveIntegerField(default=0)),
+                ('e2e_key_failures', models.PositiveIntegerField(default=0)),
+                ('first_at', models.DateTimeField(blank=True, null=True)),
+                ('last_at', models.DateTimeField(blank=True, null=True)),
+                ('by_method', models.JSONField(blank=True, default=dict)),
+                ('by_status', models.JSONField(blank=True, default=dict)),
+                ('endpoint_sketch', models.JSONField(blank=True, default=list)),
+                ('ip_sketch', models.JSONField(blank=True, default=list)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='activity_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-bucket_start'],
+                'indexes': [models.Index(fields=['bucket_start'], name='rollup_bucket_idx'), models.Index(fields=['user', 'bucket_start'], name='rollup_user_bucket_idx')],
+            },
+        ),
+    ]
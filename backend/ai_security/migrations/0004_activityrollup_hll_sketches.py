@@ -0,0 +1,37 @@
+# Generated by Django 4.2.16 on 2026-10-18 00:18
+
+from django.db import migrations, models
+
+
+def clear_rollups(apps, schema_editor):
+    # Old rows lack HLL sketches; rollup_activity_logs rebuilds them from raw logs
+    apps.get_model('ai_security', 'ActivityRollup').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_security', '0003_activityrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_rollups, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='activityrollup',
+            name='endpoint_sketch',
+        ),
+        migrations.RemoveField(
+            model_name='activityrollup',
+            name='ip_sketch',
+        ),
+        migrations.AddField(
+            model_name='activityrollup',
+            name='endpoint_hll',
+            field=models.BinaryField(blank=True, default=bytes),
+        ),
+        migrations.AddField(
+            model_name='activityrollup',
+            name='ip_hll',
+            field=models.BinaryField(blank=True, default=bytes),
+        ),
+    ]
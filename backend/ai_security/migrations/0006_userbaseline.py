@@ -0,0 +1,25 @@
+# Generated by Django 4.2.16 on 2026-10-18 01:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ai_security', '0005_modelblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserBaseline',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='behaviour_baseline', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('vector', models.BinaryField()),
+                ('observations', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,16 @@
+from . import realtime
+
+
+class RealtimeScoringMixin:
+    """Mixin for DRF views on sensitive actions: score the user inline after each successful request.
+
+    Does nothing unless AI_SECURITY['REALTIME_SCORING']['ENABLED'] and the
+    feature store are enabled.
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated and response.status_code < 400 and realtime.is_enabled():
+            realtime.check_user(user.pk)
+        return response
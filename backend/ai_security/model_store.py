@@ -0,0 +1,135 @@
+"""
+Content-addressed store for model bundles shared by every node.
+
+A trained bundle is stored once in the database (ModelBlob) under the sha256
+of its bytes, and AIModelConfig.model_file_path holds the ``sha256:<hex>``
+reference. Each node keeps the bundles it loads in a local cache directory
+and pulls a missing one from the database the first time it is asked for.
+A digest names immutable content, so cached files never go stale.
+"""
+import glob
+import hashlib
+import logging
+import os
+import re
+
+from django.conf import settings
+
+from .engine import MAX_MODEL_VERSIONS, atomic_write
+from .models import AIModelConfig, ModelBlob
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_PREFIX = 'sha256:'
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def _config():
+    return getattr(settings, 'AI_SECURITY', {}).get('MODEL_STORE', {})
+
+
+def cache_dir():
+    return _config().get('CACHE_DIR') or os.path.join(settings.BASE_DIR, 'ml_models', 'store')
+
+
+def is_reference(value):
+    return bool(value) and value.startswith(REFERENCE_PREFIX)
+
+
+def is_stored(reference):
+    """True if ``reference`` is a well-formed ``sha256:`` reference to a blob in the store."""
+    if not is_reference(reference):
+        return False
+    digest = reference[len(REFERENCE_PREFIX):]
+    return bool(_DIGEST_RE.match(digest)) and ModelBlob.objects.filter(digest=digest).exists()
+
+
+def _cache_path(digest):
+    return os.path.join(cache_dir(), f'{digest}.joblib')
+
+
+def _write_cache(digest, data):
+    os.makedirs(cache_dir(), exist_ok=True)
+
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+    atomic_write(_cache_path(digest), write)
+
+    # Keep the most recently written bundles; other workers may be trimming too
+    cached = []
+    for path in glob.glob(os.path.join(cache_dir(), '*.joblib')):
+        try:
+            cached.append((os.path.getmtime(path), path))
+        except OSError:
+            continue
+    for _, old_file in sorted(cached, reverse=True)[MAX_MODEL_VERSIONS:]:
+        try:
+            os.remove(old_file)
+        except OSError as e:
+            logger.warning('Failed to remove cached model %s: %s', old_file, e)
+
+
+def put(filepath):
+    """Store the bundle at ``filepath`` and return its ``sha256:`` reference."""
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    _, created = ModelBlob.objects.get_or_create(
+        digest=digest, defaults={'data': data, 'size': len(data)},
+    )
+    if not os.path.exists(_cache_path(digest)):
+        _write_cache(digest, data)
+    if created:
+        logger.info('Stored model %s in the model store (%d bytes)', digest[:12], len(data))
+    return REFERENCE_PREFIX + digest
+
+
+def resolve(reference):
+    """Return a local path for ``reference``, pulling the bundle if this node lacks it.
+
+    Plain file paths (configs saved before the store existed) are returned
+    unchanged. Returns None if the blob is missing or fails verification.
+    """
+    if not is_reference(reference):
+        return reference
+    digest = reference[len(REFERENCE_PREFIX):]
+    if not _DIGEST_RE.match(digest):
+        logger.error('Invalid model reference: %s', reference)
+        return None
+
+    path = _cache_path(digest)
+    if os.path.exists(path):
+        return path
+
+    try:
+        data = ModelBlob.objects.filter(digest=digest).values_list('data', flat=True).first()
+    except Exception as e:
+        logger.error('Failed to fetch model %s from the model store: %s', digest[:12], e)
+        return None
+    if data is None:
+        logger.warning('Model %s not found in the model store', digest[:12])
+        return None
+    data = bytes(data)
+    if hashlib.sha256(data).hexdigest() != digest:
+        logger.error('Model %s failed digest verification', digest[:12])
+        return None
+
+    _write_cache(digest, data)
+    logger.info('Fetched model %s from the model store (%d bytes)', digest[:12], len(data))
+    return path
+
+
+def prune(keep=None):
+    """Delete blobs beyond the newest ``keep`` that no model config references."""
+    keep = keep if keep is not None else _config().get('KEEP_BLOBS', 2 * MAX_MODEL_VERSIONS)
+    referenced = {
+        ref[len(REFERENCE_PREFIX):]
+        for ref in AIModelConfig.objects.values_list('model_file_path', flat=True)
+        if is_reference(ref)
+    }
+    newest = set(ModelBlob.objects.values_list('digest', flat=True)[:keep])
+    deleted, _ = ModelBlob.objects.exclude(digest__in=referenced | newest).delete()
+    if deleted:
+        logger.info('Pruned %d model blobs', deleted)
+    return deleted
@@ -98,3 +98,65 @@ class AIModelConfig(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class ActivityRollup(models.Model):
+    """Per-user aggregate of ActivityLog rows over one fixed-width time bucket."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL,
+        null=True, blank=True, related_name='activity_rollups',
+    )
+    bucket_start = models.DateTimeField()
+    request_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    docs_accessed = models.PositiveIntegerField(default=0)
+    share_actions = models.PositiveIntegerField(default=0)
+    admin_actions = models.PositiveIntegerField(default=0)
+    e2e_key_failures = models.PositiveIntegerField(default=0)
+    first_at = models.DateTimeField(null=True, blank=True)
+    last_at = models.DateTimeField(null=True, blank=True)
+    by_method = models.JSONField(default=dict, blank=True)
+    by_status = models.JSONField(default=dict, blank=True)
+    # Serialized HyperLogLog sketches (see ai_security.hll) for endpoints and IPs
+    endpoint_hll = models.BinaryField(default=bytes, blank=True)
+    ip_hll = models.BinaryField(default=bytes, blank=True)
+
+    class Meta:
+        ordering = ['-bucket_start']
+        indexes = [
+            models.Index(fields=['bucket_start'], name='rollup_bucket_idx'),
+            models.Index(fields=['user', 'bucket_start'], name='rollup_user_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.bucket_start} - {self.request_count}'
+
+
+class ModelBlob(models.Model):
+    """Model bundle stored by content; ``digest`` is the sha256 of ``data``."""
+    digest = models.CharField(max_length=64, primary_key=True)
+    data = models.BinaryField()
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'sha256:{self.digest}'
+
+
+class UserBaseline(models.Model):
+    """Exponentially weighted per-feature mean and variance of one user's vectors (see ai_security.baselines)."""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        primary_key=True, related_name='behaviour_baseline',
+    )
+    # float32 array: FEATURE_NAMES means followed by their variances
+    vector = models.BinaryField()
+    observations = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.user} - {self.observations}'
@@ -0,0 +1,115 @@
+"""
+Inline anomaly scoring for sensitive endpoints.
+
+Views using RealtimeScoringMixin score the requesting user right after the
+request, from the 1-hour vector the feature store precomputes on every write
+(one GET under a socket timeout) and the in-process model (registry +
+compiled scorer). The inline path has a latency budget of about a
+millisecond; if it runs out, scoring is handed to the realtime_anomaly_check
+task instead. Critical scores are always acted on in that task, so the
+request never waits for reports or alerts. At most one task per user is
+queued every DEFER_SECONDS, however many requests the user makes.
+"""
+import logging
+import time
+
+import numpy as np
+from django.conf import settings
+
+from . import feature_store
+
+logger = logging.getLogger(__name__)
+
+# How long a process trusts its cached active model path
+ACTIVE_MODEL_TTL = 30
+DEFERRED_KEY_PREFIX = 'ai:rt:queued'
+
+_client = None
+_active_model = {'path': None, 'checked_at': None}
+
+
+def _config():
+    return getattr(settings, 'AI_SECURITY', {}).get('REALTIME_SCORING', {})
+
+
+def is_enabled():
+    return bool(_config().get('ENABLED', False)) and feature_store.is_enabled()
+
+
+def _get_client():
+    """Redis client whose timeouts bound the inline read, unlike the shared one."""
+    global _client
+    if _client is None:
+        import redis
+        timeout = float(_config().get('SOCKET_TIMEOUT', 0.05))
+        url = feature_store._config().get('URL') or settings.CELERY_BROKER_URL
+        _client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+    return _client
+
+
+def _active_model_path():
+    from .registry import active_model_path
+
+    now = time.monotonic()
+    checked_at = _active_model['checked_at']
+    if checked_at is None or now - checked_at > ACTIVE_MODEL_TTL:
+        _active_model['path'] = active_model_path()
+        _active_model['checked_at'] = now
+    return _active_model['path']
+
+
+def score_user(user_id):
+    """Score a user's precomputed 1-hour vector inline.
+
+    Returns a dict whose 'status' is 'scored' (with 'score' and 'vector'),
+    'deferred' when the budget ran out before scoring, or 'skipped'.
+    """
+    from . import registry
+
+    start = time.perf_counter()
+    budget = float(_config().get('BUDGET_MS', 1.0)) / 1000.0
+
+    path = _active_model_path()
+    engine = registry.get_engine(path) if path else None
+    if engine is None:
+        return {'status': 'skipped', 'reason': 'no_model'}
+
+    try:
+        vector = feature_store.get_vector(user_id, client=_get_client())
+    except Exception as e:
+        logger.warning('Real-time feature read failed for user %s: %s', user_id, e)
+        return {'status': 'skipped', 'reason': 'no_features'}
+    if vector is None or not vector.any():
+        return {'status': 'skipped', 'reason': 'no_activity'}
+    if time.perf_counter() - start > budget:
+        return {'status': 'deferred'}
+
+    score = float(engine.predict_normalized_batch(vector[np.newaxis, :])[0])
+    return {'status': 'scored', 'score': score, 'vector': vector}
+
+
+def _claim_check(user_id):
+    """True if no realtime_anomaly_check was queued for ``user_id`` within DEFER_SECONDS."""
+    seconds = int(_config().get('DEFER_SECONDS', 60))
+    return bool(_get_client().set(f'{DEFERRED_KEY_PREFIX}:{user_id}', 1, nx=True, ex=seconds))
+
+
+def check_user(user_id):
+    """Score a user and hand critical or deferred cases to Celery. Never raises."""
+    from .features import vector_to_features
+    from .response import AnomalyResponseHandler
+    from .tasks import realtime_anomaly_check
+
+    try:
+        result = score_user(user_id)
+        critical = result['status'] == 'scored' and result['score'] >= AnomalyResponseHandler.CRITICAL_THRESHOLD
+        if (result['status'] == 'deferred' or critical) and not _claim_check(user_id):
+            return {**result, 'queued': False}
+        if result['status'] == 'deferred':
+            realtime_anomaly_check.delay(str(user_id))
+        elif critical:
+            realtime_anomaly_check.delay(str(user_id), result['score'], vector_to_features(result['vector']))
+        return result
+    except Exception as e:
+        logger.error('Real-time scoring failed for user %s: %s', user_id, e)
+        return {'status': 'skipped', 'reason': 'error'}
@@ -0,0 +1,102 @@
+"""
+Per-process registry of loaded anomaly models.
+
+Engines are loaded once per process and reused across tasks and requests.
+Each lookup stats the model bundle; when a new version lands the replacement
+is loaded first and then swapped in, so callers always get a complete engine.
+Bundles are loaded with mmap_mode='r', so the processes on a node share the
+page cache for the compiled scorer's arrays. The sklearn estimators (and the
+trees' node arrays, which sklearn copies when unpickling) are still private
+to each process. ``sha256:`` references are resolved
+through the model store, which pulls bundles this node has not cached yet.
+"""
+import logging
+import os
+import threading
+
+from django.conf import settings
+
+from . import engine as engine_module
+from . import model_store, streaming
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_engines = {}  # filepath or reference -> (signature, engine)
+
+
+def max_cached_models():
+    """The active model, a newly trained one and the shadow models (AI_SECURITY['SHADOW']['MAX_MODELS'])."""
+    return 2 + int(getattr(settings, 'AI_SECURITY', {}).get('SHADOW', {}).get('MAX_MODELS', 2))
+
+
+def _signature(filepath):
+    """Cheap change marker for a model bundle; bundles are replaced by rename."""
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def get_engine(filepath=None):
+    """Return the loaded engine for ``filepath``, reloading it if the file changed.
+
+    ``filepath`` may also be a model store reference, or streaming.REFERENCE
+    for the shared Half-Space Trees detector. Returns None if the model
+    cannot be loaded and no earlier version of it is cached.
+    """
+    if filepath == streaming.REFERENCE:
+        return streaming.get_engine()
+    filepath = filepath or engine_module.latest_path()
+    path = model_store.resolve(filepath)
+    signature = _signature(path) if path else None
+    cached = _engines.get(filepath)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    with _lock:
+        cached = _engines.get(filepath)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        engine = engine_module.IsolationForestEngine()
+        if not path or not engine.load(path, mmap_mode='r'):
+            if cached is not None:
+                # Keep serving the previous version, e.g. while a save is in progress
+                logger.warning('Reloading %s failed; keeping the loaded version.', filepath)
+                return cached[1]
+            return None
+
+        _engines.pop(filepath, None)
+        _engines[filepath] = (signature, engine)
+        while len(_engines) > max_cached_models():
+            _engines.pop(next(iter(_engines)))
+        logger.info('Model registry loaded %s', filepath)
+        return engine
+
+
+def active_model_path():
+    """Model reference scans and inline scoring use, or None.
+
+    The streaming detector when AI_SECURITY['DETECTOR'] selects it, otherwise
+    the active Isolation Forest config.
+    """
+    from .models import AIModelConfig
+
+    if streaming.is_selected():
+        return streaming.REFERENCE
+    return AIModelConfig.objects.filter(
+        model_type='isolation_forest', is_active=True,
+    ).values_list('model_file_path', flat=True).first() or None
+
+
+def get_active_engine():
+    """Return the engine scans and inline scoring use, or None."""
+    path = active_model_path()
+    return get_engine(path) if path else None
+
+
+def clear():
+    with _lock:
+        _engines.clear()
@@ -0,0 +1,91 @@
+"""
+Event-driven rescoring of the users whose activity changed.
+
+As the feature store ingests events, their users are marked dirty in a Redis
+sorted set whose score is a priority: every event adds its weight, and
+errors, admin writes, e2e key failures, failed logins or sensitive document
+access weigh far more than plain requests. The rescore_dirty_users task runs
+every few seconds, pops the highest-priority users up to a per-tick budget
+and scores only them, so idle users cost nothing and risky bursts are scored
+within a tick instead of at the next 15-minute scan.
+"""
+import logging
+
+from django.conf import settings
+
+from . import feature_store
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'ai:rescore'
+DIRTY_KEY = f'{KEY_PREFIX}:dirty'
+LOCK_KEY = f'{KEY_PREFIX}:lock'
+
+# Priority added per unit of each feature-store counter
+COUNTER_WEIGHTS = {
+    'requests': 1,
+    'docs_accessed': 1,
+    'docs_downloaded': 2,
+    'errors': 3,
+    'share_actions': 3,
+    'admin_actions': 5,
+    'e2e_key_failures': 5,
+    'failed_logins': 5,
+    'sensitive_docs_accessed': 5,
+}
+PASSWORD_RESET_WEIGHT = 5
+
+
+def _config():
+    return getattr(settings, 'AI_SECURITY', {}).get('RESCORING', {})
+
+
+def is_enabled():
+    return bool(_config().get('ENABLED', False)) and feature_store.is_enabled()
+
+
+def budget():
+    return int(_config().get('BUDGET', 500))
+
+
+def priorities(acc):
+    """Priority increments per user id for accumulated feature-store buckets. Pure function."""
+    result = {}
+    for (user_id, _), b in acc.items():
+        weight = sum(COUNTER_WEIGHTS.get(name, 1) * amount for name, amount in b['counters'].items())
+        if b['reset'] is not None:
+            weight += PASSWORD_RESET_WEIGHT
+        if weight:
+            result[user_id] = result.get(user_id, 0) + weight
+    return result
+
+
+def mark_dirty(pipe, acc):
+    """Queue the users of ``acc`` for rescoring on a feature-store write pipeline."""
+    for user_id, weight in priorities(acc).items():
+        pipe.zincrby(DIRTY_KEY, weight, user_id)
+
+
+def pop_dirty(count, client=None):
+    """Remove and return up to ``count`` ``(user_id, priority)`` pairs, highest priority first."""
+    client = client or feature_store.get_client()
+    return [
+        (member.decode() if isinstance(member, bytes) else member, score)
+        for member, score in client.zpopmax(DIRTY_KEY, count)
+    ]
+
+
+def requeue(entries, client=None):
+    """Put popped ``(user_id, priority)`` pairs back, e.g. after a failed tick."""
+    if not entries:
+        return
+    client = client or feature_store.get_client()
+    pipe = client.pipeline(transaction=False)
+    for user_id, priority in entries:
+        pipe.zincrby(DIRTY_KEY, priority, user_id)
+    pipe.execute()
+
+
+def pending(client=None):
+    client = client or feature_store.get_client()
+    return client.zcard(DIRTY_KEY)
@@ -14,77 +14,126 @@ class AnomalyResponseHandler:
     @classmethod
     def handle_anomaly(cls, score, user, features=None):
         """Take action based on anomaly score (0.0 to 1.0 scale, higher = more anomalous)."""
-        if score >= cls.CRITICAL_THRESHOLD:
-            cls._handle_critical(user, score, features)
-        elif score >= cls.WARNING_THRESHOLD:
-            cls._handle_warning(user, score, features)
-        else:
-            logger.debug('Normal behavior for %s (score: %.4f)', user.email, score)
+        cls.handle_anomalies([(score, user, features)])
 
     @classmethod
-    def _handle_critical(cls, user, score, features):
-        """Critical anomaly: block sessions + alert admins + log."""
-        logger.critical('CRITICAL anomaly for %s (score: %.4f)', user.email, score)
-        cls.block_user_sessions(user)
-        cls.send_alert(user, score, features, severity='critical')
+    def handle_anomalies(cls, anomalies):
+        """Batch form of handle_anomaly for ``(score, user, features)`` tuples.
+
+        Critical users' sessions are blocked with one UPDATE and all alerts go
+        out together (see send_alerts), so the cost of a burst of anomalies
+        does not grow with its size in queries.
+        """
+        critical, alerts = [], []
+        for score, user, features in anomalies:
+            if score >= cls.CRITICAL_THRESHOLD:
+                logger.critical('CRITICAL anomaly for %s (score: %.4f)', user.email, score)
+                critical.append(user)
+                alerts.append((user, score, features, 'critical'))
+            elif score >= cls.WARNING_THRESHOLD:
+                logger.warning('WARNING anomaly for %s (score: %.4f)', user.email, score)
+                alerts.append((user, score, features, 'high'))
+            else:
+                logger.debug('Normal behavior for %s (score: %.4f)', user.email, score)
+
+        # Critical anomaly: block sessions + alert admins; warning: alert admins only
+        if critical:
+            cls.block_sessions(critical)
+        if alerts:
+            cls.send_alerts(alerts)
 
     @classmethod
-    def _handle_warning(cls, user, score, features):
-        """Warning level: alert admins but don't block."""
-        logger.warning('WARNING anomaly for %s (score: %.4f)', user.email, score)
-        cls.send_alert(user, score, features, severity='high')
+    def block_user_sessions(cls, user):
+        """Deactivate all user sessions (force re-login)."""
+        return cls.block_sessions([user])
 
     @staticmethod
-    def block_user_sessions(user):
-        """Deactivate all user sessions (force re-login)."""
+    def block_sessions(users):
+        """Deactivate the active sessions of all ``users`` in one query."""
         from accounts.models import UserSession
 
-        count = UserSession.objects.filter(user=user, is_active=True).update(
+        count = UserSession.objects.filter(user__in=users, is_active=True).update(
             is_active=False,
         )
-        logger.info('Blocked %d active sessions for %s', count, user.email)
+        logger.info(
+            'Blocked %d active sessions for %s', count,
+            users[0].email if len(users) == 1 else f'{len(users)} users',
+        )
         return count
 
-    @staticmethod
-    def send_alert(user, score, features, severity='high'):
+    @classmethod
+    def send_alert(cls, user, score, features, severity='high'):
         """Send alerts to all admin users via notifications + telegram."""
+        cls.send_alerts([(user, score, features, severity)])
+
+    @staticmethod
+    def _feature_summary(features):
+        if not features:
+            return ''
+        sorted_features = sorted(features.items(), key=lambda x: abs(x[1]) if isinstance(x[1], (int, float)) else 0, reverse=True)
+        return ', '.join(f'{k}: {v}' for k, v in sorted_features[:3])
+
+    @classmethod
+    def send_alerts(cls, alerts):
+        """Alert all admins about ``(user, score, features, severity)`` tuples.
+
+        Every alert becomes an in-app notification per admin (one bulk
+        insert); each admin gets a single email covering the whole batch.
+        """
         from accounts.models import CustomUser, Role
         from notifications.models import Notification
 
-        admins = CustomUser.objects.filter(
+        admins = list(CustomUser.objects.filter(
             role__name__in=[Role.SUPER_ADMIN],
             is_active=True,
-        )
+        ))
+        if not admins:
+            return
 
-        feature_summary = ''
-        if features:
-            sorted_features = sorted(features.items(), key=lambda x: abs(x[1]) if isinstance(x[1], (int, float)) else 0, reverse=True)
-            feature_summary = ', '.join(f'{k}: {v}' for k, v in sorted_features[:3])
-
-        for admin in admins:
-            Notification.objects.create(
+        summaries = [cls._feature_summary(features) for _, _, features, _ in alerts]
+        Notification.objects.bulk_create([
+            Notification(
                 recipient=admin,
                 title=f'AI Alert: {severity.upper()} anomaly detected',
                 message=(
                     f'User {user.email} anomaly score: {score:.4f}. '
-                    f'Top features: {feature_summary}'
+                    f'Top features: {summary}'
                 ),
                 notification_type='alert',
             )
+            for (user, score, _, severity), summary in zip(alerts, summaries)
+            for admin in admins
+        ])
+
+        if len(alerts) == 1:
+            (user, score, _, severity), = alerts
+            subject = f'AI Anomaly Alert: {severity.upper()}'
+            message = (
+                f'Foydalanuvchi: {user.email}\n'
+                f'Anomaliya balli: {score:.4f}\n'
+                f'Darajasi: {severity.upper()}\n'
+                f'Asosiy ko\'rsatkichlar: {summaries[0]}\n\n'
+                f'Iltimos, tizimga kirib tekshiring.'
+            )
+        else:
+            worst = 'critical' if any(alert[3] == 'critical' for alert in alerts) else 'high'
+            subject = f'AI Anomaly Alert: {worst.upper()} ({len(alerts)})'
+            lines = [
+                f'{user.email}: {score:.4f} ({severity.upper()}) - {summary}'
+                for (user, score, _, severity), summary in sorted(
+                    zip(alerts, summaries), key=lambda item: item[0][1], reverse=True,
+                )
+            ]
+            message = (
+                f'Aniqlangan anomaliyalar: {len(alerts)}\n\n'
+                + '\n'.join(lines)
+                + '\n\nIltimos, tizimga kirib tekshiring.'
+            )
 
         # TZ: Email alert to admins
         try:
             from notifications.tasks import send_notification_email
             for admin in admins:
-                send_notification_email.delay(
-                    admin.email,
-                    f'AI Anomaly Alert: {severity.upper()}',
-                    f'Foydalanuvchi: {user.email}\n'
-                    f'Anomaliya balli: {score:.4f}\n'
-                    f'Darajasi: {severity.upper()}\n'
-                    f'Asosiy ko\'rsatkichlar: {feature_summary}\n\n'
-                    f'Iltimos, tizimga kirib tekshiring.',
-                )
+                send_notification_email.delay(admin.email, subject, message)
         except Exception as e:
             logger.error('Failed to send email alert: %s', e)
-
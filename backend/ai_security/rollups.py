@@ -0,0 +1,298 @@
+"""
+Time-bucketed ActivityLog rollups.
+
+ActivityLog rows are folded into per-user, BUCKET_SECONDS-wide ActivityRollup
+rows by the rollup_activity_logs task. Readers combine rollup rows for the
+closed buckets below the watermark with raw ActivityLog rows after it, so
+windowed features and reports sum a few bucket rows instead of scanning the
+raw log table.
+"""
+import logging
+import re
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .hll import HyperLogLog
+from .models import ActivityLog, ActivityRollup
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SECONDS = 300
+# Buckets are only rolled up once they are older than this, so late buffer flushes land in raw logs
+ROLLUP_GRACE_SECONDS = 60
+# Upper bound on the history processed by one task run while catching up
+MAX_ROLLUP_RANGE = timedelta(days=1)
+
+ADMIN_PATH_RE = r'/(users|ip-restrictions)/'
+_ADMIN_PATH = re.compile(ADMIN_PATH_RE)
+ADMIN_METHODS = ('POST', 'PATCH', 'DELETE')
+COUNTER_FIELDS = (
+    'request_count', 'error_count', 'docs_accessed',
+    'share_actions', 'admin_actions', 'e2e_key_failures',
+)
+
+
+def bucket_floor(dt):
+    epoch = int(dt.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % BUCKET_SECONDS, tz=dt_timezone.utc)
+
+
+def bucket_ceil(dt):
+    floor = bucket_floor(dt)
+    return floor if floor == dt else floor + timedelta(seconds=BUCKET_SECONDS)
+
+
+def rollup_watermark():
+    """End of the newest rolled-up bucket, or None if nothing is rolled up yet."""
+    latest = ActivityRollup.objects.aggregate(latest=Max('bucket_start'))['latest']
+    if latest is None:
+        return None
+    return latest + timedelta(seconds=BUCKET_SECONDS)
+
+
+def covered_range(start, end):
+    """Return the bucket-aligned (lo, hi) part of [start, end) served by rollups, or None.
+
+    ``start``/``end`` may be None for an open range. Everything outside
+    [lo, hi) must be read from raw ActivityLog rows.
+    """
+    watermark = rollup_watermark()
+    if watermark is None:
+        return None
+    if start is None:
+        lo = ActivityRollup.objects.aggregate(first=Min('bucket_start'))['first']
+    else:
+        lo = bucket_ceil(start)
+    hi = watermark if end is None else min(bucket_floor(end), watermark)
+    if lo is None or lo >= hi:
+        return None
+    return lo, hi
+
+
+# --- Maintenance --------------------------------------------------------------
+
+def build_rollups(rows):
+    """Aggregate ActivityLog value tuples into ActivityRollup instances. Pure function.
+
+    ``rows`` yields (user_id, created_at, request_path, request_method,
+    response_status, ip_address) tuples.
+    """
+    buckets = {}
+    for user_id, created_at, path, method, status, ip in rows:
+        slot = (user_id, bucket_floor(created_at))
+        b = buckets.get(slot)
+        if b is None:
+            b = buckets[slot] = {
+                'counters': Counter(), 'methods': Counter(), 'statuses': Counter(),
+                'endpoints': HyperLogLog(), 'ips': HyperLogLog(),
+                'first': created_at, 'last': created_at,
+            }
+        path = path or ''
+        method = method or ''
+        status = status or 0
+        counters = b['counters']
+        counters['request_count'] += 1
+        if status >= 400:
+            counters['error_count'] += 1
+        if '/documents/' in path:
+            counters['docs_accessed'] += 1
+        if '/share/' in path and method == 'POST':
+            counters['share_actions'] += 1
+        if method in ADMIN_METHODS and _ADMIN_PATH.search(path):
+            counters['admin_actions'] += 1
+        if '/e2e/' in path and status >= 400:
+            counters['e2e_key_failures'] += 1
+        b['methods'][method or 'N/A'] += 1
+        b['statuses'][f'{status // 100}xx'] += 1
+        b['endpoints'].add(path)
+        b['ips'].add(ip)
+        b['first'] = min(b['first'], created_at)
+        b['last'] = max(b['last'], created_at)
+
+    return [
+        ActivityRollup(
+            user_id=user_id,
+            bucket_start=bucket_start,
+            first_at=b['first'],
+            last_at=b['last'],
+            by_method=dict(b['methods']),
+            by_status=dict(b['statuses']),
+            endpoint_hll=b['endpoints'].to_bytes(),
+            ip_hll=b['ips'].to_bytes(),
+            **{field: b['counters'][field] for field in COUNTER_FIELDS},
+        )
+        for (user_id, bucket_start), b in buckets.items()
+    ]
+
+
+def rollup_range(start, end):
+    """(Re)build rollup rows for the buckets in [start, end). Idempotent."""
+    rows = ActivityLog.objects.filter(
+        created_at__gte=start, created_at__lt=end,
+    ).order_by().values_list(
+        'user_id', 'created_at', 'request_path', 'request_method', 'response_status', 'ip_address',
+    ).iterator(chunk_size=5000)
+    rollups = build_rollups(rows)
+    with transaction.atomic():
+        ActivityRollup.objects.filter(bucket_start__gte=start, bucket_start__lt=end).delete()
+        ActivityRollup.objects.bulk_create(rollups, batch_size=1000)
+    return len(rollups)
+
+
+def rollup_pending():
+    """Roll up all closed buckets after the watermark (bounded by MAX_ROLLUP_RANGE)."""
+    end = bucket_floor(timezone.now() - timedelta(seconds=ROLLUP_GRACE_SECONDS))
+    start = rollup_watermark()
+    # Skip over periods without any logs (including the very first run)
+    next_log = ActivityLog.objects.filter(
+        **({'created_at__gte': start} if start else {}),
+    ).order_by('created_at').values_list('created_at', flat=True).first()
+    if next_log is None:
+        return {'buckets': 0, 'start': None, 'end': None}
+    start = max(start, bucket_floor(next_log)) if start else bucket_floor(next_log)
+    end = min(end, start + MAX_ROLLUP_RANGE)
+    if start >= end:
+        return {'buckets': 0, 'start': None, 'end': None}
+    created = rollup_range(start, end)
+    return {'buckets': created, 'start': start.isoformat(), 'end': end.isoformat()}
+
+
+# --- Readers ------------------------------------------------------------------
+
+def user_activity(since, now, user_filter):
+    """Per-user ActivityLog aggregates over [since, now).
+
+    Returns {user_id: {counter fields..., 'first_at', 'last_at', 'endpoints',
+    'ips'}} where 'endpoints'/'ips' are distinct counts. Closed buckets come
+    from rollups and the window start is aligned down to a bucket boundary in
+    that case; the tail after the watermark is read from raw logs.
+    """
+    covered = covered_range(bucket_floor(since), now)
+    result = {}
+
+    def entry(user_id):
+        item = result.get(user_id)
+        if item is None:
+            item = result[user_id] = {
+                **{field: 0 for field in COUNTER_FIELDS},
+                'first_at': None, 'last_at': None,
+                'endpoints': HyperLogLog(), 'ips': HyperLogLog(), 'endpoint_count': 0, 'ip_count': 0,
+            }
+        return item
+
+    if covered:
+        lo, raw_start = covered
+        rollups = ActivityRollup.objects.filter(
+            bucket_start__gte=lo, bucket_start__lt=raw_start, **user_filter,
+        ).order_by().values_list('user_id', 'first_at', 'last_at', 'endpoint_hll', 'ip_hll',
+                                 *COUNTER_FIELDS)
+        for user_id, first_at, last_at, endpoints, ips, *counts in rollups:
+            item = entry(user_id)
+            for field, value in zip(COUNTER_FIELDS, counts):
+                item[field] += value
+            item['first_at'] = first_at if item['first_at'] is None else min(item['first_at'], first_at)
+            item['last_at'] = last_at if item['last_at'] is None else max(item['last_at'], last_at)
+            item['endpoints'].merge(endpoints)
+            item['ips'].merge(ips)
+    else:
+        raw_start = since
+
+    raw = ActivityLog.objects.filter(created_at__gte=raw_start, **user_filter)
+    grouped = raw.values('user').annotate(
+        request_count=Count('id'),
+        docs_accessed=Count('id', filter=Q(request_path__contains='/documents/')),
+        error_count=Count('id', filter=Q(response_status__gte=400)),
+        share_actions=Count('id', filter=Q(request_path__contains='/share/', request_method='POST')),
+        admin_actions=Count('id', filter=Q(
+            request_path__regex=ADMIN_PATH_RE, request_method__in=ADMIN_METHODS,
+        )),
+        e2e_key_failures=Count('id', filter=Q(request_path__contains='/e2e/', response_status__gte=400)),
+        first_at=Min('created_at'),
+        last_at=Max('created_at'),
+        endpoint_count=Count('request_path', distinct=True),
+        ip_count=Count('ip_address', distinct=True),
+        null_ips=Count('id', filter=Q(ip_address__isnull=True)),
+    )
+    for row in grouped:
+        item = entry(row['user'])
+        for field in COUNTER_FIELDS:
+            item[field] += row[field]
+        item['first_at'] = row['first_at'] if item['first_at'] is None else min(item['first_at'], row['first_at'])
+        item['last_at'] = row['last_at'] if item['last_at'] is None else max(item['last_at'], row['last_at'])
+        # COUNT(DISTINCT) skips NULL; the per-user query counts it as one value
+        item['endpoint_count'] = row['endpoint_count']
+        item['ip_count'] = row['ip_count'] + (1 if row['null_ips'] else 0)
+
+    if covered:
+        # Distinct values must be merged into the rollup sketches, not added
+        for user_id, path, ip in raw.order_by().values_list('user_id', 'request_path', 'ip_address').distinct():
+            item = entry(user_id)
+            item['endpoints'].add(path)
+            item['ips'].add(ip)
+        for item in result.values():
+            item['endpoint_count'] = item['endpoints'].count()
+            item['ip_count'] = item['ips'].count()
+
+    for item in result.values():
+        item['endpoints'] = item.pop('endpoint_count')
+        item['ips'] = item.pop('ip_count')
+    return result
+
+
+def request_breakdown(date_from=None, date_to=None):
+    """Total requests plus per-method and per-status-group counts for a period."""
+    by_method = Counter()
+    by_status = Counter()
+    total = 0
+    covered = covered_range(date_from, date_to)
+
+    raw = ActivityLog.objects.all()
+    if covered:
+        lo, hi = covered
+        for methods, statuses, count in ActivityRollup.objects.filter(
+            bucket_start__gte=lo, bucket_start__lt=hi,
+        ).order_by().values_list('by_method', 'by_status', 'request_count'):
+            by_method.update(methods)
+            by_status.update(statuses)
+            total += count
+        raw = raw.filter(Q(created_at__lt=lo) | Q(created_at__gte=hi))
+    if date_from:
+        raw = raw.filter(created_at__gte=date_from)
+    if date_to:
+        raw = raw.filter(created_at__lte=date_to)
+
+    for row in raw.order_by().values('request_method').annotate(count=Count('id')):
+        by_method[row['request_method'] or 'N/A'] += row['count']
+        total += row['count']
+    statuses = raw.order_by().values('response_status').annotate(count=Count('id'))
+    for row in statuses:
+        by_status[f'{(row["response_status"] or 0) // 100}xx'] += row['count']
+
+    return total, dict(by_method), dict(by_status)
+
+
+def daily_request_counts(first_day, last_day):
+    """Return {date: request count} for each day in [first_day, last_day]."""
+    start = timezone.make_aware(datetime.combine(first_day, datetime.min.time()))
+    end = timezone.make_aware(datetime.combine(last_day, datetime.min.time())) + timedelta(days=1)
+    counts = Counter()
+
+    covered = covered_range(start, end)
+    raw = ActivityLog.objects.filter(created_at__gte=start, created_at__lt=end)
+    if covered:
+        lo, hi = covered
+        rolled = ActivityRollup.objects.filter(
+            bucket_start__gte=lo, bucket_start__lt=hi,
+        ).annotate(day=TruncDate('bucket_start')).values('day').annotate(count=Sum('request_count'))
+        for row in rolled:
+            counts[row['day']] += row['count']
+        raw = raw.filter(Q(created_at__lt=lo) | Q(created_at__gte=hi))
+
+    for row in raw.annotate(day=TruncDate('created_at')).values('day').annotate(count=Count('id')):
+        counts[row['day']] += row['count']
+    return counts
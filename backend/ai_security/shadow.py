@@ -0,0 +1,276 @@
+"""
+Shadow models scored next to the active Isolation Forest.
+
+A shadow is an AIModelConfig with model_type MODEL_TYPE that points at a
+model bundle: a candidate being validated, or an earlier version kept for
+rollback. scan_user_batch scores the feature matrix it already built with
+every shadow, so they cost one extra prediction per model and no extra
+feature extraction. Per model, the running counts are kept in
+``parameters['shadow']``: rows scored, scoring latency next to the active
+model's, users flagged by either model, and the largest recent
+disagreements. promote() makes a shadow the active model, and the model it
+replaces becomes a shadow; rollback() does the same for a saved version.
+Either queues a new drift reference for the activated version.
+"""
+import logging
+import os
+import re
+import time
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import engine as engine_module
+from . import drift, model_store, registry
+from .models import AIModelConfig
+
+logger = logging.getLogger(__name__)
+
+MODEL_TYPE = 'isolation_forest_shadow'
+# Same cut-off as AnomalyResponseHandler.WARNING_THRESHOLD and scan_user_batch
+FLAG_THRESHOLD = 0.4
+# Version tags written by IsolationForestEngine.save()
+_VERSION_RE = re.compile(r'^\d{8}_\d{6}$')
+
+
+def _config():
+    return getattr(settings, 'AI_SECURITY', {}).get('SHADOW', {})
+
+
+def max_models():
+    return int(_config().get('MAX_MODELS', 2))
+
+
+def shadow_configs():
+    return AIModelConfig.objects.filter(model_type=MODEL_TYPE, is_active=True).order_by('created_at')
+
+
+def _version_time(version):
+    try:
+        return timezone.make_aware(datetime.strptime(version, '%Y%m%d_%H%M%S'))
+    except (TypeError, ValueError):
+        return None
+
+
+def register(version=None, model_file_path=None, name=None):
+    """Add a shadow for a saved model version or a model store reference.
+
+    ``version`` must be a version tag of a bundle in MODEL_DIR, which is then
+    pushed to the model store; ``model_file_path`` must be a ``sha256:``
+    reference already in the store. Arbitrary file paths are never loaded:
+    bundles are pickles, and every scanning node must be able to fetch the
+    model. Raises ValueError for anything else, if the bundle cannot be
+    loaded, or if MAX_MODELS shadows are already scored.
+    """
+    if version:
+        if not isinstance(version, str) or not _VERSION_RE.match(version):
+            raise ValueError('Invalid model version.')
+        path = os.path.join(engine_module.MODEL_DIR, f'isolation_forest_{version}.joblib')
+        if not os.path.exists(path):
+            raise ValueError(f'Model version {version} not found.')
+        # Shared through the model store so every scanning node can load it
+        model_file_path = model_store.put(path)
+    elif not isinstance(model_file_path, str) or not model_store.is_stored(model_file_path):
+        raise ValueError('A model version or a sha256: reference in the model store is required.')
+    engine = registry.get_engine(model_file_path)
+    if engine is None:
+        raise ValueError(f'Model {model_file_path} could not be loaded.')
+    if shadow_configs().count() >= max_models():
+        raise ValueError(f'At most {max_models()} shadow models can be scored.')
+
+    return AIModelConfig.objects.create(
+        name=name or f'Shadow: {engine.version or model_file_path}',
+        model_type=MODEL_TYPE,
+        model_file_path=model_file_path,
+        last_trained_at=_version_time(engine.version),
+        parameters={'version': engine.version, 'metrics': engine.metrics},
+    )
+
+
+def score_batch(user_ids, feature_matrix, active_scores, active_seconds):
+    """Score ``feature_matrix`` with every shadow and record how they compare with the active model.
+
+    ``active_scores`` and ``active_seconds`` are the active model's
+    normalized scores for the same rows and the time it took to compute them.
+    Returns ``{config id: batch counts}``.
+    """
+    configs = list(shadow_configs().values_list('id', 'model_file_path')[:max_models()])
+    if not configs or not len(feature_matrix):
+        return {}
+
+    batches = {}
+    for config_id, reference in configs:
+        # Configs edited through the generic API could point anywhere; only store references load
+        if not model_store.is_reference(reference):
+            logger.warning('Shadow model %s is not a model store reference; skipping it.', reference)
+            continue
+        engine = registry.get_engine(reference)
+        if engine is None:
+            logger.warning('Shadow model %s could not be loaded; skipping it.', reference)
+            continue
+        start = time.perf_counter()
+        scores = engine.predict_normalized_batch(feature_matrix)
+        batches[config_id] = compare(user_ids, active_scores, scores, time.perf_counter() - start)
+        batches[config_id]['active_seconds'] = active_seconds
+    if batches:
+        _record(batches)
+    return batches
+
+
+def compare(user_ids, active_scores, shadow_scores, seconds):
+    """Counts describing one batch scored by the active model and a shadow. Pure function."""
+    active_scores = np.asarray(active_scores, dtype=np.float64)
+    shadow_scores = np.asarray(shadow_scores, dtype=np.float64)
+    active_flagged = active_scores >= FLAG_THRESHOLD
+    shadow_flagged = shadow_scores >= FLAG_THRESHOLD
+    diff = np.abs(shadow_scores - active_scores)
+    differing = np.flatnonzero(active_flagged != shadow_flagged)
+    differing = differing[np.argsort(-diff[differing], kind='stable')][:_config().get('MAX_DISAGREEMENTS', 20)]
+    return {
+        'rows': len(active_scores),
+        'seconds': seconds,
+        'score_sum': float(shadow_scores.sum()),
+        'abs_diff_sum': float(diff.sum()),
+        'flagged': int(shadow_flagged.sum()),
+        'flagged_active': int(active_flagged.sum()),
+        'flagged_both': int((active_flagged & shadow_flagged).sum()),
+        'disagreements': [
+            {'user_id': str(user_ids[i]), 'active': round(float(active_scores[i]), 4),
+             'shadow': round(float(shadow_scores[i]), 4)}
+            for i in differing.tolist()
+        ],
+    }
+
+
+_COUNTERS = ('rows', 'seconds', 'active_seconds', 'score_sum', 'abs_diff_sum', 'flagged', 'flagged_active',
+             'flagged_both')
+
+
+def _record(batches):
+    limit = _config().get('MAX_DISAGREEMENTS', 20)
+    with transaction.atomic():
+        for config in AIModelConfig.objects.select_for_update().filter(id__in=list(batches)):
+            batch = batches[config.id]
+            stats = config.parameters.get('shadow') or {}
+            totals = {key: stats.get('totals', {}).get(key, 0) + batch[key] for key in _COUNTERS}
+            disagreements = sorted(
+                batch['disagreements'] + stats.get('disagreements', []),
+                key=lambda d: abs(d['shadow'] - d['active']), reverse=True,
+            )[:limit]
+            config.parameters['shadow'] = {
+                'batches': stats.get('batches', 0) + 1,
+                'updated_at': timezone.now().isoformat(),
+                'totals': totals,
+                **summarize(totals),
+                'disagreements': disagreements,
+            }
+            config.save(update_fields=['parameters', 'updated_at'])
+
+
+def summarize(totals):
+    """Rates derived from accumulated counts."""
+    rows = totals['rows'] or 1
+    either = totals['flagged'] + totals['flagged_active'] - totals['flagged_both']
+    return {
+        'us_per_row': round(1e6 * totals['seconds'] / rows, 2),
+        'active_us_per_row': round(1e6 * totals['active_seconds'] / rows, 2),
+        'mean_score': round(totals['score_sum'] / rows, 4),
+        'mean_abs_diff': round(totals['abs_diff_sum'] / rows, 4),
+        'flag_rate': round(totals['flagged'] / rows, 4),
+        'active_flag_rate': round(totals['flagged_active'] / rows, 4),
+        # Share of users flagged by either model that both flagged
+        'flag_agreement': round(totals['flagged_both'] / either, 4) if either else 1.0,
+    }
+
+
+def promote(config_id, keep_previous=True):
+    """Make shadow ``config_id`` the active Isolation Forest and return the active config.
+
+    The replaced model becomes a shadow, so it stays scored for comparison
+    and rollback, unless ``keep_previous`` is False. ``promoted_at`` restarts
+    the model's age for drift.retrain_reason, so a rollback to an older
+    version is not retrained away on the next check.
+    """
+    with transaction.atomic():
+        shadow = AIModelConfig.objects.select_for_update().get(pk=config_id, model_type=MODEL_TYPE)
+        active = _activate(
+            shadow.model_file_path, keep_previous, replacing=shadow.pk,
+            last_trained_at=shadow.last_trained_at,
+            training_samples_count=shadow.training_samples_count,
+            # Live-traffic comparison the model was promoted on
+            shadow_validation=shadow.parameters.get('shadow'),
+        )
+        shadow.delete()
+    return active
+
+
+def rollback(version, keep_previous=True):
+    """Make saved model ``version`` (a bundle in MODEL_DIR) the active Isolation Forest again.
+
+    The bundle is pushed to the model store, so every scanning node loads
+    it, and promoted like a shadow. Raises ValueError for unknown versions.
+    """
+    if not isinstance(version, str) or not _VERSION_RE.match(version):
+        raise ValueError('Invalid model version.')
+    path = os.path.join(engine_module.MODEL_DIR, f'isolation_forest_{version}.joblib')
+    if not os.path.exists(path):
+        raise ValueError(f'Model version {version} not found.')
+    reference = model_store.put(path)
+    with transaction.atomic():
+        return _activate(reference, keep_previous, last_trained_at=_version_time(version), rolled_back=True)
+
+
+def _activate(reference, keep_previous, last_trained_at=None, training_samples_count=None, replacing=None,
+              **extra):
+    """Point the active Isolation Forest config at ``reference``; call inside a transaction.
+
+    With ``keep_previous`` the replaced model becomes a shadow. If MAX_MODELS
+    shadows (besides ``replacing``, the shadow being promoted) exist, the
+    oldest are removed to make room, since score_batch ignores the rest.
+    """
+    from .tasks import CARRIED_PARAMETER_KEYS
+
+    engine = registry.get_engine(reference)
+    if engine is None:
+        raise ValueError(f'Model {reference} could not be loaded.')
+    active = AIModelConfig.objects.select_for_update().filter(
+        model_type='isolation_forest', is_active=True,
+    ).first()
+    previous = active.parameters if active else {}
+
+    if active and keep_previous and active.model_file_path:
+        others = shadow_configs().select_for_update().exclude(pk=replacing)
+        for stale in others[:max(others.count() - max_models() + 1, 0)]:
+            logger.info('Removing shadow model %s to keep at most %d shadows', stale.model_file_path, max_models())
+            stale.delete()
+        AIModelConfig.objects.create(
+            name=f'Previous: {previous.get("version") or active.model_file_path}',
+            model_type=MODEL_TYPE,
+            model_file_path=active.model_file_path,
+            last_trained_at=active.last_trained_at,
+            training_samples_count=active.training_samples_count,
+            parameters={'version': previous.get('version'), 'metrics': previous.get('metrics', {})},
+        )
+    if active is None:
+        active = AIModelConfig(name='Isolation Forest - Anomaly Detection', model_type='isolation_forest')
+
+    active.model_file_path = reference
+    active.last_trained_at = last_trained_at or active.last_trained_at
+    active.training_samples_count = training_samples_count or active.training_samples_count
+    active.parameters = {
+        **{key: previous[key] for key in CARRIED_PARAMETER_KEYS if key in previous},
+        'version': engine.version,
+        'contamination': engine.contamination,
+        'n_estimators': engine.n_estimators,
+        'max_samples': engine.max_samples,
+        'metrics': engine.metrics,
+        'promoted_at': timezone.now().isoformat(),
+        **extra,
+    }
+    active.save()
+    drift.schedule_reference(engine.version)
+    logger.info('Activated model %s (version %s)', reference, engine.version)
+    return active
@@ -0,0 +1,69 @@
+"""Feed login, document access and password reset events into the feature store,
+and preload the anomaly model in Celery worker processes."""
+import logging
+
+from celery.signals import worker_process_init
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from accounts.models import LoginAttempt, PasswordResetToken
+from documents.models import Document, DocumentAccessLog
+from . import feature_store
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=LoginAttempt)
+def record_failed_login(sender, instance, created, **kwargs):
+    if not created or instance.success or not instance.user_id or not feature_store.is_enabled():
+        return
+    feature_store.record_events([{
+        'kind': 'login_failure',
+        'user_id': instance.user_id,
+        'ts': instance.created_at.timestamp(),
+    }])
+
+
+@receiver(post_save, sender=DocumentAccessLog)
+def record_document_access(sender, instance, created, **kwargs):
+    if not created or not instance.user_id or not feature_store.is_enabled():
+        return
+    feature_store.record_events([{
+        'kind': 'document_access',
+        'user_id': instance.user_id,
+        'ts': instance.created_at.timestamp(),
+        'action': instance.action,
+        'document_id': instance.document_id,
+        'security_level': _security_level(instance),
+    }])
+
+
+def _security_level(instance):
+    # The document views log accesses with the document they already loaded
+    if DocumentAccessLog.document.is_cached(instance):
+        return instance.document.security_level
+    return Document.objects.filter(pk=instance.document_id).values_list('security_level', flat=True).first()
+
+
+@receiver(post_save, sender=PasswordResetToken)
+def record_password_reset(sender, instance, created, update_fields=None, **kwargs):
+    if created or not instance.confirmed_at or not feature_store.is_enabled():
+        return
+    if update_fields is not None and 'confirmed_at' not in update_fields:
+        return
+    feature_store.record_events([{
+        'kind': 'password_reset',
+        'user_id': instance.user_id,
+        'ts': instance.created_at.timestamp(),
+        'delay_min': (instance.confirmed_at - instance.created_at).total_seconds() / 60.0,
+    }])
+
+
+@worker_process_init.connect
+def warm_model_registry(**kwargs):
+    """Load the active model when a Celery worker process starts."""
+    try:
+        from .registry import get_active_engine
+        get_active_engine()
+    except Exception as e:
+        logger.warning('Failed to preload anomaly model: %s', e)
@@ -0,0 +1,381 @@
+"""
+Half-Space Trees: a streaming anomaly detector updated as logs are ingested.
+
+Each tree halves a randomly padded copy of the (log-scaled) feature space at
+every level, down to a fixed depth. A vector is scored by the mass that the
+previous window of ``window_size`` vectors left along its path, scaled by
+2**level: rarely visited regions have little mass. Adding a vector costs one
+count per tree and level, however much data came before it. When a window
+fills up its counts become the reference the next window is scored against,
+so the model follows behaviour changes within a window instead of waiting
+for the daily Isolation Forest retrain.
+
+The state is kept in Redis next to the feature store, so every node scores
+with the same model. Log flushes only add their users to a pending set;
+update_streaming_detector drains it every UPDATE_SECONDS and writes the state
+once per tick, under a lock. A user's 1-hour vector is added at most once per
+ADD_INTERVAL_SECONDS, so overlapping windows of a busy user are not counted
+again on every flush, and vectors the detector already scores as anomalous
+are left out of the mass. Readers decode the state again only when its
+version changed.
+"""
+import io
+import logging
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from . import feature_store
+from .base_engine import BaseAnomalyEngine
+from .features import FEATURE_NAMES
+
+logger = logging.getLogger(__name__)
+
+# model_file_path-style reference that selects this detector in the registry
+REFERENCE = 'stream:half_space_trees'
+
+KEY_PREFIX = 'ai:hst'
+STATE_KEY = f'{KEY_PREFIX}:state'
+VERSION_KEY = f'{KEY_PREFIX}:version'
+LOCK_KEY = f'{KEY_PREFIX}:lock'
+PENDING_KEY = f'{KEY_PREFIX}:pending'
+ADDED_KEY_PREFIX = f'{KEY_PREFIX}:added'
+
+# Traversal stops at nodes whose reference mass is below this share of the window
+SIZE_LIMIT = 0.1
+
+_lock = threading.Lock()
+_cached = {'version': None, 'engine': None}
+
+
+def _config():
+    return getattr(settings, 'AI_SECURITY', {}).get('STREAMING', {})
+
+
+def is_enabled():
+    return bool(_config().get('ENABLED', False)) and feature_store.is_enabled()
+
+
+def is_selected():
+    """True when scans and inline scoring use this detector instead of the Isolation Forest."""
+    return is_enabled() and getattr(settings, 'AI_SECURITY', {}).get('DETECTOR') == 'half_space_trees'
+
+
+class HalfSpaceTreesEngine(BaseAnomalyEngine):
+
+    def __init__(self, n_trees=25, depth=8, window_size=256, contamination=0.05, random_state=42):
+        self.n_trees = n_trees
+        self.depth = depth
+        self.window_size = window_size
+        self.contamination = contamination
+        self.random_state = random_state
+        self.upper = None  # per-feature scale of log1p(x)
+        self.split_feature = None  # (trees, internal nodes)
+        self.split_value = None
+        self.reference_mass = None  # (trees, nodes), last complete window
+        self.latest_mass = None  # (trees, nodes), window being filled
+        self.window = None  # vectors of the window being filled, to place the offset
+        self.window_count = 0
+        self.windows_completed = 0
+        self.offset = 1.0
+
+    @property
+    def is_trained(self):
+        return self.windows_completed > 0
+
+    @property
+    def n_nodes(self):
+        return 2 ** (self.depth + 1) - 1
+
+    def train(self, feature_matrix):
+        """Build the trees and fill the reference mass from a feature matrix.
+
+        Trees are randomized around the value ranges of ``feature_matrix``.
+        Unlike the Isolation Forest this is only needed once; update() keeps
+        the model current afterwards.
+        """
+        X = np.array(feature_matrix, dtype=np.float64)
+        if len(X) < 10:
+            logger.warning('Not enough training samples (%d). Skipping.', len(X))
+            return False
+        if X.ndim != 2 or X.shape[1] != len(FEATURE_NAMES):
+            raise ValueError(
+                f'Feature dimension mismatch: expected {len(FEATURE_NAMES)}, got {X.shape[-1]}'
+            )
+
+        self._build(X)
+        self.update(X)
+        if not self.windows_completed:
+            # Fewer samples than a window: score against what there is
+            self._rotate()
+        logger.info('Half-Space Trees built from %d samples.', len(X))
+        return True
+
+    def _build(self, X):
+        rng = np.random.RandomState(self.random_state)
+        n_features = X.shape[1]
+        n_internal = 2 ** self.depth - 1
+        self.upper = np.maximum(np.log1p(np.maximum(X, 0.0)).max(axis=0), 1.0)
+        self.split_feature = np.empty((self.n_trees, n_internal), dtype=np.int64)
+        self.split_value = np.empty((self.n_trees, n_internal), dtype=np.float64)
+        for t in range(self.n_trees):
+            # Work range padded around a random point, so splits differ between trees
+            s = rng.uniform(size=n_features)
+            half = 2.0 * np.maximum(s, 1.0 - s)
+            low = np.empty((n_internal, n_features))
+            high = np.empty((n_internal, n_features))
+            low[0], high[0] = s - half, s + half
+            for node in range(n_internal):
+                q = rng.randint(n_features)
+                mid = (low[node, q] + high[node, q]) / 2.0
+                self.split_feature[t, node] = q
+                self.split_value[t, node] = mid
+                left, right = 2 * node + 1, 2 * node + 2
+                if right < n_internal:
+                    low[left], high[left] = low[node], high[node]
+                    low[right], high[right] = low[node], high[node]
+                    high[left, q] = mid
+                    low[right, q] = mid
+
+        self.reference_mass = np.zeros((self.n_trees, self.n_nodes), dtype=np.int32)
+        self.latest_mass = np.zeros_like(self.reference_mass)
+        self.window = np.zeros((self.window_size, n_features), dtype=np.float64)
+        self.window_count = 0
+        self.windows_completed = 0
+        self.offset = 1.0
+
+    def _transform(self, X):
+        return np.log1p(np.maximum(X, 0.0)) / self.upper
+
+    def _paths(self, Z):
+        """Node index per (row, tree, level), root first."""
+        trees = np.arange(self.n_trees)
+        nodes = np.zeros((len(Z), self.n_trees), dtype=np.int64)
+        paths = np.zeros((len(Z), self.n_trees, self.depth + 1), dtype=np.int64)
+        for level in range(self.depth):
+            q = self.split_feature[trees, nodes]
+            right = np.take_along_axis(Z, q, axis=1) > self.split_value[trees, nodes]
+            nodes = 2 * nodes + 1 + right
+            paths[:, :, level + 1] = nodes
+        return paths
+
+    def _mass_scores(self, Z):
+        """Mass at the node each path stops at, times 2**level, summed over trees."""
+        paths = self._paths(Z)
+        mass = self.reference_mass[np.arange(self.n_trees)[:, np.newaxis], paths]
+        limit = SIZE_LIMIT * self.reference_mass[0, 0]
+        below = mass < limit
+        stop = np.where(below.any(axis=2), below.argmax(axis=2), self.depth)
+        stopped = np.take_along_axis(mass, stop[..., np.newaxis], axis=2)[..., 0]
+        return (stopped * np.exp2(stop)).sum(axis=1)
+
+    def _check_matrix(self, feature_matrix):
+        X = np.asarray(feature_matrix, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != len(FEATURE_NAMES):
+            raise ValueError(
+                f'Feature dimension mismatch: expected (n, {len(FEATURE_NAMES)}), got {X.shape}'
+            )
+        return X
+
+    def update(self, feature_matrix):
+        """Add vectors to the window being filled; O(trees x depth) per vector."""
+        if self.split_feature is None:
+            raise ValueError('Model not trained. Call train() first.')
+        X = self._check_matrix(feature_matrix)
+        Z = self._transform(X)
+        trees = np.arange(self.n_trees)[:, np.newaxis] * self.n_nodes
+        start = 0
+        while start < len(X):
+            take = min(len(X) - start, self.window_size - self.window_count)
+            paths = self._paths(Z[start:start + take])
+            counts = np.bincount((paths + trees).ravel(), minlength=self.latest_mass.size)
+            self.latest_mass += counts.reshape(self.latest_mass.shape).astype(np.int32)
+            self.window[self.window_count:self.window_count + take] = X[start:start + take]
+            self.window_count += take
+            start += take
+            if self.window_count == self.window_size:
+                self._rotate()
+
+    def _rotate(self):
+        """Make the window being filled the reference mass and start a new one."""
+        self.reference_mass = self.latest_mass
+        self.latest_mass = np.zeros_like(self.reference_mass)
+        # Like IsolationForest.offset_: the contamination share of the window scores below it
+        scores = self._mass_scores(self._transform(self.window[:self.window_count]))
+        self.offset = max(float(np.percentile(scores, 100.0 * self.contamination)), 1.0)
+        self.window_count = 0
+        self.windows_completed += 1
+
+    def predict_batch(self, feature_matrix):
+        """Return decision scores in [-1, 1]; negative below the offset mass."""
+        if not self.is_trained:
+            raise ValueError('Model not trained. Call train() first.')
+        X = self._check_matrix(feature_matrix)
+        if not len(X):
+            return np.empty(0, dtype=np.float64)
+        mass = self._mass_scores(self._transform(X))
+        return (mass - self.offset) / (mass + self.offset)
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            feature_names=np.array(FEATURE_NAMES),
+            params=np.array([self.n_trees, self.depth, self.window_size, self.random_state,
+                             self.window_count, self.windows_completed], dtype=np.int64),
+            floats=np.array([self.contamination, self.offset]),
+            upper=self.upper,
+            split_feature=self.split_feature,
+            split_value=self.split_value,
+            reference_mass=self.reference_mass,
+            latest_mass=self.latest_mass,
+            window=self.window,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            if arrays['feature_names'].tolist() != list(FEATURE_NAMES):
+                raise ValueError('Streaming detector was built for a different feature set')
+            n_trees, depth, window_size, random_state, window_count, windows_completed = arrays['params'].tolist()
+            contamination, offset = arrays['floats'].tolist()
+            engine = cls(n_trees=n_trees, depth=depth, window_size=window_size,
+                         contamination=contamination, random_state=random_state)
+            for name in ('upper', 'split_feature', 'split_value', 'reference_mass', 'latest_mass', 'window'):
+                setattr(engine, name, arrays[name])
+        engine.window_count = window_count
+        engine.windows_completed = windows_completed
+        engine.offset = offset
+        return engine
+
+
+def _new_engine():
+    config = _config()
+    # Same share of flagged vectors as the Isolation Forest unless STREAMING overrides it
+    forest_settings = getattr(settings, 'AI_SECURITY', {}).get('ISOLATION_FOREST', {})
+    contamination = config.get('CONTAMINATION', forest_settings.get('CONTAMINATION', 0.05))
+    return HalfSpaceTreesEngine(
+        n_trees=int(config.get('N_TREES', 25)),
+        depth=int(config.get('DEPTH', 8)),
+        window_size=int(config.get('WINDOW_SIZE', 256)),
+        contamination=contamination,
+    )
+
+
+def load(client=None):
+    """Decode the stored detector, or None if there is none yet."""
+    client = client or feature_store.get_client()
+    data = client.get(STATE_KEY)
+    return HalfSpaceTreesEngine.from_bytes(data) if data else None
+
+
+def save(engine, client=None):
+    client = client or feature_store.get_client()
+    pipe = client.pipeline(transaction=True)
+    pipe.set(STATE_KEY, engine.to_bytes())
+    pipe.incr(VERSION_KEY)
+    pipe.execute()
+
+
+def get_engine():
+    """Return the shared detector for scoring, or None if it is unavailable.
+
+    Each call reads the version counter; the state is only fetched and
+    decoded when it changed. Read failures keep the decoded copy.
+    """
+    client = feature_store.get_client()
+    try:
+        version = client.get(VERSION_KEY)
+        if version is None:
+            return None
+        if version == _cached['version']:
+            return _cached['engine']
+        with _lock:
+            if version != _cached['version']:
+                engine = load(client)
+                _cached.update(version=version, engine=engine)
+            return _cached['engine']
+    except Exception as e:
+        logger.error('Failed to load streaming detector: %s', e)
+        return _cached['engine']
+
+
+def claim_users(user_ids, client=None):
+    """Mask of ``user_ids`` whose vector may be added now; at most once per ADD_INTERVAL_SECONDS each."""
+    if not len(user_ids):
+        return np.zeros(0, dtype=bool)
+    client = client or feature_store.get_client()
+    interval = int(_config().get('ADD_INTERVAL_SECONDS', 3600))
+    pipe = client.pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.set(f'{ADDED_KEY_PREFIX}:{user_id}', 1, nx=True, ex=interval)
+    return np.array([bool(claimed) for claimed in pipe.execute()], dtype=bool)
+
+
+def update_users(user_ids):
+    """Add the current feature vectors of ``user_ids`` to the shared detector.
+
+    The first call builds the detector from the last 24 hours of activity.
+    Users whose vector was added within ADD_INTERVAL_SECONDS and vectors
+    scoring below the detector's offset are skipped; the state is written
+    only if vectors were added.
+    """
+    client = feature_store.get_client()
+    matrix = feature_store.get_feature_matrix(user_ids, hours=1, client=client)
+    if matrix is None:
+        return {'status': 'skipped', 'reason': 'no_features'}
+    active = matrix.any(axis=1)
+    user_ids = [user_id for user_id, is_active in zip(user_ids, active) if is_active]
+    matrix = matrix[active]
+
+    lock_timeout = int(_config().get('LOCK_TIMEOUT', 30))
+    with client.lock(LOCK_KEY, timeout=lock_timeout, blocking_timeout=lock_timeout):
+        engine = load(client)
+        if engine is None:
+            from .feature_cache import get_feature_matrix
+            _, history = get_feature_matrix(hours=24)
+            engine = _new_engine()
+            if not engine.train(history[history.any(axis=1)]):
+                return {'status': 'skipped', 'reason': 'insufficient_data'}
+            # The history already holds these users' activity
+            claim_users(user_ids, client)
+            save(engine, client)
+            return {'status': 'success', 'vectors': 0, 'anomalous': 0, 'windows': engine.windows_completed}
+
+        matrix = matrix[claim_users(user_ids, client)]
+        if not len(matrix):
+            return {'status': 'skipped', 'reason': 'no_new_vectors'}
+        # An ongoing attack must not become the mass it is scored against
+        normal = engine.predict_batch(matrix) >= 0
+        if normal.any():
+            engine.update(matrix[normal])
+            save(engine, client)
+    return {
+        'status': 'success', 'vectors': int(normal.sum()), 'anomalous': int((~normal).sum()),
+        'windows': engine.windows_completed,
+    }
+
+
+def update_pending(client=None):
+    """Apply the users queued since the last tick, at most MAX_USERS_PER_UPDATE of them."""
+    client = client or feature_store.get_client()
+    members = client.spop(PENDING_KEY, int(_config().get('MAX_USERS_PER_UPDATE', 5000))) or []
+    user_ids = sorted(member.decode() if isinstance(member, bytes) else member for member in members)
+    if not user_ids:
+        return {'status': 'skipped', 'reason': 'no_pending_users'}
+    return update_users(user_ids)
+
+
+def queue_update(log_entries):
+    """Add the users of a flushed ActivityLog batch to the set the next update drains."""
+    if not is_enabled():
+        return
+    user_ids = sorted({str(data['user'].pk) for data in log_entries if data.get('user') is not None})
+    if not user_ids:
+        return
+    try:
+        feature_store.get_client().sadd(PENDING_KEY, *user_ids)
+    except Exception as e:
+        logger.error('Failed to queue streaming detector update: %s', e)
@@ -0,0 +1,214 @@
+"""
+Hyperparameter sweep for the Isolation Forest.
+
+Every configuration of a parameter grid is trained on one part of a labelled
+dataset and scored on the held-out rest, with configurations evaluated
+concurrently. Labels (1=normal, -1=anomaly) come from reviewed AnomalyReports,
+where is_false_positive marks a normal user, and from the ai_module synthetic
+dataset. The best configuration can be promoted to the active AIModelConfig,
+whose ``hyperparameters`` train_isolation_forest then uses.
+
+Configurations are ranked on average precision, which does not depend on a
+score cut-off. Contamination only moves the cut-off, so it is swept (and
+chosen by F1 at its cut-off) only when the labels are reviewed production
+reports; otherwise every configuration keeps the active contamination.
+"""
+import csv
+import logging
+import multiprocessing
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from joblib import Parallel, delayed
+from sklearn.metrics import average_precision_score, f1_score, precision_score, recall_score
+from sklearn.model_selection import ParameterGrid, train_test_split
+
+from .engine import IsolationForestEngine
+from .features import FEATURE_NAMES, features_to_vector
+
+logger = logging.getLogger(__name__)
+
+HYPERPARAMETERS = ('contamination', 'n_estimators', 'max_samples')
+DEFAULT_GRID = {
+    'contamination': [0.01, 0.03, 0.05, 0.1],
+    'n_estimators': [100, 200, 300],
+    'max_samples': [128, 256, 512],
+}
+
+
+def _config():
+    return getattr(settings, 'AI_SECURITY', {}).get('SWEEP', {})
+
+
+def default_hyperparameters():
+    """Hyperparameters from settings, used until a sweep promotes others."""
+    forest_settings = getattr(settings, 'AI_SECURITY', {}).get('ISOLATION_FOREST', {})
+    return {
+        'contamination': forest_settings.get('CONTAMINATION', 0.05),
+        'n_estimators': forest_settings.get('N_ESTIMATORS', 200),
+        'max_samples': forest_settings.get('MAX_SAMPLES', 256),
+    }
+
+
+def active_hyperparameters(parameters=None):
+    """Hyperparameters the next training run uses, given the active config's ``parameters``."""
+    return {**default_hyperparameters(), **((parameters or {}).get('hyperparameters') or {})}
+
+
+def load_synthetic_dataset(path=None):
+    """Read the ai_module synthetic dataset CSV; returns ``(X, y)``, empty if the file is missing."""
+    path = path or _config().get('SYNTHETIC_DATASET')
+    if not path or not os.path.exists(path):
+        logger.warning('Synthetic dataset %s not found. Skipping.', path)
+        return np.empty((0, len(FEATURE_NAMES)), dtype=np.float32), np.empty(0, dtype=np.int64)
+
+    rows, labels = [], []
+    with open(path, newline='') as f:
+        for record in csv.DictReader(f):
+            rows.append([float(record.get(name) or 0) for name in FEATURE_NAMES])
+            labels.append(-1 if record.get('is_anomaly') == '1' else 1)
+    return np.asarray(rows, dtype=np.float32).reshape(-1, len(FEATURE_NAMES)), np.asarray(labels)
+
+
+def load_feedback_dataset():
+    """Feature vectors of reviewed AnomalyReports; false positives are labelled normal."""
+    from .models import AnomalyReport
+
+    reports = AnomalyReport.objects.filter(reviewed_at__isnull=False).exclude(features={}).values_list(
+        'features', 'is_false_positive',
+    )
+    rows, labels = [], []
+    for features, is_false_positive in reports.iterator():
+        rows.append(features_to_vector(features))
+        labels.append(1 if is_false_positive else -1)
+    return np.asarray(rows, dtype=np.float32).reshape(-1, len(FEATURE_NAMES)), np.asarray(labels, dtype=np.int64)
+
+
+def labelled_dataset(sources=('feedback', 'synthetic')):
+    """Concatenate the labelled datasets named in ``sources``; returns ``(X, y)``."""
+    loaders = {'feedback': load_feedback_dataset, 'synthetic': load_synthetic_dataset}
+    parts = [loaders[source]() for source in sources]
+    X = np.concatenate([X for X, _ in parts]) if parts else np.empty((0, len(FEATURE_NAMES)), dtype=np.float32)
+    y = np.concatenate([y for _, y in parts]) if parts else np.empty(0, dtype=np.int64)
+    return X, y
+
+
+def tunes_contamination(sources):
+    """Whether a sweep over ``sources`` may choose the contamination: only on feedback labels."""
+    return set(sources) == {'feedback'}
+
+
+def parameter_grid(grid=None, include=None, tune_contamination=False):
+    """Expand ``grid`` (settings or DEFAULT_GRID) into configurations; ``include`` is always evaluated.
+
+    Unless ``tune_contamination``, every configuration uses the contamination of ``include``.
+    """
+    grid = dict(grid or _config().get('GRID') or DEFAULT_GRID)
+    if not tune_contamination and include:
+        grid['contamination'] = [include['contamination']]
+    configurations = list(ParameterGrid(grid))
+    if include and include not in configurations:
+        configurations.append(include)
+    return configurations
+
+
+def evaluate_configuration(params, X_train, X_test, y_test, random_state=42):
+    """Train on ``X_train`` with ``params`` and return held-out metrics and latencies."""
+    engine = IsolationForestEngine(random_state=random_state, n_jobs=1, **params)
+    start = time.perf_counter()
+    engine.train(X_train)
+    train_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    scores = engine.predict_batch(X_test)
+    score_ms = (time.perf_counter() - start) * 1000
+
+    y_true = (y_test == -1).astype(int)
+    y_pred = (scores < 0).astype(int)
+    return {
+        'params': params,
+        'precision': float(precision_score(y_true, y_pred, zero_division=0)),
+        'recall': float(recall_score(y_true, y_pred, zero_division=0)),
+        'f1_score': float(f1_score(y_true, y_pred, zero_division=0)),
+        # Threshold-free: how well the raw scores rank anomalies above normal rows
+        'average_precision': float(average_precision_score(y_true, -scores)),
+        'train_ms': round(train_ms, 2),
+        'score_us_per_row': round(score_ms * 1000 / len(X_test), 3),
+    }
+
+
+def _quality(result):
+    # F1 only separates configurations of equal average precision, i.e. their contamination
+    return (result['average_precision'], result['f1_score'])
+
+
+def _rank(result):
+    quality = _quality(result)
+    return (-quality[0], -quality[1], result['train_ms'])
+
+
+def run_sweep(X, y, configurations, n_jobs=-1, test_size=0.3, random_state=42):
+    """Evaluate every configuration on one stratified split; returns results best first.
+
+    Configurations run in a joblib process pool, or on threads inside daemonic
+    processes such as Celery's prefork workers, which cannot start one. The
+    latencies are measured while other configurations run, so they compare
+    configurations with each other rather than predict production timings.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    y = np.asarray(y)
+    stratify = y if min((y == 1).sum(), (y == -1).sum()) >= 2 else None
+    X_train, X_test, _, y_test = train_test_split(
+        X, y, test_size=test_size, stratify=stratify, random_state=random_state,
+    )
+    prefer = 'threads' if multiprocessing.current_process().daemon else 'processes'
+    results = Parallel(n_jobs=n_jobs, prefer=prefer)(
+        delayed(evaluate_configuration)(params, X_train, X_test, y_test, random_state)
+        for params in configurations
+    )
+    return sorted(results, key=_rank)
+
+
+def record_sweep(results, samples, promote=True):
+    """Store ``results`` on the active Isolation Forest config and promote the best one.
+
+    The best configuration replaces the active hyperparameters only if it
+    ranks strictly better than they do (average precision, then F1).
+    Returns ``(config, promoted)``.
+    """
+    from django.db import transaction
+    from .models import AIModelConfig
+
+    with transaction.atomic():
+        config = AIModelConfig.objects.select_for_update().filter(
+            model_type='isolation_forest', is_active=True,
+        ).first()
+        if config is None:
+            config = AIModelConfig.objects.create(
+                name='Isolation Forest - Anomaly Detection', model_type='isolation_forest',
+            )
+        current = active_hyperparameters(config.parameters)
+        baseline = next((result for result in results if result['params'] == current), None)
+        best = results[0]
+        promoted = (
+            promote and best['params'] != current
+            and (baseline is None or _quality(best) > _quality(baseline))
+        )
+        if promoted:
+            config.parameters['hyperparameters'] = best['params']
+        config.parameters['sweep'] = {
+            'finished_at': timezone.now().isoformat(),
+            'samples': samples,
+            'results': results,
+            'best': best['params'],
+            'promoted': promoted,
+        }
+        config.save(update_fields=['parameters', 'updated_at'])
+
+    if promoted:
+        logger.info('Promoted Isolation Forest hyperparameters %s (average precision %.3f)',
+                    best['params'], best['average_precision'])
+    return config, promoted
@@ -1,5 +1,6 @@
 import logging
 import os
+import time
 from datetime import timedelta
 
 from celery import shared_task
@@ -8,58 +9,96 @@ from django.utils import timezone
 logger = logging.getLogger(__name__)
 
 BATCH_DELETE_SIZE = 5000
+# Width of the feature windows the Isolation Forest is trained on
+TRAINING_WINDOW_HOURS = 24
+# AIModelConfig.parameters keys written outside training (evaluate_model, run_hyperparameter_sweep)
+CARRIED_PARAMETER_KEYS = ('evaluation', 'evaluation_result', 'sweep', 'hyperparameters')
 
 
 @shared_task(bind=True, max_retries=3, soft_time_limit=300, time_limit=600)
 def train_isolation_forest(self):
     """Train Isolation Forest model on recent activity data. Runs daily at 2 AM."""
     try:
-        from accounts.models import CustomUser
+        from . import drift, model_store, streaming
         from .engine import IsolationForestEngine
-        from .features import extract_user_features, features_to_vector
+        from .feature_cache import get_feature_matrix
         from .models import AIModelConfig
+        from .sweep import active_hyperparameters
 
-        users = CustomUser.objects.filter(is_active=True)
-        feature_matrix = []
+        from django.conf import settings as django_settings
+        ai_settings = getattr(django_settings, 'AI_SECURITY', {})
 
-        for user in users:
-            features = extract_user_features(user, hours=24)
-            vector = features_to_vector(features)
-            if not all(v == 0 for v in vector):
-                feature_matrix.append(vector)
+        if not ai_settings.get('DAILY_RETRAIN', True) and streaming.is_selected():
+            logger.info('Daily retrain disabled; the streaming detector is in use.')
+            return {'status': 'skipped', 'reason': 'streaming_detector'}
+
+        forest_settings = ai_settings.get('ISOLATION_FOREST', {})
+        max_training_samples = int(forest_settings.get('MAX_TRAINING_SAMPLES', 200000))
+        # Hyperparameters promoted by a sweep; the carried keys are merged when the model is stored
+        previous = AIModelConfig.objects.filter(
+            model_type='isolation_forest', is_active=True,
+        ).values_list('parameters', flat=True).first() or {}
+        engine = IsolationForestEngine(
+            **active_hyperparameters(previous),
+            n_jobs=forest_settings.get('N_JOBS', -1),
+            max_training_samples=max_training_samples,
+            warm_start_trees=int(forest_settings.get('WARM_START_TREES', 50)),
+        )
+
+        _, matrix = get_feature_matrix(hours=TRAINING_WINDOW_HOURS)
+        feature_matrix = matrix[(matrix != 0).any(axis=1)]
+
+        # Grow the active forest on the last window instead of refitting it from scratch
+        warm_start = False
+        if forest_settings.get('WARM_START', False):
+            active = AIModelConfig.objects.filter(
+                model_type='isolation_forest', is_active=True,
+            ).values_list('model_file_path', flat=True).first()
+            path = model_store.resolve(active) if active else None
+            warm_start = bool(path) and engine.load(path)
+
+        # Windows written by the backfill_features command add historical samples,
+        # reservoir-sampled a shard at a time so memory stays bounded. Only shards
+        # of the training window width are comparable with the live vectors.
+        dataset_dir = ai_settings.get('TRAINING_DATASET_DIR')
+        if dataset_dir and not warm_start:
+            from itertools import chain
+            from .backfill import iter_dataset
+            from .training import reservoir_sample
+            feature_matrix = reservoir_sample(
+                chain([feature_matrix], iter_dataset(dataset_dir, window_seconds=TRAINING_WINDOW_HOURS * 3600)),
+                max_training_samples,
+            )
 
         if len(feature_matrix) < 10:
             logger.info('Not enough data to train (%d users). Skipping.', len(feature_matrix))
             return {'status': 'skipped', 'reason': 'insufficient_data', 'samples': len(feature_matrix)}
 
-        from django.conf import settings as django_settings
-        ai_settings = getattr(django_settings, 'AI_SECURITY', {})
-        contamination = ai_settings.get('CONTAMINATION', 0.05)
-
-        engine = IsolationForestEngine(contamination=contamination)
-        if engine.train(feature_matrix):
-            # Save versioned model
-            now = timezone.now()
-            version_tag = now.strftime('%Y%m%d_%H%M%S')
-            filepath = engine.save(version_tag=version_tag)
-
+        trained = engine.train(feature_matrix, warm_start=warm_start)
+        if not trained and warm_start:
+            # Window too small to grow the forest with; refit it instead
+            warm_start = False
+            trained = engine.train(feature_matrix)
+        if trained:
             # Evaluate model metrics
             metrics = engine.evaluate(feature_matrix)
 
-            config, _ = AIModelConfig.objects.update_or_create(
-                model_type='isolation_forest',
-                is_active=True,
-                defaults={
-                    'name': 'Isolation Forest - Anomaly Detection',
-                    'model_file_path': filepath,
-                    'last_trained_at': now,
-                    'training_samples_count': len(feature_matrix),
-                    'parameters': {
-                        'version': version_tag,
-                        'contamination': engine.contamination,
-                        'n_estimators': engine.n_estimators,
-                        'metrics': metrics,
-                    },
+            # Save versioned model bundle
+            now = timezone.now()
+            version_tag = now.strftime('%Y%m%d_%H%M%S')
+            filepath = engine.save(version_tag=version_tag, metrics=metrics)
+            # Other nodes pull the bundle from the model store by its digest
+            reference = model_store.put(filepath)
+
+            config = _store_trained_model(
+                reference, now, len(feature_matrix),
+                {
+                    'version': version_tag,
+                    'contamination': engine.contamination,
+                    'n_estimators': engine.n_estimators,
+                    'max_samples': engine.max_samples,
+                    'warm_start': warm_start,
+                    'metrics': metrics,
                 },
             )
             logger.info(
@@ -67,6 +106,10 @@ def train_isolation_forest(self):
                 len(feature_matrix), version_tag, metrics,
             )
 
+            model_store.prune()
+            # Replaying a day of history can be slow, so it must not share this task's time limit
+            drift.schedule_reference(version_tag)
+
             # Check model degradation
             _check_model_quality(metrics, config)
 
@@ -79,101 +122,523 @@ def train_isolation_forest(self):
         raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
 
 
+def _store_trained_model(reference, trained_at, samples, parameters):
+    """Point the active Isolation Forest config at a newly trained model and return it.
+
+    CARRIED_PARAMETER_KEYS are read from the locked row at write time, so
+    evaluation and sweep results stored while the model trained are kept.
+    """
+    from django.db import transaction
+    from .models import AIModelConfig
+
+    with transaction.atomic():
+        config = AIModelConfig.objects.select_for_update().filter(
+            model_type='isolation_forest', is_active=True,
+        ).first()
+        if config is None:
+            config = AIModelConfig(model_type='isolation_forest', is_active=True)
+        carried = {key: config.parameters[key] for key in CARRIED_PARAMETER_KEYS if key in config.parameters}
+        config.name = 'Isolation Forest - Anomaly Detection'
+        config.model_file_path = reference
+        config.last_trained_at = trained_at
+        config.training_samples_count = samples
+        config.parameters = {**carried, **parameters}
+        config.save()
+    return config
+
+
+@shared_task(bind=True, soft_time_limit=1800, time_limit=2400)
+def build_drift_reference(self, version):
+    """Build the drift reference of model ``version`` from the scans' 1-hour windows.
+
+    Queued after training and promotion. The reference is stored on the
+    active config only while ``version`` is still the active model.
+    """
+    try:
+        from . import drift
+
+        reference = drift.scan_reference(window_hours=1)
+        if reference is None:
+            return {'status': 'skipped', 'reason': 'no_activity'}
+        if not drift.store_reference(version, reference):
+            return {'status': 'skipped', 'reason': 'model_replaced'}
+        return {'status': 'success', 'samples': reference['samples']}
+
+    except Exception as exc:
+        logger.exception('build_drift_reference failed: %s', exc)
+        return {'status': 'failed', 'reason': str(exc)}
+
+
+@shared_task
+def retrain_if_needed():
+    """Start train_isolation_forest when features drifted or the model is too old. Runs hourly.
+
+    See drift.retrain_reason(); without drift the model is retrained every
+    DRIFT['MAX_AGE_HOURS'].
+    """
+    from . import drift
+    from .models import AIModelConfig
+
+    config = AIModelConfig.objects.filter(model_type='isolation_forest', is_active=True).first()
+    reason = drift.retrain_reason(config)
+    if reason is None:
+        return {'status': 'skipped', 'reason': 'no_drift'}
+    logger.info('Retraining Isolation Forest: %s', reason)
+    train_isolation_forest.delay()
+    return {'status': 'dispatched', 'reason': reason}
+
+
+def _explain_method():
+    from django.conf import settings
+    return getattr(settings, 'AI_SECURITY', {}).get('EXPLAIN_METHOD', 'perturbation')
+
+
+def _scan_batch_size():
+    from django.conf import settings
+    return int(getattr(settings, 'AI_SECURITY', {}).get('SCAN_BATCH_SIZE', 500))
+
+
 @shared_task(bind=True, max_retries=2, soft_time_limit=120, time_limit=180)
 def scan_recent_activity(self):
-    """Scan recent activity for anomalies. Runs every 15 minutes."""
+    """Shard recently active users into scan batches. Runs every 15 minutes.
+
+    Each batch is scored by scan_user_batch; with more than one batch they run
+    as a chord whose callback (aggregate_scan_results) sums anomalies_found.
+    """
     try:
-        from accounts.models import CustomUser
-        from .engine import IsolationForestEngine
-        from .features import extract_user_features, features_to_vector
-        from .models import AIModelConfig, AnomalyReport
+        from celery import chord
+        from . import feature_store, registry
+        from .features import active_user_ids, filter_active_user_ids
 
-        config = AIModelConfig.objects.filter(
-            model_type='isolation_forest', is_active=True
-        ).first()
+        from . import rescoring
+        if rescoring.is_enabled():
+            # Users are rescored as their events arrive (rescore_dirty_users)
+            return {'status': 'skipped', 'reason': 'event_driven_rescoring'}
 
-        if not config or not config.model_file_path:
+        model_path = registry.active_model_path()
+        if not model_path:
             logger.info('No trained model available. Skipping scan.')
             return {'status': 'skipped', 'reason': 'no_model'}
 
-        engine = IsolationForestEngine()
-        if not engine.load(config.model_file_path):
-            logger.warning('Failed to load model from %s', config.model_file_path)
+        # Only users with events in the window are scored; idle accounts are never queried
+        user_ids = feature_store.active_user_ids(hours=1)
+        if user_ids is not None:
+            user_ids = filter_active_user_ids(user_ids)
+        else:
+            user_ids = active_user_ids(hours=1)
+        user_ids = [str(user_id) for user_id in user_ids]
+
+        size = _scan_batch_size()
+        batches = [user_ids[i:i + size] for i in range(0, len(user_ids), size)]
+        if len(batches) <= 1:
+            # Not worth a chord round-trip; score the (possibly empty) batch here
+            result = scan_user_batch(user_ids, model_path)
+            if result['status'] != 'success':
+                return result
+            return aggregate_scan_results([result])
+
+        chord(
+            scan_user_batch.s(batch, model_path) for batch in batches
+        )(aggregate_scan_results.s())
+        logger.info('Scan dispatched: %d users in %d batches.', len(user_ids), len(batches))
+        return {'status': 'dispatched', 'users': len(user_ids), 'batches': len(batches)}
+
+    except Exception as exc:
+        logger.exception('scan_recent_activity failed: %s', exc)
+        raise self.retry(exc=exc, countdown=30 * (2 ** self.request.retries))
+
+
+@shared_task(bind=True, max_retries=2, soft_time_limit=120, time_limit=180)
+def scan_user_batch(self, user_ids, model_file_path):
+    """Extract features for a batch of users, score them and persist anomaly reports."""
+    try:
+        import numpy as np
+        from accounts.models import CustomUser
+        from . import baselines, drift, feature_store, registry, shadow
+        from .feature_cache import get_feature_matrix
+        from .features import vector_to_features
+        from .models import AnomalyReport
+
+        engine = registry.get_engine(model_file_path)
+        if engine is None:
+            logger.warning('Failed to load model from %s', model_file_path)
             return {'status': 'failed', 'reason': 'model_load_error'}
 
-        users = CustomUser.objects.filter(is_active=True)
-        anomalies_found = 0
+        # Rescoring passes ids straight from the dirty set, which may include deactivated users
+        users = CustomUser.objects.filter(is_active=True).in_bulk(user_ids)
+        user_ids = list(users)
+        matrix = feature_store.get_feature_matrix(user_ids, hours=1) if user_ids else None
+        if matrix is None:
+            user_ids, matrix = get_feature_matrix(hours=1, user_ids=user_ids)
+        # Score every user with activity in one vectorized call
+        active = matrix.any(axis=1)
+        active_ids = [user_ids[i] for i in np.flatnonzero(active)]
+        scores = np.zeros(len(user_ids))
+        baseline_details = {}
+        if active.any():
+            start = time.perf_counter()
+            scores[active] = engine.predict_normalized_batch(matrix[active])
+            active_seconds = time.perf_counter() - start
+            # Shadow models score the same matrix; their results never act on users
+            try:
+                shadow.score_batch(active_ids, matrix[active], scores[active], active_seconds)
+            except Exception as shadow_err:
+                logger.warning('Shadow scoring failed: %s', shadow_err)
+            # Blend in how far each user is from their own baseline
+            if baselines.is_enabled():
+                try:
+                    scores[active], details = baselines.observe(active_ids, matrix[active], scores[active])
+                    baseline_details = dict(zip(np.flatnonzero(active).tolist(), details))
+                except Exception as baseline_err:
+                    logger.warning('User baselines not applied: %s', baseline_err)
+        flagged = [i for i in np.flatnonzero(active).tolist() if scores[i] >= 0.4]
+        anomalies_found = len(flagged)
+
+        if active.any() and drift.is_enabled():
+            try:
+                drift.observe(engine, matrix[active], window_hours=1)
+            except Exception as drift_err:
+                logger.warning('Drift statistics not updated: %s', drift_err)
+
+        # Skip users already reported within 1 hour, looked up for the whole batch at once
+        recently_reported = set(AnomalyReport.objects.filter(
+            user_id__in=[user_ids[i] for i in flagged],
+            detected_at__gte=timezone.now() - timedelta(hours=1),
+        ).values_list('user_id', flat=True).distinct()) if flagged else set()
+        to_report = [i for i in flagged if user_ids[i] not in recently_reported]
+
+        # Explain all new anomalies of the batch at once
+        explanations = [{}] * len(to_report)
+        if to_report:
+            try:
+                explanations = engine.explain_batch(matrix[to_report], method=_explain_method())
+            except Exception as explain_err:
+                logger.warning('explain_batch failed for %d users: %s', len(to_report), explain_err)
+
+        reports, anomalies = [], []
+        for i, explanation in zip(to_report, explanations):
+            user = users[user_ids[i]]
+            normalized_score = float(scores[i])
+            features = vector_to_features(matrix[i])
+
+            if normalized_score >= 0.7:
+                severity = 'critical'
+            elif normalized_score >= 0.55:
+                severity = 'high'
+            else:
+                severity = 'medium'
+
+            report_features = {**features, '_explanation': explanation}
+            if baseline_details.get(i):
+                report_features['_baseline'] = baseline_details[i]
+
+            reports.append(AnomalyReport(
+                title=f'Anomalous behavior detected: {user.email}',
+                description=f'Anomaly score: {normalized_score:.4f}. Features: {features}',
+                severity=severity,
+                user=user,
+                anomaly_score=normalized_score,
+                features=report_features,
+            ))
+            anomalies.append((normalized_score, user, features))
+            logger.warning(
+                'Anomaly detected for %s (score: %.4f, severity: %s)',
+                user.email, normalized_score, severity,
+            )
 
-        for user in users:
+        if reports:
+            AnomalyReport.objects.bulk_create(reports)
             try:
-                features = extract_user_features(user, hours=1)
-                vector = features_to_vector(features)
-
-                if all(v == 0 for v in vector):
-                    continue
-
-                normalized_score = engine.predict_normalized(vector)
-
-                if normalized_score >= 0.4:
-                    anomalies_found += 1
-
-                    if normalized_score >= 0.7:
-                        severity = 'critical'
-                    elif normalized_score >= 0.55:
-                        severity = 'high'
-                    else:
-                        severity = 'medium'
-
-                    # Skip if already reported within 1 hour
-                    recent_report = AnomalyReport.objects.filter(
-                        user=user,
-                        detected_at__gte=timezone.now() - timedelta(hours=1),
-                    ).exists()
-
-                    if not recent_report:
-                        try:
-                            explanation = engine.explain_features(vector)
-                        except Exception as explain_err:
-                            logger.warning('explain_features failed for %s: %s', user.email, explain_err)
-                            explanation = {}
-
-                        AnomalyReport.objects.create(
-                            title=f'Anomalous behavior detected: {user.email}',
-                            description=f'Anomaly score: {normalized_score:.4f}. Features: {features}',
-                            severity=severity,
-                            user=user,
-                            anomaly_score=normalized_score,
-                            features={**features, '_explanation': explanation},
-                        )
-                        logger.warning(
-                            'Anomaly detected for %s (score: %.4f, severity: %s)',
-                            user.email, normalized_score, severity,
-                        )
-
-                        try:
-                            from .response import AnomalyResponseHandler
-                            AnomalyResponseHandler.handle_anomaly(normalized_score, user, features)
-                        except Exception as resp_err:
-                            logger.error('Failed to handle anomaly response for %s: %s', user.email, resp_err)
-
-            except Exception as user_err:
-                logger.error('Error scanning user %s: %s', user.email, user_err)
-                continue
-
-        logger.info('Scan complete. Anomalies found: %d', anomalies_found)
-        return {'status': 'success', 'anomalies_found': anomalies_found}
+                from .response import AnomalyResponseHandler
+                AnomalyResponseHandler.handle_anomalies(anomalies)
+            except Exception as resp_err:
+                logger.error('Failed to handle anomaly responses for %d users: %s', len(anomalies), resp_err)
+
+        return {'status': 'success', 'scanned': len(user_ids), 'anomalies_found': anomalies_found}
 
     except Exception as exc:
-        logger.exception('scan_recent_activity failed: %s', exc)
+        logger.exception('scan_user_batch failed: %s', exc)
         raise self.retry(exc=exc, countdown=30 * (2 ** self.request.retries))
 
 
+@shared_task(bind=True, soft_time_limit=60, time_limit=90)
+def rescore_dirty_users(self):
+    """Score the highest-priority users with new activity (see ai_security.rescoring).
+
+    Runs every RESCORING['TICK_SECONDS']; at most RESCORING['BUDGET'] users
+    are scored per tick and the rest wait for the next one.
+    """
+    from . import feature_store, registry, rescoring
+
+    if not rescoring.is_enabled():
+        return {'status': 'skipped', 'reason': 'disabled'}
+    model_path = registry.active_model_path()
+    if not model_path:
+        return {'status': 'skipped', 'reason': 'no_model'}
+
+    entries = []
+    try:
+        client = feature_store.get_client()
+        lock = client.lock(rescoring.LOCK_KEY, timeout=90)
+        if not lock.acquire(blocking=False):
+            return {'status': 'skipped', 'reason': 'tick_in_progress'}
+        try:
+            entries = rescoring.pop_dirty(rescoring.budget(), client)
+            result = scan_user_batch([user_id for user_id, _ in entries], model_path) if entries else {
+                'status': 'success', 'scanned': 0, 'anomalies_found': 0,
+            }
+            if result['status'] != 'success':
+                rescoring.requeue(entries, client)
+                return result
+            return {**result, 'pending': rescoring.pending(client)}
+        finally:
+            lock.release()
+
+    except Exception as exc:
+        logger.exception('rescore_dirty_users failed: %s', exc)
+        try:
+            rescoring.requeue(entries)
+        except Exception as requeue_err:
+            logger.error('Failed to requeue %d dirty users: %s', len(entries), requeue_err)
+        return {'status': 'failed', 'reason': str(exc)}
+
+
+@shared_task
+def aggregate_scan_results(results):
+    """Chord callback: combine the per-batch results of a scan."""
+    anomalies_found = sum(r.get('anomalies_found', 0) for r in results)
+    scanned = sum(r.get('scanned', 0) for r in results)
+    failed = sum(1 for r in results if r.get('status') != 'success')
+    logger.info('Scan complete. Users: %d, anomalies found: %d, failed batches: %d',
+                scanned, anomalies_found, failed)
+    return {'status': 'success', 'scanned': scanned, 'anomalies_found': anomalies_found,
+            'failed_batches': failed}
+
+
+@shared_task(bind=True, max_retries=2, soft_time_limit=30, time_limit=60)
+def realtime_anomaly_check(self, user_id, score=None, features=None):
+    """Act on a critical score from inline scoring (see ai_security.realtime).
+
+    Without a score the inline budget ran out, so the user is scored here.
+    """
+    try:
+        import numpy as np
+        from accounts.models import CustomUser
+        from . import feature_store, registry
+        from .features import extract_features_bulk, vector_to_features
+        from .models import AnomalyReport
+        from .response import AnomalyResponseHandler
+
+        user = CustomUser.objects.filter(pk=user_id, is_active=True).first()
+        if user is None:
+            return {'status': 'skipped', 'reason': 'no_user'}
+
+        if score is None:
+            engine = registry.get_active_engine()
+            if engine is None:
+                return {'status': 'skipped', 'reason': 'no_model'}
+            # The vector the inline path ran out of time for, else the log tables
+            try:
+                vector = feature_store.get_vector(user.pk) if feature_store.is_enabled() else None
+            except Exception as read_err:
+                logger.warning('Feature vector read failed for user %s: %s', user.pk, read_err)
+                vector = None
+            if vector is not None:
+                matrix = vector[np.newaxis, :]
+            else:
+                _, matrix = extract_features_bulk(hours=1, user_ids=[user.pk])
+            if not matrix[0].any():
+                return {'status': 'skipped', 'reason': 'no_activity'}
+            score = float(engine.predict_normalized_batch(matrix)[0])
+            features = vector_to_features(matrix[0])
+
+        if score < AnomalyResponseHandler.CRITICAL_THRESHOLD:
+            return {'status': 'success', 'score': score, 'action': 'none'}
+
+        # Skip if already reported within 1 hour
+        if AnomalyReport.objects.filter(
+            user=user, detected_at__gte=timezone.now() - timedelta(hours=1),
+        ).exists():
+            return {'status': 'success', 'score': score, 'action': 'already_reported'}
+
+        AnomalyReport.objects.create(
+            title=f'Real-time anomaly detected: {user.email}',
+            description=f'Anomaly score: {score:.4f}. Features: {features}',
+            severity='critical',
+            user=user,
+            anomaly_score=score,
+            features={**features, '_source': 'realtime'},
+        )
+        logger.warning('Real-time anomaly detected for %s (score: %.4f)', user.email, score)
+        AnomalyResponseHandler.handle_anomaly(score, user, features)
+        return {'status': 'success', 'score': score, 'action': 'reported'}
+
+    except Exception as exc:
+        logger.exception('realtime_anomaly_check failed: %s', exc)
+        raise self.retry(exc=exc, countdown=10)
+
+
+@shared_task(bind=True, soft_time_limit=60, time_limit=90)
+def update_streaming_detector(self, user_ids=None):
+    """Add recently active users to the Half-Space Trees detector.
+
+    Runs every STREAMING['UPDATE_SECONDS'] and drains the users queued by
+    log flushes, or updates ``user_ids`` if given. Not retried: the next tick
+    carries the same users' newer vectors.
+    """
+    try:
+        from .streaming import update_pending, update_users
+
+        if user_ids is None:
+            return update_pending()
+        return update_users(user_ids)
+
+    except Exception as exc:
+        logger.exception('update_streaming_detector failed: %s', exc)
+        return {'status': 'failed', 'reason': str(exc)}
+
+
+def set_evaluation_state(task_id, result=None, **fields):
+    """Merge ``fields`` into the evaluation job record on the Isolation Forest config.
+
+    A new ``task_id`` starts a fresh record; ``result`` also replaces the
+    stored result of the last successful evaluation. Returns the config.
+    """
+    from django.db import transaction
+    from .models import AIModelConfig
+
+    with transaction.atomic():
+        config = AIModelConfig.objects.select_for_update().filter(
+            model_type='isolation_forest', is_active=True,
+        ).first()
+        if config is None:
+            config = AIModelConfig.objects.create(
+                name='Isolation Forest - Anomaly Detection', model_type='isolation_forest',
+            )
+        evaluation = config.parameters.get('evaluation') or {}
+        if evaluation.get('task_id') != task_id:
+            evaluation = {'task_id': task_id}
+        evaluation.update(fields)
+        config.parameters['evaluation'] = evaluation
+        if result is not None:
+            config.parameters['evaluation_result'] = result
+        config.save(update_fields=['parameters', 'updated_at'])
+    return config
+
+
+@shared_task(bind=True, soft_time_limit=600, time_limit=900)
+def evaluate_model(self):
+    """Cross-validate the Isolation Forest on the last 24 hours of activity.
+
+    Started from ModelEvaluationView; progress and the metrics are stored on
+    the active AIModelConfig, where the view reads them.
+    """
+    task_id = self.request.id
+    try:
+        from django.conf import settings
+        from .feature_cache import get_feature_matrix
+        from .models import AIModelConfig
+        from .sweep import active_hyperparameters
+        from .training import ModelTrainer
+
+        ai_settings = getattr(settings, 'AI_SECURITY', {})
+        set_evaluation_state(task_id, status='running', started_at=timezone.now().isoformat())
+
+        _, matrix = get_feature_matrix(hours=24)
+        feature_matrix = matrix[(matrix != 0).any(axis=1)]
+        if len(feature_matrix) < 10:
+            set_evaluation_state(
+                task_id, status='skipped', reason='insufficient_data', samples=len(feature_matrix),
+                finished_at=timezone.now().isoformat(),
+            )
+            return {'status': 'skipped', 'reason': 'insufficient_data', 'samples': len(feature_matrix)}
+
+        # Evaluate the hyperparameters the deployed model is trained with
+        parameters = AIModelConfig.objects.filter(
+            model_type='isolation_forest', is_active=True,
+        ).values_list('parameters', flat=True).first()
+        trainer = ModelTrainer(**active_hyperparameters(parameters))
+        metrics = trainer.evaluate_model(feature_matrix, n_jobs=ai_settings.get('EVALUATION_N_JOBS', -1))
+
+        finished_at = timezone.now().isoformat()
+        config = set_evaluation_state(
+            task_id,
+            result={'task_id': task_id, 'finished_at': finished_at, 'metrics': metrics},
+            status='success', samples=len(feature_matrix), finished_at=finished_at,
+        )
+        logger.info('Model evaluation complete: %s', metrics)
+        _check_model_quality({'precision': metrics['precision'], 'f1': metrics['f1_score']}, config)
+        return {'status': 'success', 'metrics': metrics}
+
+    except Exception as exc:
+        logger.exception('evaluate_model failed: %s', exc)
+        set_evaluation_state(task_id, status='failed', error=str(exc), finished_at=timezone.now().isoformat())
+        return {'status': 'failed', 'reason': str(exc)}
+
+
+@shared_task(bind=True, soft_time_limit=1800, time_limit=2400)
+def run_hyperparameter_sweep(self, promote=True, sources=('feedback', 'synthetic')):
+    """Evaluate the Isolation Forest parameter grid on labelled data and promote the best.
+
+    Results are stored on the active AIModelConfig; a promotion retrains the
+    model with the new hyperparameters right away.
+    """
+    try:
+        from django.conf import settings
+        from . import sweep
+
+        sweep_settings = getattr(settings, 'AI_SECURITY', {}).get('SWEEP', {})
+        X, y = sweep.labelled_dataset(sources)
+        anomalies = int((y == -1).sum())
+        if len(X) < 50 or anomalies < 5:
+            logger.info('Not enough labelled data to sweep (%d rows, %d anomalies). Skipping.', len(X), anomalies)
+            return {'status': 'skipped', 'reason': 'insufficient_data', 'samples': len(X), 'anomalies': anomalies}
+
+        from .models import AIModelConfig
+        parameters = AIModelConfig.objects.filter(
+            model_type='isolation_forest', is_active=True,
+        ).values_list('parameters', flat=True).first()
+        configurations = sweep.parameter_grid(
+            include=sweep.active_hyperparameters(parameters),
+            tune_contamination=sweep.tunes_contamination(sources),
+        )
+        results = sweep.run_sweep(
+            X, y, configurations,
+            n_jobs=sweep_settings.get('N_JOBS', -1), test_size=sweep_settings.get('TEST_SIZE', 0.3),
+        )
+        _, promoted = sweep.record_sweep(results, samples=len(X), promote=promote)
+        if promoted:
+            train_isolation_forest.delay()
+
+        logger.info('Hyperparameter sweep complete: %d configurations, best %s', len(results), results[0])
+        return {'status': 'success', 'configurations': len(results), 'best': results[0], 'promoted': promoted}
+
+    except Exception as exc:
+        logger.exception('run_hyperparameter_sweep failed: %s', exc)
+        return {'status': 'failed', 'reason': str(exc)}
+
+
+@shared_task(bind=True, max_retries=2, soft_time_limit=240, time_limit=300)
+def rollup_activity_logs(self):
+    """Fold closed ActivityLog buckets into ActivityRollup rows. Runs every 5 minutes."""
+    try:
+        from .rollups import rollup_pending
+
+        result = rollup_pending()
+        logger.info('Activity rollup complete: %s', result)
+        return {'status': 'success', **result}
+
+    except Exception as exc:
+        logger.exception('rollup_activity_logs failed: %s', exc)
+        raise self.retry(exc=exc, countdown=30)
+
+
 @shared_task(bind=True, max_retries=2, soft_time_limit=600, time_limit=900)
 def cleanup_old_logs(self):
     """Clean up old activity logs in batches. Runs weekly, 2-year retention (TZ requirement)."""
     try:
         from django.conf import settings
-        from .models import ActivityLog
+        from .models import ActivityLog, ActivityRollup
 
         retention_days = getattr(settings, 'AI_SECURITY', {}).get('LOG_RETENTION_DAYS', 730)
         cutoff = timezone.now() - timedelta(days=retention_days)
@@ -190,6 +655,8 @@ def cleanup_old_logs(self):
             total_deleted += count
             logger.info('Deleted batch of %d old activity logs (%d total so far).', count, total_deleted)
 
+        ActivityRollup.objects.filter(bucket_start__lt=cutoff).delete()
+
         logger.info('Cleanup complete. Total deleted: %d (retention: %d days).', total_deleted, retention_days)
         return {'status': 'success', 'deleted': total_deleted}
 
@@ -203,8 +670,11 @@ def _check_model_quality(metrics, config):
     MIN_PRECISION = 0.3
     MIN_F1 = 0.25
 
-    precision = metrics.get('precision', 0)
-    f1 = metrics.get('f1', 0)
+    precision = metrics.get('precision')
+    f1 = metrics.get('f1')
+    # Unlabelled evaluations have no precision/F1 to judge by
+    if precision is None or f1 is None:
+        return
 
     if precision < MIN_PRECISION or f1 < MIN_F1:
         logger.warning(
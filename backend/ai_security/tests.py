@@ -426,3 +426,1742 @@ class ScanTaskTest(TestCase):
         cleanup_old_logs()
         self.assertFalse(ActivityLog.objects.filter(pk=old_log.pk).exists())
         self.assertTrue(ActivityLog.objects.filter(pk=recent_log.pk).exists())
+
+
+class BulkFeatureExtractionTest(TestCase):
+    def setUp(self):
+        patcher = patch('notifications.tasks.send_welcome_email.delay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = CustomUser.objects.create_user(
+            email='bulk1@test.com', password='TestPass123!@#',
+            first_name='B', last_name='One',
+        )
+        self.other = CustomUser.objects.create_user(
+            email='bulk2@test.com', password='TestPass123!@#',
+            first_name='B', last_name='Two',
+        )
+
+    def _log(self, user, path, method='GET', status_code=200, ip='10.0.0.1'):
+        return ActivityLog.objects.create(
+            user=user, action=f'{method} {path}', request_path=path,
+            request_method=method, response_status=status_code, ip_address=ip,
+        )
+
+    def _seed_logs(self):
+        for i in range(6):
+            self._log(
+                self.user, f'/api/documents/{i % 3}/',
+                status_code=200 if i else 404, ip=f'10.0.0.{i % 2}',
+            )
+        self._log(self.user, '/api/documents/1/share/', method='POST', ip=None)
+        self._log(self.other, '/api/accounts/users/1/', method='PATCH')
+
+    def test_bulk_matrix_values(self):
+        from ai_security.features import extract_features_bulk
+        self._seed_logs()
+
+        user_ids, matrix = extract_features_bulk(hours=1)
+        self.assertEqual(matrix.shape, (len(user_ids), len(FEATURE_NAMES)))
+        features = dict(zip(FEATURE_NAMES, matrix[user_ids.index(self.user.id)]))
+        self.assertEqual(features['requests_count'], 7)
+        self.assertEqual(features['docs_accessed'], 7)
+        self.assertEqual(features['error_rate'], round(1 / 7, 4))
+        self.assertEqual(features['unique_endpoints'], 4)
+        self.assertEqual(features['distinct_ips'], 3)
+        self.assertEqual(features['share_actions'], 1)
+        other = dict(zip(FEATURE_NAMES, matrix[user_ids.index(self.other.id)]))
+        self.assertEqual(other['admin_actions'], 1)
+
+    def test_single_user_extraction_matches_bulk(self):
+        from ai_security.features import extract_features_bulk
+        self._seed_logs()
+        user_ids, matrix = extract_features_bulk(hours=1)
+        features = extract_user_features(self.user, hours=1)
+        self.assertEqual(features_to_vector(features), matrix[user_ids.index(self.user.id)].tolist())
+        self.assertIsInstance(features['error_rate'], float)
+        self.assertIsInstance(features['requests_count'], int)
+
+    def test_active_user_ids_skips_idle_and_inactive_users(self):
+        from ai_security.features import active_user_ids
+        inactive = CustomUser.objects.create_user(
+            email='bulk3@test.com', password='TestPass123!@#',
+            first_name='B', last_name='Three', is_active=False,
+        )
+        self._log(self.user, '/api/documents/1/')
+        self._log(inactive, '/api/documents/1/')
+        self.assertEqual(active_user_ids(hours=1), [self.user.id])
+
+    def test_restricts_to_given_user_ids(self):
+        from ai_security.features import extract_features_bulk
+        user_ids, matrix = extract_features_bulk(hours=1, user_ids=[self.other.id])
+        self.assertEqual(user_ids, [self.other.id])
+        self.assertEqual(matrix.shape, (1, len(FEATURE_NAMES)))
+
+
+class FeatureStoreTest(TestCase):
+    def _request(self, ts, path, method='GET', status_code=200, ip='10.0.0.1'):
+        return {
+            'kind': 'request', 'user_id': 'u1', 'ts': ts, 'path': path,
+            'method': method, 'status': status_code, 'ip': ip,
+        }
+
+    def test_accumulate_buckets_events_per_user(self):
+        from ai_security.feature_store import accumulate
+        acc = accumulate([
+            self._request(10, '/api/documents/1/'),
+            self._request(20, '/api/documents/1/share/', method='POST'),
+            self._request(400, '/api/accounts/e2e/keys/', status_code=403),
+            {'kind': 'login_failure', 'user_id': 'u1', 'ts': 30},
+        ], width=300)
+        self.assertEqual(set(acc), {('u1', 0), ('u1', 1)})
+        first = acc[('u1', 0)]
+        self.assertEqual(first['counters']['requests'], 2)
+        self.assertEqual(first['counters']['share_actions'], 1)
+        self.assertEqual(first['counters']['failed_logins'], 1)
+        self.assertEqual((first['first'], first['last']), (10, 20))
+        self.assertEqual(acc[('u1', 1)]['counters']['e2e_key_failures'], 1)
+
+    def test_merge_buckets_builds_feature_vector(self):
+        from ai_security.feature_store import merge_buckets
+        vector = merge_buckets(
+            counter_hashes=[
+                {b'requests': b'3', b'errors': b'1', b'docs_downloaded': b'2'},
+                {b'requests': b'1', b'reset_at': b'50', b'reset_delay': b'4.5'},
+            ],
+            download_hashes=[{b'doc-a': b'2'}, {b'doc-a': b'1', b'doc-b': b'1'}],
+            spans=[[(b'first', 0.0), (b'last', 60.0)], [(b'first', 300.0), (b'last', 360.0)]],
+            endpoint_count=3,
+            ip_count=2,
+            hour_of_day=14,
+        )
+        features = dict(zip(FEATURE_NAMES, vector))
+        self.assertEqual(features['requests_count'], 4)
+        self.assertEqual(features['error_rate'], 0.25)
+        self.assertEqual(features['session_duration_min'], 6.0)
+        self.assertEqual(features['repeated_doc_downloads'], 3)
+        self.assertEqual(features['password_reset_delay_min'], 4.5)
+        self.assertEqual(features['hour_of_day'], 14)
+
+    def test_disabled_store_returns_none(self):
+        from ai_security import feature_store
+        self.assertIsNone(feature_store.get_feature_matrix(['u1'], hours=1))
+
+    @override_settings(AI_SECURITY={'FEATURE_STORE': {'ENABLED': True}})
+    def test_document_access_event_reuses_the_loaded_document(self):
+        from documents.models import Document, DocumentAccessLog
+        with patch('notifications.tasks.send_welcome_email.delay'):
+            user = CustomUser.objects.create_user(
+                email='reader@test.com', password='TestPass123!@#', first_name='R', last_name='D',
+            )
+        document = Document.objects.create(title='Doc', file='doc.txt', uploaded_by=user, security_level='secret')
+        with patch('ai_security.feature_store.record_events') as mock_record:
+            # Only the log INSERT; the security level comes from the document passed in
+            with self.assertNumQueries(1):
+                DocumentAccessLog.objects.create(document=document, user=user, action='download')
+            with self.assertNumQueries(2):
+                DocumentAccessLog.objects.create(document_id=document.pk, user=user, action='view')
+        levels = [call.args[0][0]['security_level'] for call in mock_record.call_args_list]
+        self.assertEqual(levels, ['secret', 'secret'])
+
+
+class ActivityRollupTest(TestCase):
+    def setUp(self):
+        patcher = patch('notifications.tasks.send_welcome_email.delay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = CustomUser.objects.create_user(
+            email='rollup@test.com', password='TestPass123!@#',
+            first_name='R', last_name='U',
+        )
+        for i in range(5):
+            ActivityLog.objects.create(
+                user=self.user, action='GET', request_path=f'/api/documents/{i % 2}/',
+                request_method='GET' if i else 'POST', response_status=200 if i else 500,
+                ip_address='10.0.0.1',
+            )
+        ActivityLog.objects.create(action='GET', request_path='/api/public/', request_method='GET')
+        ActivityLog.objects.update(created_at=timezone.now() - timedelta(minutes=30))
+        # Fresh log after the rolled-up range stays in the raw tail
+        ActivityLog.objects.create(
+            user=self.user, action='GET', request_path='/api/documents/9/',
+            request_method='GET', response_status=200, ip_address='10.0.0.2',
+        )
+
+    def _rollup(self):
+        from ai_security.rollups import bucket_floor, rollup_range
+        now = timezone.now()
+        return rollup_range(bucket_floor(now - timedelta(hours=2)), bucket_floor(now - timedelta(minutes=10)))
+
+    def test_features_unchanged_by_rollup(self):
+        from ai_security.features import extract_features_bulk
+        _, before = extract_features_bulk(hours=1, user_ids=[self.user.id])
+        self.assertGreater(self._rollup(), 0)
+        _, after = extract_features_bulk(hours=1, user_ids=[self.user.id])
+        self.assertEqual(before.tolist(), after.tolist())
+
+    def test_rollup_is_idempotent(self):
+        from ai_security.models import ActivityRollup
+        self._rollup()
+        count = ActivityRollup.objects.count()
+        self._rollup()
+        self.assertEqual(ActivityRollup.objects.count(), count)
+
+    def test_request_breakdown_and_daily_counts(self):
+        from ai_security.rollups import daily_request_counts, request_breakdown
+        before = request_breakdown()
+        self._rollup()
+        self.assertEqual(request_breakdown(), before)
+        self.assertEqual(before[0], 7)
+        self.assertEqual(before[1]['POST'], 1)
+        today = timezone.now().date()
+        counts = daily_request_counts(today - timedelta(days=1), today)
+        self.assertEqual(sum(counts.values()), 7)
+
+
+class HyperLogLogTest(TestCase):
+    def test_small_sets_count_exactly(self):
+        from ai_security.hll import HyperLogLog
+        sketch = HyperLogLog().update(['/a/', '/b/', '/c/', '/a/'])
+        self.assertEqual(sketch.count(), 3)
+        self.assertEqual(HyperLogLog().count(), 0)
+
+    def test_serialization_round_trip(self):
+        from ai_security.hll import HyperLogLog
+        small = HyperLogLog().update(range(20))
+        large = HyperLogLog().update(range(5000))
+        for sketch in (small, large):
+            restored = HyperLogLog.from_bytes(sketch.to_bytes())
+            self.assertEqual(restored.registers.tolist(), sketch.registers.tolist())
+        self.assertLess(len(small.to_bytes()), len(large.to_bytes()))
+
+    def test_merge_estimates_union(self):
+        from ai_security.hll import HyperLogLog
+        a = HyperLogLog().update(range(0, 6000))
+        b = HyperLogLog().update(range(3000, 9000))
+        union = a.merge(b.to_bytes()).count()
+        self.assertLess(abs(union - 9000) / 9000, 0.1)
+
+
+class ScanShardingTest(TestCase):
+    def setUp(self):
+        patcher = patch('notifications.tasks.send_welcome_email.delay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        AIModelConfig.objects.create(
+            name='IF', model_type='isolation_forest', is_active=True, model_file_path='/tmp/model.joblib',
+        )
+        self.users = [
+            CustomUser.objects.create_user(
+                email=f'shard{i}@test.com', password='TestPass123!@#', first_name='S', last_name=str(i),
+            )
+            for i in range(3)
+        ]
+        for user in self.users:
+            ActivityLog.objects.create(user=user, action='GET', request_path='/api/documents/', request_method='GET')
+
+    @override_settings(AI_SECURITY={'SCAN_BATCH_SIZE': 2})
+    @patch('celery.chord')
+    def test_users_are_sharded_into_chord(self, mock_chord):
+        from ai_security.tasks import scan_recent_activity
+        result = scan_recent_activity()
+        self.assertEqual(result, {'status': 'dispatched', 'users': 3, 'batches': 2})
+        header = list(mock_chord.call_args[0][0])
+        self.assertEqual([len(sig.args[0]) for sig in header], [2, 1])
+        self.assertEqual(
+            {uid for sig in header for uid in sig.args[0]}, {str(user.id) for user in self.users},
+        )
+
+    @patch('ai_security.engine.IsolationForestEngine.predict_normalized_batch',
+           side_effect=lambda matrix: [0.1] * len(matrix))
+    @patch('ai_security.registry.get_engine', return_value=IsolationForestEngine())
+    def test_single_batch_runs_inline(self, mock_get_engine, mock_predict):
+        from ai_security.tasks import scan_recent_activity
+        result = scan_recent_activity()
+        self.assertEqual(result['scanned'], 3)
+        self.assertEqual(result['anomalies_found'], 0)
+        mock_predict.assert_called_once()
+        self.assertEqual(len(mock_predict.call_args[0][0]), 3)
+
+    def test_aggregate_scan_results(self):
+        from ai_security.tasks import aggregate_scan_results
+        result = aggregate_scan_results([
+            {'status': 'success', 'scanned': 2, 'anomalies_found': 1},
+            {'status': 'failed', 'reason': 'model_load_error'},
+        ])
+        self.assertEqual(result['anomalies_found'], 1)
+        self.assertEqual(result['scanned'], 2)
+        self.assertEqual(result['failed_batches'], 1)
+
+
+class BatchedAnomalyPersistenceTest(TestCase):
+    def setUp(self):
+        patcher = patch('notifications.tasks.send_welcome_email.delay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.users = [
+            CustomUser.objects.create_user(
+                email=f'burst{i}@test.com', password='TestPass123!@#', first_name='B', last_name=str(i),
+            )
+            for i in range(6)
+        ]
+        for user in self.users:
+            ActivityLog.objects.create(user=user, action='GET', request_path='/api/documents/', request_method='GET')
+        AnomalyReport.objects.create(title='earlier', description='', user=self.users[0])
+
+    @patch('ai_security.response.AnomalyResponseHandler.handle_anomalies')
+    @patch('ai_security.engine.IsolationForestEngine.explain_batch', side_effect=lambda m, method: [{}] * len(m))
+    @patch('ai_security.engine.IsolationForestEngine.predict_normalized_batch',
+           side_effect=lambda matrix: [0.8] * len(matrix))
+    @patch('ai_security.registry.get_engine', return_value=IsolationForestEngine())
+    def test_flagged_users_are_persisted_in_bulk(self, mock_get_engine, mock_predict, mock_explain, mock_handle):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from ai_security.tasks import scan_user_batch
+        with CaptureQueriesContext(connection) as captured:
+            result = scan_user_batch([str(user.id) for user in self.users], '/tmp/model.joblib')
+        self.assertEqual(result['anomalies_found'], 6)
+        # Users already reported within the hour are skipped
+        self.assertEqual(AnomalyReport.objects.filter(severity='critical').count(), 5)
+        self.assertFalse(AnomalyReport.objects.filter(user=self.users[0], severity='critical').exists())
+        (anomalies,), _ = mock_handle.call_args
+        self.assertEqual({user for _, user, _ in anomalies}, set(self.users[1:]))
+        self.assertEqual(
+            sum('INSERT INTO "ai_security_anomalyreport"' in q['sql'] for q in captured.captured_queries), 1,
+        )
+
+    @patch('notifications.tasks.send_notification_email.delay')
+    def test_handler_alerts_once_per_admin(self, mock_email):
+        from accounts.models import UserSession
+        from notifications.models import Notification
+        from ai_security.response import AnomalyResponseHandler
+        role, _ = Role.objects.get_or_create(name=Role.SUPER_ADMIN)
+        admin = CustomUser.objects.create_user(
+            email='burst-admin@test.com', password='TestPass123!@#', first_name='A', last_name='D', role=role,
+        )
+        for user in self.users[:2]:
+            UserSession.objects.create(user=user, refresh_token='t', expires_at=timezone.now() + timedelta(days=1))
+
+        AnomalyResponseHandler.handle_anomalies([
+            (0.9, self.users[0], {'requests_count': 500}),
+            (0.5, self.users[1], {'requests_count': 80}),
+            (0.1, self.users[2], {}),
+        ])
+        self.assertFalse(UserSession.objects.get(user=self.users[0]).is_active)
+        self.assertTrue(UserSession.objects.get(user=self.users[1]).is_active)
+        self.assertEqual(Notification.objects.filter(recipient=admin).count(), 2)
+        mock_email.assert_called_once()
+        recipient, subject, _ = mock_email.call_args[0]
+        self.assertEqual((recipient, subject), (admin.email, 'AI Anomaly Alert: CRITICAL (2)'))
+
+
+class FeatureBackfillTest(TestCase):
+    def setUp(self):
+        patcher = patch('notifications.tasks.send_welcome_email.delay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = CustomUser.objects.create_user(
+            email='backfill@test.com', password='TestPass123!@#', first_name='B', last_name='F',
+        )
+        self.hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=3)
+        for i, path in enumerate(['/api/documents/1/', '/api/documents/2/', '/api/documents/1/']):
+            log = ActivityLog.objects.create(
+                user=self.user, action='GET', request_path=path, request_method='GET',
+                response_status=404 if i == 2 else 200, ip_address='10.0.0.1',
+            )
+            ActivityLog.objects.filter(pk=log.pk).update(created_at=self.hour + timedelta(minutes=10 + i * 10))
+
+    def test_sliding_windows(self):
+        from ai_security.backfill import iter_windows
+        start = self.hour - timedelta(hours=1)
+        rows = []
+        for _, user_ids, window_ends, matrix in iter_windows(
+            start, self.hour + timedelta(hours=3), window_seconds=7200, step_seconds=3600,
+        ):
+            rows.extend(zip(user_ids, window_ends.tolist(), matrix))
+        # The events fall into the windows ending one and two hours after self.hour
+        end = int(self.hour.timestamp()) + 3600
+        self.assertEqual([(u, e) for u, e, _ in rows], [(str(self.user.id), end), (str(self.user.id), end + 3600)])
+        features = dict(zip(FEATURE_NAMES, rows[0][2]))
+        self.assertEqual(features['requests_count'], 3)
+        self.assertEqual(features['unique_endpoints'], 2)
+        self.assertEqual(features['docs_accessed'], 3)
+        self.assertAlmostEqual(features['error_rate'], 0.3333, places=4)
+        self.assertEqual(features['session_duration_min'], 20.0)
+        self.assertEqual(features['hour_of_day'], (self.hour + timedelta(hours=1)).hour)
+        self.assertEqual(rows[0][2].tolist()[:4], rows[1][2].tolist()[:4])
+
+    def test_command_writes_loadable_shards(self):
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        from ai_security.backfill import load_dataset
+        with tempfile.TemporaryDirectory() as output:
+            call_command('backfill_features', days=1, window_hours=1, output=output, stdout=StringIO())
+            dataset = load_dataset(output)
+        self.assertEqual(dataset.shape, (1, len(FEATURE_NAMES)))
+
+    def test_dataset_only_merges_shards_of_the_requested_width(self):
+        import os
+        import tempfile
+        import numpy as np
+        from ai_security.backfill import load_dataset, write_shard
+        rows = np.ones((2, len(FEATURE_NAMES)), dtype=np.float32)
+        with tempfile.TemporaryDirectory() as output:
+            write_shard(output, 'a_1h', ['u', 'v'], np.zeros(2, dtype=np.int64), rows, 3600)
+            write_shard(output, 'a_24h', ['u', 'v'], np.zeros(2, dtype=np.int64), rows * 24, 86400)
+            # Written before shards recorded their width
+            np.savez_compressed(os.path.join(output, 'features_legacy.npz'),
+                                features=rows, feature_names=np.array(FEATURE_NAMES))
+            self.assertEqual(len(load_dataset(output)), 6)
+            daily = load_dataset(output, window_seconds=86400)
+        self.assertEqual(daily.shape, (2, len(FEATURE_NAMES)))
+        self.assertTrue((daily == 24).all())
+
+
+@override_settings(CACHES={'ai_features': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                           'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FeatureCacheTest(TestCase):
+    def setUp(self):
+        patcher = patch('notifications.tasks.send_welcome_email.delay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.users = [
+            CustomUser.objects.create_user(
+                email=f'cache{i}@test.com', password='TestPass123!@#', first_name='C', last_name=str(i),
+            )
+            for i in range(2)
+        ]
+        ActivityLog.objects.create(
+            user=self.users[0], action='GET', request_path='/api/documents/', request_method='GET',
+        )
+
+    def test_matches_extraction_and_reuses_cached_vectors(self):
+        from ai_security.feature_cache import get_feature_matrix
+        from ai_security.features import extract_features_bulk
+        user_ids = [user.id for user in self.users]
+        _, expected = extract_features_bulk(hours=24, user_ids=user_ids)
+
+        _, first = get_feature_matrix(hours=24, user_ids=user_ids)
+        self.assertEqual(first.tolist(), expected.tolist())
+        with patch('ai_security.feature_cache.extract_features_bulk') as mock_extract:
+            _, second = get_feature_matrix(hours=24, user_ids=user_ids)
+            mock_extract.assert_not_called()
+        self.assertEqual(second.tolist(), expected.tolist())
+
+    def test_only_missing_users_are_extracted(self):
+        from ai_security.feature_cache import get_feature_matrix
+        get_feature_matrix(hours=1, user_ids=[self.users[0].id])
+        from ai_security.features import extract_features_bulk
+        with patch('ai_security.feature_cache.extract_features_bulk', wraps=extract_features_bulk) as mock_extract:
+            user_ids, matrix = get_feature_matrix(hours=1, user_ids=[user.id for user in self.users])
+        self.assertEqual(mock_extract.call_args.kwargs['user_ids'], [self.users[1].id])
+        self.assertEqual(user_ids, [user.id for user in self.users])
+        self.assertEqual(matrix[0][FEATURE_NAMES.index('requests_count')], 1)
+
+    def test_bucket_width_scales_with_window(self):
+        from ai_security.feature_cache import bucket_width
+        self.assertEqual(bucket_width(1), 300)
+        self.assertEqual(bucket_width(24), 3600)
+
+
+class BatchScoringTest(TestCase):
+    def setUp(self):
+        import numpy as np
+        rng = np.random.RandomState(0)
+        self.engine = IsolationForestEngine(n_estimators=50)
+        self.engine.train(rng.rand(60, len(FEATURE_NAMES)))
+        self.matrix = np.vstack([rng.rand(5, len(FEATURE_NAMES)), np.full((1, len(FEATURE_NAMES)), 50.0)])
+
+    def test_batch_matches_single_row_scores(self):
+        scores = self.engine.predict_batch(self.matrix)
+        normalized = self.engine.predict_normalized_batch(self.matrix)
+        for i, row in enumerate(self.matrix.tolist()):
+            self.assertAlmostEqual(scores[i], self.engine.predict(row), places=10)
+            self.assertEqual(normalized[i], self.engine.predict_normalized(row))
+        self.assertEqual(int(normalized.argmax()), 5)
+
+    def test_batch_validates_shape(self):
+        self.assertEqual(len(self.engine.predict_batch(self.matrix[:0])), 0)
+        with self.assertRaises(ValueError):
+            self.engine.predict_batch(self.matrix[:, :9])
+
+
+class BatchExplanationTest(TestCase):
+    def setUp(self):
+        import numpy as np
+        rng = np.random.RandomState(0)
+        self.engine = IsolationForestEngine(n_estimators=100)
+        self.engine.train(rng.randn(300, len(FEATURE_NAMES)))
+        self.matrix = rng.randn(4, len(FEATURE_NAMES))
+        self.matrix[0, 3] = 8.0
+
+    def test_stacked_perturbation_matches_single_predictions(self):
+        row = self.matrix[0].tolist()
+        base = self.engine.predict(row)
+        explanation = self.engine.explain_features(row)
+        for i, name in enumerate(FEATURE_NAMES):
+            modified = list(row)
+            modified[i] = 0.0
+            self.assertEqual(
+                explanation[name]['contribution'], round(base - self.engine.predict(modified), 4),
+            )
+
+    def test_explain_batch_returns_one_explanation_per_row(self):
+        explanations = self.engine.explain_batch(self.matrix)
+        self.assertEqual(len(explanations), 4)
+        self.assertEqual(explanations[1], self.engine.explain_features(self.matrix[1].tolist()))
+
+    def test_path_attribution_points_at_outlier_feature(self):
+        explanation = self.engine.explain_features(self.matrix[0].tolist(), method='path')
+        contributions = {name: item['contribution'] for name, item in explanation.items()}
+        self.assertEqual(max(contributions, key=contributions.get), FEATURE_NAMES[3])
+        self.assertAlmostEqual(sum(contributions.values()), 1.0, places=2)
+
+    def test_unknown_method_raises(self):
+        with self.assertRaises(ValueError):
+            self.engine.explain_batch(self.matrix, method='shap')
+
+
+class TrainingScaleTest(TestCase):
+    def setUp(self):
+        import numpy as np
+        self.rng = np.random.RandomState(0)
+        self.X = self.rng.lognormal(size=(600, len(FEATURE_NAMES))).astype(np.float32)
+
+    def test_reservoir_sample_is_bounded_and_uniform(self):
+        import numpy as np
+        from ai_security.training import reservoir_sample
+        rows = np.repeat(np.arange(10000, dtype=np.float32)[:, np.newaxis], len(FEATURE_NAMES), axis=1)
+        sample = reservoir_sample(np.array_split(rows, 7), 500, random_state=1)
+        self.assertEqual(sample.shape, (500, len(FEATURE_NAMES)))
+        self.assertEqual(len(np.unique(sample[:, 0])), 500)
+        self.assertAlmostEqual(sample[:, 0].mean() / 10000, 0.5, delta=0.05)
+        self.assertEqual(len(reservoir_sample([rows[:30], rows[30:40]], 500)), 40)
+
+    def test_trains_on_memory_mapped_float32_dataset(self):
+        import tempfile
+        import numpy as np
+        with tempfile.NamedTemporaryFile(suffix='.npy') as f:
+            np.save(f.name, self.X)
+            dataset = np.load(f.name, mmap_mode='r')
+            engine = IsolationForestEngine(n_estimators=20, n_jobs=2, max_training_samples=300)
+            self.assertTrue(engine.train(dataset))
+        self.assertEqual(engine.model.n_jobs, 2)
+        self.assertEqual(engine.scaler.n_samples_seen_, 300)
+        self.assertEqual(len(engine.predict_batch(self.X[:5])), 5)
+
+    def test_warm_start_slides_the_forest(self):
+        engine = IsolationForestEngine(n_estimators=30, warm_start_trees=10)
+        engine.train(self.X[:300])
+        first_tree, scaler = engine.model.estimators_[0], engine.scaler
+        self.assertTrue(engine.train(self.X[300:], warm_start=True))
+        self.assertEqual(len(engine.model.estimators_), 30)
+        self.assertIsNot(engine.model.estimators_[0], first_tree)
+        self.assertIs(engine.scaler, scaler)
+        self.assertIsNone(engine.compiled)
+        row = self.X[:1]
+        self.assertAlmostEqual(
+            engine.predict_batch(row)[0],
+            engine.model.decision_function(engine.scaler.transform(row))[0], places=10,
+        )
+        self.assertFalse(engine.train(self.X[:20], warm_start=True))
+
+
+    def test_trimmed_forest_scores_like_its_trees_rebuilt(self):
+        import numpy as np
+        from ai_security.scorer import CompiledForest
+        engine = IsolationForestEngine(n_estimators=30, warm_start_trees=10)
+        engine.train(self.X[:300])
+        engine.train(self.X[300:], warm_start=True)
+        # CompiledForest is built from estimators_ alone, not from the trimmed private state
+        rebuilt = CompiledForest.from_model(engine.model, engine.scaler)
+        np.testing.assert_allclose(
+            engine.model.decision_function(engine.scaler.transform(self.X)),
+            rebuilt.decision_function(self.X), rtol=0, atol=1e-10,
+        )
+
+    def test_warm_start_refits_on_unknown_forest_state(self):
+        engine = IsolationForestEngine(n_estimators=30, warm_start_trees=10)
+        engine.train(self.X[:300])
+        scaler = engine.scaler
+        # As if a newer sklearn kept more per-tree state
+        engine.model._per_tree_state = [None] * 30
+        self.assertTrue(engine.train(self.X[300:], warm_start=True))
+        self.assertIsNot(engine.scaler, scaler)
+        self.assertEqual(len(engine.model.estimators_), 30)
+        self.assertFalse(hasattr(engine.model, '_per_tree_state'))
+
+
+class ModelEvaluationTaskTest(TestCase):
+    def setUp(self):
+        import numpy as np
+        self.X = np.random.RandomState(0).lognormal(size=(200, len(FEATURE_NAMES)))
+
+    def _admin(self):
+        with patch('notifications.tasks.send_welcome_email.delay'):
+            role, _ = Role.objects.get_or_create(name=Role.SUPER_ADMIN)
+            return CustomUser.objects.create_user(
+                email='evaluator@test.com', password='TestPass123!@#', first_name='E', last_name='V', role=role,
+            )
+
+    def test_parallel_folds_match_serial(self):
+        from ai_security.training import ModelTrainer
+        serial = ModelTrainer(n_estimators=20).evaluate_model(self.X, n_splits=3, n_jobs=1)
+        parallel = ModelTrainer(n_estimators=20).evaluate_model(self.X, n_splits=3, n_jobs=3)
+        self.assertEqual(serial, parallel)
+
+    def test_task_stores_metrics_on_config(self):
+        from ai_security.tasks import evaluate_model
+        with patch('ai_security.feature_cache.get_feature_matrix', return_value=([], self.X)):
+            result = evaluate_model.apply(task_id='job-1').get()
+        self.assertEqual(result['status'], 'success')
+        parameters = AIModelConfig.objects.get(model_type='isolation_forest', is_active=True).parameters
+        self.assertEqual(parameters['evaluation']['status'], 'success')
+        self.assertEqual(parameters['evaluation']['samples'], 200)
+        self.assertEqual(parameters['evaluation_result']['task_id'], 'job-1')
+        self.assertEqual(parameters['evaluation_result']['metrics'], result['metrics'])
+
+    def test_task_evaluates_the_deployed_hyperparameters(self):
+        from ai_security import training
+        from ai_security.tasks import evaluate_model
+        hyperparameters = {'contamination': 0.1, 'n_estimators': 30, 'max_samples': 64}
+        AIModelConfig.objects.create(
+            name='IF', model_type='isolation_forest', is_active=True,
+            parameters={'hyperparameters': hyperparameters},
+        )
+        with patch('ai_security.feature_cache.get_feature_matrix', return_value=([], self.X)), \
+                patch('ai_security.training.ModelTrainer', wraps=training.ModelTrainer) as trainer:
+            self.assertEqual(evaluate_model.apply(task_id='job-3').get()['status'], 'success')
+        trainer.assert_called_once_with(**hyperparameters)
+
+    def test_training_keeps_evaluation_stored_while_it_ran(self):
+        import tempfile
+        from django.conf import settings
+        from ai_security.tasks import set_evaluation_state, train_isolation_forest
+        AIModelConfig.objects.create(
+            name='IF', model_type='isolation_forest', is_active=True,
+            parameters={'sweep': {'samples': 10}, 'evaluation': {'task_id': 'old'}},
+        )
+        original_train = IsolationForestEngine.train
+
+        def train_while_evaluating(engine, *args, **kwargs):
+            set_evaluation_state('job-2', result={'task_id': 'job-2'}, status='success')
+            return original_train(engine, *args, **kwargs)
+
+        with tempfile.TemporaryDirectory() as model_dir, tempfile.TemporaryDirectory() as cache_dir, \
+                override_settings(AI_SECURITY={**settings.AI_SECURITY, 'MODEL_STORE': {'CACHE_DIR': cache_dir}}), \
+                patch('ai_security.engine.MODEL_DIR', model_dir), \
+                patch('ai_security.feature_cache.get_feature_matrix', return_value=([], self.X)), \
+                patch('ai_security.tasks.build_drift_reference.delay'), \
+                patch.object(IsolationForestEngine, 'train', train_while_evaluating):
+            result = train_isolation_forest.apply().get()
+        self.assertEqual(result['status'], 'success')
+        parameters = AIModelConfig.objects.get(model_type='isolation_forest', is_active=True).parameters
+        self.assertEqual(parameters['version'], result['version'])
+        self.assertEqual(parameters['evaluation'], {'task_id': 'job-2', 'status': 'success'})
+        self.assertEqual(parameters['evaluation_result'], {'task_id': 'job-2'})
+        self.assertEqual(parameters['sweep'], {'samples': 10})
+
+    def test_views_enqueue_and_read_evaluation(self):
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from ai_security.views import ModelEvaluationView, ModelEvaluationStatusView
+        factory = APIRequestFactory()
+        user = self._admin()
+
+        def call(view, method, **kwargs):
+            request = getattr(factory, method)('/evaluate/')
+            force_authenticate(request, user=user)
+            return view.as_view()(request, **kwargs)
+
+        with patch('ai_security.tasks.evaluate_model.apply_async') as mock_async:
+            first = call(ModelEvaluationView, 'post')
+            second = call(ModelEvaluationView, 'post')
+        self.assertEqual(first.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(first.data['status'], 'pending')
+        self.assertEqual(second.data['task_id'], first.data['task_id'])
+        mock_async.assert_called_once_with(task_id=first.data['task_id'])
+
+        self.assertEqual(call(ModelEvaluationStatusView, 'get', task_id=first.data['task_id']).data['status'],
+                         'pending')
+        self.assertEqual(call(ModelEvaluationStatusView, 'get', task_id='unknown').status_code,
+                         status.HTTP_404_NOT_FOUND)
+        response = call(ModelEvaluationView, 'get')
+        self.assertIsNone(response.data['metrics'])
+        self.assertEqual(response.data['evaluation']['task_id'], first.data['task_id'])
+
+
+class HyperparameterSweepTest(TestCase):
+    def setUp(self):
+        import numpy as np
+        rng = np.random.RandomState(0)
+        normal = rng.lognormal(size=(270, len(FEATURE_NAMES)))
+        outliers = rng.lognormal(size=(30, len(FEATURE_NAMES)))
+        outliers[:, :5] *= 20
+        self.X = np.vstack([normal, outliers])
+        self.y = np.array([1] * 270 + [-1] * 30)
+
+    def test_sweep_ranks_configurations_and_promotes_the_best(self):
+        from ai_security import sweep
+        # A deliberately weak active configuration, so the sweep always finds a better one
+        current = {'contamination': 0.05, 'n_estimators': 1, 'max_samples': 2}
+        AIModelConfig.objects.create(
+            name='IF', model_type='isolation_forest', is_active=True, parameters={'hyperparameters': current},
+        )
+        configurations = sweep.parameter_grid(
+            {'contamination': [0.001, 0.1], 'n_estimators': [20], 'max_samples': [64]}, include=current,
+        )
+        # Contamination is not swept on these labels
+        self.assertEqual(configurations, [{'contamination': 0.05, 'n_estimators': 20, 'max_samples': 64}, current])
+        results = sweep.run_sweep(self.X, self.y, configurations, n_jobs=2)
+        self.assertEqual(results[0]['params']['n_estimators'], 20)
+        self.assertGreater(results[0]['average_precision'], results[-1]['average_precision'])
+        self.assertGreater(results[0]['train_ms'], 0)
+
+        config, promoted = sweep.record_sweep(results, samples=len(self.X))
+        self.assertTrue(promoted)
+        self.assertEqual(sweep.active_hyperparameters(config.parameters), results[0]['params'])
+        self.assertEqual(len(config.parameters['sweep']['results']), 2)
+
+        _, promoted = sweep.record_sweep(results, samples=len(self.X))
+        self.assertFalse(promoted)
+
+    def test_contamination_is_tuned_on_feedback_labels_only(self):
+        from ai_security import sweep
+        self.assertTrue(sweep.tunes_contamination(['feedback']))
+        self.assertFalse(sweep.tunes_contamination(['feedback', 'synthetic']))
+        current = sweep.active_hyperparameters()
+        configurations = sweep.parameter_grid(
+            {'contamination': [0.001, 0.1], 'n_estimators': [20], 'max_samples': [64]},
+            include=current, tune_contamination=True,
+        )
+        results = sweep.run_sweep(self.X, self.y, configurations[:2], n_jobs=2)
+        # Same forest, same ranking of scores: only F1 at the cut-off separates them
+        self.assertEqual(results[0]['average_precision'], results[1]['average_precision'])
+        self.assertEqual(results[0]['params']['contamination'], 0.1)
+
+    def test_feedback_labels_follow_review(self):
+        from ai_security.sweep import load_feedback_dataset
+        features = {name: 1 for name in FEATURE_NAMES}
+        AnomalyReport.objects.create(title='a', description='', features=features, reviewed_at=timezone.now())
+        AnomalyReport.objects.create(
+            title='b', description='', features=features, reviewed_at=timezone.now(), is_false_positive=True,
+        )
+        AnomalyReport.objects.create(title='c', description='', features=features)
+        X, y = load_feedback_dataset()
+        self.assertEqual(X.shape, (2, len(FEATURE_NAMES)))
+        self.assertEqual(sorted(y.tolist()), [-1, 1])
+
+
+class BenchmarkCommandTest(TestCase):
+    def test_benchmark_report_and_comparison(self):
+        import json
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline = os.path.join(tmp, 'baseline.json')
+            call_command('benchmark_ai_security', users=30, logs=900, samples=3, repeat=1,
+                         output=baseline, stdout=StringIO())
+            with open(baseline) as f:
+                report = json.load(f)
+            self.assertEqual(report['meta']['users'], 30)
+            self.assertEqual(report['meta']['logs'], 900)
+            for stage in ('extract_user_features', 'train_isolation_forest',
+                          'scan_recent_activity', 'explain_features'):
+                self.assertGreater(report['results'][stage]['p95_ms'], 0)
+            # The timed stages leave no model or reports behind
+            self.assertFalse(AIModelConfig.objects.exists())
+            self.assertFalse(AnomalyReport.objects.exists())
+
+            out = StringIO()
+            call_command('benchmark_ai_security', skip_seed=True, samples=3, repeat=1, tolerance=100,
+                         output=os.path.join(tmp, 'current.json'), compare=baseline, stdout=out)
+            self.assertIn('No regressions', out.getvalue())
+
+        call_command('benchmark_ai_security', cleanup=True, stdout=StringIO())
+        self.assertFalse(CustomUser.objects.filter(email__endswith='@bench.local').exists())
+
+    def test_postgres_copy_keeps_empty_strings(self):
+        # The COPY itself needs PostgreSQL; check it manually with
+        # `manage.py benchmark_ai_security --users 50 --logs 5000 --cleanup` on a PostgreSQL database
+        import csv
+        from unittest.mock import MagicMock
+        from ai_security.management.commands.benchmark_ai_security import Command
+        user = CustomUser(pk='00000000-0000-0000-0000-000000000001')
+        profile = {'is_anomaly': 0, 'distinct_ips': 1, 'docs_accessed': 1, 'error_rate': 0.0}
+        rows = Command._log_rows(user, profile, 20, timezone.now() - timedelta(hours=1), timezone.now())
+        mock_connection = MagicMock(vendor='postgresql')
+        with patch('ai_security.management.commands.benchmark_ai_security.connection', mock_connection):
+            self.assertEqual(Command._write_logs(rows), 20)
+        sql, buffer = mock_connection.cursor.return_value.__enter__.return_value.copy_expert.call_args[0]
+        self.assertIn("NULL '\\N'", sql)
+        written = list(csv.reader(buffer.getvalue().splitlines()))
+        self.assertEqual(len(written), 20)
+        self.assertIn('', [row[4] for row in written])
+
+
+class ModelRegistryTest(TestCase):
+    def setUp(self):
+        import tempfile
+        import numpy as np
+        from ai_security import registry
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = patch('ai_security.engine.MODEL_DIR', tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        registry.clear()
+        self.addCleanup(registry.clear)
+        self.engine = IsolationForestEngine(n_estimators=20)
+        self.engine.train(np.random.RandomState(0).rand(30, len(FEATURE_NAMES)))
+        self.path = self.engine.save()
+
+    def test_loads_once_and_memory_maps(self):
+        import numpy as np
+        from ai_security.registry import get_engine
+        engine = get_engine(self.path)
+        self.assertIs(get_engine(self.path), engine)
+        self.assertIsInstance(engine.scaler.mean_, np.memmap)
+        row = [0.5] * len(FEATURE_NAMES)
+        self.assertAlmostEqual(engine.predict(row), self.engine.predict(row), places=10)
+
+    def test_reloads_when_file_changes(self):
+        import os
+        from ai_security.registry import get_engine
+        engine = get_engine(self.path)
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertIsNot(get_engine(self.path), engine)
+
+    def test_keeps_loaded_version_when_reload_fails(self):
+        import os
+        from ai_security.registry import get_engine
+        engine = get_engine(self.path)
+        with open(self.path, 'wb') as f:
+            f.write(b'partial')
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertIs(get_engine(self.path), engine)
+        self.assertIsNone(get_engine(self.path + '.missing'))
+
+
+class CompiledScorerTest(TestCase):
+    def setUp(self):
+        import numpy as np
+        self.rng = np.random.RandomState(0)
+        self.X = np.vstack([
+            self.rng.lognormal(size=(300, len(FEATURE_NAMES))),
+            self.rng.lognormal(sigma=4, size=(5, len(FEATURE_NAMES))),
+        ])
+
+    def test_matches_sklearn_decision_function(self):
+        import numpy as np
+        from ai_security.scorer import CompiledForest
+        engine = IsolationForestEngine(n_estimators=50)
+        engine.train(self.rng.lognormal(size=(500, len(FEATURE_NAMES))))
+        compiled = CompiledForest.from_model(engine.model, engine.scaler)
+        expected = engine.model.decision_function(engine.scaler.transform(self.X))
+        np.testing.assert_allclose(compiled.decision_function(self.X), expected, rtol=0, atol=1e-12)
+
+    def test_matches_sklearn_with_feature_subsampling(self):
+        import numpy as np
+        from sklearn.ensemble import IsolationForest
+        from ai_security.scorer import CompiledForest
+        model = IsolationForest(n_estimators=30, max_features=0.5, random_state=0).fit(self.X)
+        compiled = CompiledForest.from_model(model)
+        np.testing.assert_allclose(compiled.decision_function(self.X), model.decision_function(self.X),
+                                   rtol=0, atol=1e-12)
+
+    def test_saved_engine_scores_with_compiled_forest(self):
+        import tempfile
+        import numpy as np
+        with tempfile.TemporaryDirectory() as model_dir, patch('ai_security.engine.MODEL_DIR', model_dir):
+            engine = IsolationForestEngine(n_estimators=30)
+            engine.train(self.X)
+            expected = engine.predict_batch(self.X[:10])
+            engine.save(version_tag='20250101_000000')
+            loaded = IsolationForestEngine()
+            self.assertTrue(loaded.load(mmap_mode='r'))
+            self.assertIsNotNone(loaded.compiled)
+            self.assertIsInstance(loaded.compiled.threshold, np.memmap)
+            # sklearn copies the node arrays when unpickling trees; only the compiled scorer is mapped
+            self.assertNotIsInstance(loaded.model.estimators_[0].tree_.threshold, np.memmap)
+            np.testing.assert_allclose(loaded.predict_batch(self.X[:10]), expected, rtol=0, atol=1e-12)
+
+
+class ModelBundleTest(TestCase):
+    def setUp(self):
+        import tempfile
+        import numpy as np
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.model_dir = tmp.name
+        patcher = patch('ai_security.engine.MODEL_DIR', self.model_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.X = np.random.RandomState(0).rand(40, len(FEATURE_NAMES))
+        self.engine = IsolationForestEngine(n_estimators=20)
+        self.engine.train(self.X)
+
+    def test_save_writes_one_bundle_and_moves_latest(self):
+        import os
+        from ai_security.engine import latest_path
+        path = self.engine.save(version_tag='20250101_000000', metrics={'anomaly_rate': 0.05})
+        self.assertEqual(sorted(os.listdir(self.model_dir)), ['LATEST', 'isolation_forest_20250101_000000.joblib'])
+        self.assertEqual(latest_path(), path)
+        loaded = IsolationForestEngine()
+        self.assertTrue(loaded.load())
+        self.assertEqual(loaded.version, '20250101_000000')
+        self.assertEqual(loaded.metrics, {'anomaly_rate': 0.05})
+        self.assertAlmostEqual(loaded.predict(self.X[0]), self.engine.predict(self.X[0]), places=10)
+
+    def test_rollback_activates_the_version(self):
+        import os
+        import tempfile
+        from django.conf import settings
+        from ai_security import model_store, registry
+        from ai_security.engine import latest_path
+        old = self.engine.save(version_tag='20250101_000000')
+        new = self.engine.save(version_tag='20250102_000000')
+        AIModelConfig.objects.create(
+            name='IF', model_type='isolation_forest', is_active=True, model_file_path=new,
+            parameters={'version': '20250102_000000', 'sweep': {'samples': 10}},
+        )
+        mtime = os.stat(old).st_mtime_ns
+        self.addCleanup(registry.clear)
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                override_settings(AI_SECURITY={**settings.AI_SECURITY, 'MODEL_STORE': {'CACHE_DIR': cache_dir}}):
+            IsolationForestEngine().rollback('20250101_000000')
+            self.assertEqual(registry.get_active_engine().version, '20250101_000000')
+            with self.assertRaises(FileNotFoundError):
+                IsolationForestEngine().rollback('19990101_000000')
+        active = AIModelConfig.objects.get(model_type='isolation_forest', is_active=True)
+        self.assertTrue(model_store.is_reference(active.model_file_path))
+        self.assertEqual(active.parameters['version'], '20250101_000000')
+        self.assertEqual(active.parameters['sweep'], {'samples': 10})
+        self.assertTrue(active.parameters['rolled_back'])
+        # The replaced version stays available as a shadow
+        self.assertEqual(AIModelConfig.objects.get(model_type='isolation_forest_shadow').model_file_path, new)
+        self.assertEqual(latest_path(), old)
+        self.assertEqual(os.stat(old).st_mtime_ns, mtime)
+
+    def test_rejects_bundle_with_other_feature_schema(self):
+        import joblib
+        path = self.engine.save(version_tag='20250101_000000')
+        bundle = joblib.load(path)
+        bundle['feature_names'] = bundle['feature_names'][:-1]
+        joblib.dump(bundle, path)
+        self.assertFalse(IsolationForestEngine().load(path))
+
+    def test_loads_legacy_model_and_scaler_files(self):
+        import os
+        import joblib
+        joblib.dump(self.engine.model, os.path.join(self.model_dir, 'isolation_forest.joblib'))
+        joblib.dump(self.engine.scaler, os.path.join(self.model_dir, 'scaler.joblib'))
+        loaded = IsolationForestEngine()
+        self.assertTrue(loaded.load())
+        self.assertIsNotNone(loaded.compiled)
+        self.assertAlmostEqual(loaded.predict(self.X[0]), self.engine.predict(self.X[0]), places=10)
+
+    def test_failed_write_keeps_previous_bundle(self):
+        import os
+        path = self.engine.save(version_tag='20250101_000000')
+        size = os.path.getsize(path)
+        with patch('ai_security.engine.joblib.dump', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.engine.save(version_tag='20250101_000000')
+        self.assertEqual(os.path.getsize(path), size)
+        self.assertEqual(sorted(os.listdir(self.model_dir)), ['LATEST', 'isolation_forest_20250101_000000.joblib'])
+
+
+class ModelStoreTest(TestCase):
+    def setUp(self):
+        import tempfile
+        import numpy as np
+        from django.conf import settings
+        from ai_security import registry
+        model_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(model_dir.cleanup)
+        self.addCleanup(self.cache_dir.cleanup)
+        patcher = patch('ai_security.engine.MODEL_DIR', model_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        ai_settings = {**settings.AI_SECURITY, 'MODEL_STORE': {'CACHE_DIR': self.cache_dir.name}}
+        override = override_settings(AI_SECURITY=ai_settings)
+        override.enable()
+        self.addCleanup(override.disable)
+        registry.clear()
+        self.addCleanup(registry.clear)
+        self.engine = IsolationForestEngine(n_estimators=20)
+        self.engine.train(np.random.RandomState(0).rand(30, len(FEATURE_NAMES)))
+        self.path = self.engine.save(version_tag='20250101_000000')
+
+    def _clear_local_cache(self):
+        import os
+        for name in os.listdir(self.cache_dir.name):
+            os.remove(os.path.join(self.cache_dir.name, name))
+
+    def test_put_is_content_addressed(self):
+        import hashlib
+        from ai_security import model_store
+        from ai_security.models import ModelBlob
+        reference = model_store.put(self.path)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(reference, 'sha256:' + hashlib.sha256(f.read()).hexdigest())
+        self.assertEqual(model_store.put(self.path), reference)
+        self.assertEqual(ModelBlob.objects.count(), 1)
+
+    def test_resolve_pulls_missing_bundle_into_cache(self):
+        from ai_security import model_store
+        from ai_security.registry import get_engine
+        reference = model_store.put(self.path)
+        self._clear_local_cache()
+        path = model_store.resolve(reference)
+        with open(path, 'rb') as cached, open(self.path, 'rb') as original:
+            self.assertEqual(cached.read(), original.read())
+        engine = get_engine(reference)
+        row = [0.5] * len(FEATURE_NAMES)
+        self.assertAlmostEqual(engine.predict(row), self.engine.predict(row), places=10)
+        self.assertEqual(model_store.resolve('/legacy/isolation_forest.joblib'), '/legacy/isolation_forest.joblib')
+
+    def test_resolve_rejects_corrupt_or_unknown_blobs(self):
+        from ai_security import model_store
+        from ai_security.models import ModelBlob
+        reference = model_store.put(self.path)
+        self._clear_local_cache()
+        ModelBlob.objects.update(data=b'tampered')
+        self.assertIsNone(model_store.resolve(reference))
+        self.assertIsNone(model_store.resolve('sha256:' + '0' * 64))
+        self.assertIsNone(model_store.resolve('sha256:../../etc/passwd'))
+
+    def test_prune_keeps_referenced_blobs(self):
+        import numpy as np
+        from ai_security import model_store
+        from ai_security.models import ModelBlob
+        reference = model_store.put(self.path)
+        AIModelConfig.objects.create(name='IF', model_type='isolation_forest', model_file_path=reference)
+        for tag in ('20250102_000000', '20250103_000000'):
+            self.engine.train(np.random.RandomState(len(tag)).rand(30, len(FEATURE_NAMES)))
+            model_store.put(self.engine.save(version_tag=tag))
+        self.assertEqual(model_store.prune(keep=1), 1)
+        self.assertEqual(ModelBlob.objects.count(), 2)
+        self.assertTrue(ModelBlob.objects.filter(digest=reference[len('sha256:'):]).exists())
+
+
+class StreamingDetectorTest(TestCase):
+    def setUp(self):
+        import numpy as np
+        from ai_security.streaming import HalfSpaceTreesEngine
+        rng = np.random.RandomState(1)
+        self.X = rng.poisson(5, size=(400, len(FEATURE_NAMES))).astype(float)
+        self.outliers = self.X[:10].copy()
+        self.outliers[:, :5] *= 6
+        self.engine = HalfSpaceTreesEngine(n_trees=20, window_size=100)
+        self.engine.train(self.X[:200])
+
+    def test_outliers_score_higher(self):
+        normal = self.engine.predict_normalized_batch(self.X[200:])
+        outlier = self.engine.predict_normalized_batch(self.outliers)
+        self.assertGreater(outlier.min(), normal.mean())
+        self.assertGreaterEqual((self.engine.predict_batch(self.outliers) < 0).mean(), 0.8)
+        self.assertLess((self.engine.predict_batch(self.X[200:]) < 0).mean(), 0.2)
+        self.assertEqual(len(self.engine.explain_batch(self.outliers[:2])), 2)
+
+    def test_incomplete_engine_cannot_be_instantiated(self):
+        from ai_security.base_engine import BaseAnomalyEngine
+
+        class NoScores(BaseAnomalyEngine):
+            is_trained = True
+
+        with self.assertRaises(TypeError):
+            NoScores()
+
+    def test_new_engine_honours_contamination_settings(self):
+        from ai_security.streaming import _new_engine
+        with override_settings(AI_SECURITY={'ISOLATION_FOREST': {'CONTAMINATION': 0.02}}):
+            self.assertEqual(_new_engine().contamination, 0.02)
+        with override_settings(AI_SECURITY={'ISOLATION_FOREST': {'CONTAMINATION': 0.02},
+                                            'STREAMING': {'CONTAMINATION': 0.1}}):
+            self.assertEqual(_new_engine().contamination, 0.1)
+
+    def test_update_fills_and_rotates_windows(self):
+        completed = self.engine.windows_completed
+        self.engine.update(self.X[200:250])
+        self.assertEqual(self.engine.window_count, 50)
+        self.assertEqual(self.engine.latest_mass[:, 0].tolist(), [50] * 20)
+        self.engine.update(self.X[250:300])
+        self.assertEqual(self.engine.windows_completed, completed + 1)
+        self.assertEqual(self.engine.window_count, 0)
+        self.assertEqual(self.engine.reference_mass[:, 0].tolist(), [100] * 20)
+
+    def test_serialization_round_trip(self):
+        import numpy as np
+        from ai_security.streaming import HalfSpaceTreesEngine
+        self.engine.update(self.X[200:230])
+        restored = HalfSpaceTreesEngine.from_bytes(self.engine.to_bytes())
+        np.testing.assert_array_equal(restored.predict_batch(self.outliers), self.engine.predict_batch(self.outliers))
+        self.assertEqual(restored.window_count, 30)
+        data = self.engine.to_bytes()
+        with patch('ai_security.streaming.FEATURE_NAMES', FEATURE_NAMES[:-1]):
+            with self.assertRaises(ValueError):
+                HalfSpaceTreesEngine.from_bytes(data)
+
+    def _update_users(self, client, matrix, user_ids):
+        from ai_security import streaming
+        client.get.return_value = self.engine.to_bytes()
+        with patch('ai_security.feature_store.get_client', return_value=client), \
+                patch('ai_security.feature_store.get_feature_matrix', return_value=matrix):
+            return streaming.update_users(user_ids)
+
+    def test_update_users_saves_updated_state(self):
+        from unittest.mock import MagicMock
+        from ai_security import streaming
+        client = MagicMock()
+        client.pipeline.return_value.execute.return_value = [True, True, True]
+        result = self._update_users(client, self.X[200:203], ['a', 'b', 'c'])
+        self.assertEqual(result['status'], 'success')
+        state = client.pipeline.return_value.set.call_args[0][1]
+        self.assertEqual(streaming.HalfSpaceTreesEngine.from_bytes(state).window_count, 3)
+        client.pipeline.return_value.incr.assert_called_once_with(streaming.VERSION_KEY)
+
+    def test_update_users_adds_each_user_once_per_interval(self):
+        from unittest.mock import MagicMock
+        from ai_security import streaming
+        client = MagicMock()
+        # 'a' was added within ADD_INTERVAL_SECONDS
+        client.pipeline.return_value.execute.return_value = [False, True, True]
+        result = self._update_users(client, self.X[200:203], ['a', 'b', 'c'])
+        self.assertEqual(result['vectors'], 2)
+        client.pipeline.return_value.set.assert_any_call(f'{streaming.ADDED_KEY_PREFIX}:a', 1, nx=True, ex=3600)
+
+        client = MagicMock()
+        client.pipeline.return_value.execute.return_value = [False, False, False]
+        result = self._update_users(client, self.X[200:203], ['a', 'b', 'c'])
+        self.assertEqual(result, {'status': 'skipped', 'reason': 'no_new_vectors'})
+        client.pipeline.return_value.incr.assert_not_called()
+
+    def test_update_users_skips_anomalous_vectors(self):
+        from unittest.mock import MagicMock
+        from ai_security import streaming
+        client = MagicMock()
+        client.pipeline.return_value.execute.return_value = [True] * 10
+        matrix = self.outliers
+        anomalous = int((self.engine.predict_batch(matrix) < 0).sum())
+        result = self._update_users(client, matrix, [str(i) for i in range(10)])
+        self.assertGreater(anomalous, 0)
+        self.assertEqual(result['anomalous'], anomalous)
+        self.assertEqual(result['vectors'], 10 - anomalous)
+        if result['vectors']:
+            state = client.pipeline.return_value.set.call_args[0][1]
+            self.assertEqual(streaming.HalfSpaceTreesEngine.from_bytes(state).window_count, 10 - anomalous)
+        else:
+            client.pipeline.return_value.incr.assert_not_called()
+
+    def test_update_pending_drains_queued_users(self):
+        from unittest.mock import MagicMock
+        from ai_security import streaming
+        client = MagicMock()
+        client.spop.return_value = {b'b', b'a'}
+        with patch('ai_security.streaming.update_users', return_value={'status': 'success'}) as mock_update:
+            streaming.update_pending(client)
+        client.spop.assert_called_once_with(streaming.PENDING_KEY, 5000)
+        mock_update.assert_called_once_with(['a', 'b'])
+        client.spop.return_value = []
+        self.assertEqual(streaming.update_pending(client)['reason'], 'no_pending_users')
+
+    def test_selected_detector_is_served_by_registry(self):
+        from django.conf import settings
+        from ai_security import registry, streaming
+        ai_settings = {
+            **settings.AI_SECURITY, 'DETECTOR': 'half_space_trees',
+            'STREAMING': {'ENABLED': True}, 'FEATURE_STORE': {'ENABLED': True},
+        }
+        with override_settings(AI_SECURITY=ai_settings), \
+                patch('ai_security.streaming.get_engine', return_value=self.engine):
+            self.assertEqual(registry.active_model_path(), streaming.REFERENCE)
+            self.assertIs(registry.get_active_engine(), self.engine)
+        self.assertIsNone(registry.active_model_path())
+
+    def test_flush_queues_update_for_batch_users(self):
+        from unittest.mock import MagicMock
+        from ai_security import streaming
+        with patch('notifications.tasks.send_welcome_email.delay'):
+            user = CustomUser.objects.create_user(
+                email='stream@test.com', password='TestPass123!@#', first_name='S', last_name='T',
+            )
+        client = MagicMock()
+        with patch('ai_security.streaming.is_enabled', return_value=True), \
+                patch('ai_security.feature_store.get_client', return_value=client):
+            streaming.queue_update([{'user': user}, {'user': None}, {'user': user}])
+        client.sadd.assert_called_once_with(streaming.PENDING_KEY, str(user.pk))
+
+
+@override_settings(AI_SECURITY={'RESCORING': {'ENABLED': True, 'BUDGET': 2}, 'FEATURE_STORE': {'ENABLED': True}})
+class RescoringTest(TestCase):
+    def setUp(self):
+        from unittest.mock import MagicMock
+        AIModelConfig.objects.create(
+            name='IF', model_type='isolation_forest', is_active=True, model_file_path='/tmp/model.joblib',
+        )
+        self.client = MagicMock()
+        self.client.lock.return_value.acquire.return_value = True
+        self.client.zpopmax.return_value = [(b'risky', 16.0), (b'plain', 1.0)]
+        self.client.zcard.return_value = 3
+        patcher = patch('ai_security.feature_store.get_client', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_risky_activity_gets_higher_priority(self):
+        from ai_security.feature_store import accumulate
+        from ai_security.rescoring import priorities
+        acc = accumulate([
+            {'kind': 'request', 'user_id': 'plain', 'ts': 10, 'path': '/api/dashboard/',
+             'method': 'GET', 'status': 200, 'ip': '10.0.0.1'},
+            {'kind': 'request', 'user_id': 'risky', 'ts': 10, 'path': '/api/accounts/e2e/keys/',
+             'method': 'GET', 'status': 403, 'ip': '10.0.0.1'},
+            {'kind': 'login_failure', 'user_id': 'risky', 'ts': 20},
+        ], width=300)
+        self.assertEqual(priorities(acc), {'plain': 1, 'risky': 1 + 3 + 5 + 5})
+
+    def test_tick_scores_popped_users_within_budget(self):
+        from ai_security.tasks import rescore_dirty_users
+        with patch('ai_security.tasks.scan_user_batch',
+                   return_value={'status': 'success', 'scanned': 2, 'anomalies_found': 1}) as mock_scan:
+            result = rescore_dirty_users()
+        self.client.zpopmax.assert_called_once_with('ai:rescore:dirty', 2)
+        mock_scan.assert_called_once_with(['risky', 'plain'], '/tmp/model.joblib')
+        self.assertEqual(result['pending'], 3)
+        self.client.lock.return_value.release.assert_called_once()
+
+    def test_failed_tick_requeues_users(self):
+        from ai_security.tasks import rescore_dirty_users
+        with patch('ai_security.tasks.scan_user_batch', side_effect=RuntimeError('db down')):
+            result = rescore_dirty_users()
+        self.assertEqual(result['status'], 'failed')
+        self.client.pipeline.return_value.zincrby.assert_any_call('ai:rescore:dirty', 16.0, 'risky')
+
+    def test_deactivated_dirty_user_gets_no_report(self):
+        import numpy as np
+        from ai_security.tasks import rescore_dirty_users
+        with patch('notifications.tasks.send_welcome_email.delay'):
+            active, deactivated = [
+                CustomUser.objects.create_user(
+                    email=f'{name}@test.com', password='TestPass123!@#', first_name=name, last_name='D',
+                    is_active=name == 'active',
+                )
+                for name in ('active', 'deactivated')
+            ]
+        self.client.zpopmax.return_value = [(str(deactivated.pk).encode(), 9.0), (str(active.pk).encode(), 1.0)]
+        engine = IsolationForestEngine(n_estimators=20)
+        engine.train(np.random.RandomState(0).rand(50, len(FEATURE_NAMES)))
+        with patch('ai_security.registry.get_engine', return_value=engine), \
+                patch('ai_security.feature_store.get_feature_matrix',
+                      side_effect=lambda ids, **kwargs: np.full((len(ids), len(FEATURE_NAMES)), 50.0)), \
+                patch('ai_security.response.AnomalyResponseHandler.handle_anomalies') as mock_handle:
+            result = rescore_dirty_users()
+        self.assertEqual(result['scanned'], 1)
+        self.assertFalse(AnomalyReport.objects.filter(user=deactivated).exists())
+        self.assertTrue(AnomalyReport.objects.filter(user=active).exists())
+        handled_users = [user for _, user, _ in mock_handle.call_args[0][0]]
+        self.assertEqual(handled_users, [active])
+
+    def test_full_scan_is_skipped(self):
+        from ai_security.tasks import scan_recent_activity
+        self.assertEqual(scan_recent_activity()['reason'], 'event_driven_rescoring')
+
+
+class DriftMonitorTest(TestCase):
+    def setUp(self):
+        import numpy as np
+        self.rng = np.random.RandomState(0)
+        from ai_security.drift import reference_from
+        X = self.rng.lognormal(size=(2000, len(FEATURE_NAMES)))
+        self.engine = IsolationForestEngine(n_estimators=20)
+        self.engine.train(X)
+        self.engine.reference = reference_from(X, window_hours=1)
+        self.engine.version = '20250101_000000'
+        self.config = AIModelConfig.objects.create(
+            name='IF', model_type='isolation_forest', is_active=True, last_trained_at=timezone.now(),
+            parameters={'version': '20250101_000000'},
+        )
+
+    def test_merged_statistics_match_numpy(self):
+        import numpy as np
+        from ai_security import drift
+        X = self.rng.lognormal(size=(300, len(FEATURE_NAMES)))
+        stats = drift.merge(
+            drift.batch_stats(self.engine.reference, X[:100]), drift.batch_stats(self.engine.reference, X[100:]),
+        )
+        self.assertEqual(stats['n'], 300)
+        np.testing.assert_allclose(stats['mean'], X.mean(axis=0))
+        np.testing.assert_allclose(np.asarray(stats['m2']) / 300, X.var(axis=0))
+        self.assertEqual([sum(counts) for counts in stats['counts']], [300] * len(FEATURE_NAMES))
+
+    def test_shifted_traffic_drifts_and_triggers_retraining(self):
+        from ai_security import drift
+        from ai_security.tasks import retrain_if_needed
+        with override_settings(AI_SECURITY={'DRIFT': {'MIN_SAMPLES': 500}}):
+            for _ in range(3):
+                record = drift.observe(
+                    self.engine, self.rng.lognormal(size=(200, len(FEATURE_NAMES))), window_hours=1,
+                )
+            self.assertFalse(record['drifted'])
+            self.assertLess(record['max_psi'], 0.1)
+            with patch('ai_security.tasks.train_isolation_forest.delay') as mock_train:
+                self.assertEqual(retrain_if_needed()['reason'], 'no_drift')
+            mock_train.assert_not_called()
+
+            shifted = self.rng.lognormal(size=(2000, len(FEATURE_NAMES)))
+            shifted[:, 0] *= 5
+            record = drift.observe(self.engine, shifted, window_hours=1)
+            self.assertTrue(record['drifted'])
+            self.assertEqual(max(record['features'], key=lambda name: record['features'][name]['psi']),
+                             FEATURE_NAMES[0])
+            with patch('ai_security.tasks.train_isolation_forest.delay') as mock_train:
+                self.assertEqual(retrain_if_needed()['reason'], 'drift')
+            mock_train.assert_called_once()
+
+    def test_other_window_widths_are_not_compared(self):
+        from ai_security import drift
+        daily = self.rng.lognormal(size=(50, len(FEATURE_NAMES)))
+        self.assertIsNone(drift.observe(self.engine, daily, window_hours=24))
+        self.assertNotIn('drift', AIModelConfig.objects.get(pk=self.config.pk).parameters)
+
+    def test_scan_reference_uses_hourly_windows(self):
+        from ai_security.drift import scan_reference
+        with patch('notifications.tasks.send_welcome_email.delay'):
+            user = CustomUser.objects.create_user(
+                email='window@test.com', password='TestPass123!@#', first_name='W', last_name='R',
+            )
+        for _ in range(3):
+            ActivityLog.objects.create(user=user, action='GET', request_path='/api/documents/', request_method='GET')
+        reference = scan_reference(window_hours=1, now=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(reference['window_hours'], 1)
+        self.assertEqual(reference['samples'], 1)
+        self.assertEqual(reference['mean'][FEATURE_NAMES.index('requests_count')], 3)
+
+    def test_old_model_is_retrained_without_drift(self):
+        from ai_security.drift import retrain_reason
+        self.assertIsNone(retrain_reason(self.config))
+        self.config.last_trained_at = timezone.now() - timedelta(days=8)
+        self.assertEqual(retrain_reason(self.config), 'max_age')
+        self.assertEqual(retrain_reason(None), 'no_model')
+
+    def test_reference_is_saved_with_the_model(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as model_dir, patch('ai_security.engine.MODEL_DIR', model_dir):
+            path = self.engine.save(version_tag='20250101_000000')
+            loaded = IsolationForestEngine()
+            self.assertTrue(loaded.load(path))
+        self.assertEqual(loaded.reference, self.engine.reference)
+
+    def test_training_queues_the_reference_build(self):
+        import tempfile
+        from django.conf import settings
+        from ai_security.tasks import train_isolation_forest
+        X = self.rng.lognormal(size=(200, len(FEATURE_NAMES)))
+        with tempfile.TemporaryDirectory() as model_dir, tempfile.TemporaryDirectory() as cache_dir, \
+                override_settings(AI_SECURITY={**settings.AI_SECURITY, 'MODEL_STORE': {'CACHE_DIR': cache_dir}}), \
+                patch('ai_security.engine.MODEL_DIR', model_dir), \
+                patch('ai_security.feature_cache.get_feature_matrix', return_value=([], X)), \
+                patch('ai_security.drift.scan_reference') as mock_scan, \
+                patch('ai_security.tasks.build_drift_reference.delay') as mock_build, \
+                self.captureOnCommitCallbacks(execute=True):
+            result = train_isolation_forest.apply().get()
+        self.assertEqual(result['status'], 'success')
+        mock_scan.assert_not_called()
+        mock_build.assert_called_once_with(result['version'])
+
+    def test_unqueued_reference_build_is_only_logged(self):
+        from ai_security import drift
+        with patch('ai_security.tasks.build_drift_reference.delay', side_effect=ConnectionError('broker down')), \
+                self.captureOnCommitCallbacks(execute=True):
+            drift.schedule_reference('20250101_000000')
+
+    def test_reference_task_stores_the_reference_for_the_active_model(self):
+        from ai_security import drift
+        from ai_security.tasks import build_drift_reference
+        reference = self.engine.reference
+        self.engine.reference = None
+        self.assertIsNone(drift.observe(self.engine, self.rng.lognormal(size=(50, len(FEATURE_NAMES))), 1))
+
+        with patch('ai_security.drift.scan_reference', return_value=reference):
+            self.assertEqual(build_drift_reference('20240101_000000')['reason'], 'model_replaced')
+            self.assertEqual(build_drift_reference('20250101_000000')['status'], 'success')
+        stored = AIModelConfig.objects.get(pk=self.config.pk).parameters['drift_reference']
+        self.assertEqual(stored['model_version'], '20250101_000000')
+        self.assertEqual(stored['cuts'], reference['cuts'])
+        record = drift.observe(self.engine, self.rng.lognormal(size=(50, len(FEATURE_NAMES))), window_hours=1)
+        self.assertEqual(record['samples'], 50)
+
+    def test_status_view_reports_drift_summary(self):
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from ai_security import drift
+        from ai_security.views import AIModelStatusView
+        drift.observe(self.engine, self.rng.lognormal(size=(50, len(FEATURE_NAMES))), window_hours=1)
+        with patch('notifications.tasks.send_welcome_email.delay'):
+            role, _ = Role.objects.get_or_create(name=Role.SUPER_ADMIN)
+            user = CustomUser.objects.create_user(
+                email='drift@test.com', password='TestPass123!@#', first_name='D', last_name='R', role=role,
+            )
+        request = APIRequestFactory().get('/model-status/')
+        force_authenticate(request, user=user)
+        response = AIModelStatusView.as_view()(request)
+        self.assertEqual(response.data['drift']['samples'], 50)
+        self.assertNotIn('stats', response.data['drift'])
+        self.assertNotIn('drift', response.data['parameters'])
+        self.assertNotIn('drift_reference', response.data['parameters'])
+        self.assertIsNone(response.data['retrain_reason'])
+
+
+class ShadowModelTest(TestCase):
+    def setUp(self):
+        import tempfile
+        import numpy as np
+        from django.conf import settings
+        from ai_security import model_store, registry
+        model_dir = tempfile.TemporaryDirectory()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(model_dir.cleanup)
+        self.addCleanup(cache_dir.cleanup)
+        patcher = patch('ai_security.engine.MODEL_DIR', model_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        ai_settings = {**settings.AI_SECURITY, 'MODEL_STORE': {'CACHE_DIR': cache_dir.name}}
+        override = override_settings(AI_SECURITY=ai_settings)
+        override.enable()
+        self.addCleanup(override.disable)
+        registry.clear()
+        self.addCleanup(registry.clear)
+
+        rng = np.random.RandomState(0)
+        for version, contamination in (('20250101_000000', 0.05), ('20250102_000000', 0.2)):
+            engine = IsolationForestEngine(n_estimators=20, contamination=contamination)
+            engine.train(rng.rand(60, len(FEATURE_NAMES)))
+            path = engine.save(version_tag=version)
+        self.active = AIModelConfig.objects.create(
+            name='IF', model_type='isolation_forest', is_active=True,
+            model_file_path=model_store.put(path.replace('20250102', '20250101')),
+            parameters={'version': '20250101_000000', 'sweep': {'samples': 10}},
+        )
+
+    def test_scan_scores_shadows_on_the_shared_matrix(self):
+        from ai_security import feature_cache, shadow
+        from ai_security.tasks import scan_user_batch
+        candidate = shadow.register(version='20250102_000000')
+        with patch('notifications.tasks.send_welcome_email.delay'):
+            users = [
+                CustomUser.objects.create_user(
+                    email=f'shadow{i}@test.com', password='TestPass123!@#', first_name='S', last_name=str(i),
+                )
+                for i in range(4)
+            ]
+        for user in users:
+            ActivityLog.objects.create(user=user, action='GET', request_path='/api/documents/', request_method='GET')
+
+        with patch('ai_security.feature_cache.get_feature_matrix', wraps=feature_cache.get_feature_matrix) as extract, \
+                patch('ai_security.response.AnomalyResponseHandler.handle_anomalies'):
+            scan_user_batch([str(user.id) for user in users], self.active.model_file_path)
+        extract.assert_called_once()
+        candidate.refresh_from_db()
+        scoring = candidate.parameters['shadow']
+        self.assertEqual((scoring['batches'], scoring['totals']['rows']), (1, 4))
+        self.assertGreater(scoring['us_per_row'], 0)
+        self.assertGreater(scoring['active_us_per_row'], 0)
+
+    def test_compare_counts_flags_and_disagreements(self):
+        from ai_security.shadow import compare, summarize
+        batch = compare(['a', 'b', 'c'], [0.9, 0.5, 0.1], [0.8, 0.2, 0.6], seconds=0.003)
+        self.assertEqual((batch['flagged'], batch['flagged_active'], batch['flagged_both']), (2, 2, 1))
+        self.assertEqual([d['user_id'] for d in batch['disagreements']], ['c', 'b'])
+        self.assertEqual(summarize({**batch, 'active_seconds': 0.003})['flag_agreement'], round(1 / 3, 4))
+
+    def test_register_validates_version_and_limit(self):
+        from ai_security import shadow
+        for bad in ({'version': '19990101_000000'}, {'version': '../../../etc/passwd'},
+                    {'model_file_path': '/etc/passwd'}, {'model_file_path': 'sha256:' + '0' * 64}):
+            with self.assertRaises(ValueError):
+                shadow.register(**bad)
+        shadow.register(model_file_path=self.active.model_file_path)
+        shadow.shadow_configs().delete()
+        shadow.register(version='20250101_000000')
+        shadow.register(version='20250102_000000')
+        with self.assertRaises(ValueError):
+            shadow.register(version='20250102_000000')
+
+    def test_promote_swaps_active_and_shadow(self):
+        from ai_security import shadow
+        candidate = shadow.register(version='20250102_000000')
+        active = shadow.promote(candidate.pk)
+        self.assertEqual(active.pk, self.active.pk)
+        self.assertEqual(active.parameters['version'], '20250102_000000')
+        self.assertEqual(active.parameters['contamination'], 0.2)
+        self.assertEqual(active.parameters['sweep'], {'samples': 10})
+        previous = shadow.shadow_configs().get()
+        self.assertEqual(previous.model_file_path, self.active.model_file_path)
+        self.assertEqual(previous.parameters['version'], '20250101_000000')
+        self.assertFalse(AIModelConfig.objects.filter(pk=candidate.pk).exists())
+
+    def test_promote_with_full_shadow_slots_keeps_the_limit(self):
+        from ai_security import shadow
+        oldest = shadow.register(model_file_path=self.active.model_file_path, name='oldest')
+        candidate = shadow.register(version='20250102_000000')
+        self.assertEqual(shadow.shadow_configs().count(), shadow.max_models())
+        # The promoted shadow's slot goes to the replaced model
+        shadow.promote(candidate.pk)
+        self.assertEqual([c.name for c in shadow.shadow_configs()], ['oldest', 'Previous: 20250101_000000'])
+
+        # No slot is freed by a rollback, so the oldest shadow makes room
+        shadow.rollback('20250101_000000')
+        self.assertEqual(
+            [c.name for c in shadow.shadow_configs()], ['Previous: 20250101_000000', 'Previous: 20250102_000000'],
+        )
+        self.assertFalse(AIModelConfig.objects.filter(pk=oldest.pk).exists())
+
+    def test_rollback_to_an_old_version_is_not_retrained_for_age(self):
+        from ai_security import shadow
+        from ai_security.drift import retrain_reason
+        candidate = shadow.register(version='20250102_000000')
+        active = shadow.promote(candidate.pk)
+        # Versions date from 2025, far beyond MAX_AGE_HOURS
+        self.assertLess(active.last_trained_at, timezone.now() - timedelta(days=30))
+        self.assertIsNone(retrain_reason(active))
+        self.assertEqual(retrain_reason(active, now=timezone.now() + timedelta(days=8)), 'max_age')
+
+    def test_promote_view_parses_keep_previous(self):
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from ai_security import shadow
+        from ai_security.views import ShadowModelPromoteView
+        with patch('notifications.tasks.send_welcome_email.delay'):
+            role, _ = Role.objects.get_or_create(name=Role.SUPER_ADMIN)
+            user = CustomUser.objects.create_user(
+                email='promote@test.com', password='TestPass123!@#', first_name='P', last_name='R', role=role,
+            )
+        candidate = shadow.register(version='20250102_000000')
+        request = APIRequestFactory().post('/promote/', {'keep_previous': 'false'})
+        force_authenticate(request, user=user)
+        response = ShadowModelPromoteView.as_view()(request, pk=candidate.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(shadow.shadow_configs().exists())
+
+    def test_registry_caches_every_shadow(self):
+        from django.conf import settings
+        from ai_security import registry
+        self.assertEqual(registry.max_cached_models(), 4)
+        with override_settings(AI_SECURITY={**settings.AI_SECURITY, 'SHADOW': {'MAX_MODELS': 5}}):
+            self.assertEqual(registry.max_cached_models(), 7)
+
+
+class UserBaselineTest(TestCase):
+    def setUp(self):
+        with patch('notifications.tasks.send_welcome_email.delay'):
+            self.archivist, self.receptionist = [
+                CustomUser.objects.create_user(
+                    email=f'{name}@test.com', password='TestPass123!@#', first_name=name, last_name='B',
+                )
+                for name in ('archivist', 'receptionist')
+            ]
+        self.downloads = FEATURE_NAMES.index('docs_downloaded')
+
+    def _seed(self, user, downloads, others=0):
+        import numpy as np
+        from ai_security.baselines import pack
+        from ai_security.models import UserBaseline
+        mean = np.full(len(FEATURE_NAMES), float(others))
+        mean[self.downloads] = downloads
+        UserBaseline.objects.create(user=user, vector=pack(mean, np.full(len(FEATURE_NAMES), 4.0)), observations=20)
+        UserBaseline.objects.filter(user=user).update(updated_at=timezone.now() - timedelta(hours=2))
+
+    def test_update_matches_float64_ewma(self):
+        import numpy as np
+        from ai_security.baselines import update
+        rng = np.random.RandomState(0)
+        values = rng.lognormal(size=(50, len(FEATURE_NAMES)))
+        mean = np.zeros((1, len(FEATURE_NAMES)), dtype=np.float32)
+        var = np.zeros_like(mean)
+        observations = np.zeros(1, dtype=np.int64)
+        expected_mean, expected_var = values[0], np.zeros(len(FEATURE_NAMES))
+        for x in values[1:]:
+            d = x - expected_mean
+            expected_mean = expected_mean + 0.05 * d
+            expected_var = 0.95 * (expected_var + 0.05 * d * d)
+        for x in values:
+            mean, var, observations = update(x[None, :], mean, var, observations)
+        self.assertEqual(observations[0], 50)
+        np.testing.assert_allclose(mean[0], expected_mean, rtol=1e-4)
+        np.testing.assert_allclose(var[0], expected_var, rtol=1e-3)
+
+    def test_same_activity_scores_by_own_history(self):
+        import numpy as np
+        from ai_security import baselines
+        from ai_security.models import UserBaseline
+        self._seed(self.archivist, 40)
+        self._seed(self.receptionist, 1)
+        X = np.zeros((2, len(FEATURE_NAMES)), dtype=np.float32)
+        X[:, self.downloads] = 40
+        scores, details = baselines.observe(
+            [self.archivist.id, self.receptionist.id], X, [0.3, 0.3],
+        )
+        self.assertEqual(details[0]['score'], 0.0)
+        self.assertEqual(details[1]['feature'], 'docs_downloaded')
+        self.assertAlmostEqual(scores[0], 0.21)
+        self.assertGreater(scores[1], 0.45)
+        archivist = UserBaseline.objects.get(user=self.archivist)
+        self.assertEqual((archivist.observations, len(archivist.vector)), (21, 2 * len(FEATURE_NAMES) * 4))
+
+        # Within UPDATE_INTERVAL_MINUTES the same window is not learned twice
+        baselines.observe([self.archivist.id, self.receptionist.id], X, [0.3, 0.3])
+        self.assertEqual(UserBaseline.objects.get(user=self.archivist).observations, 21)
+
+    @patch('ai_security.response.AnomalyResponseHandler.handle_anomalies')
+    @patch('ai_security.engine.IsolationForestEngine.explain_batch', side_effect=lambda m, method: [{}] * len(m))
+    @patch('ai_security.engine.IsolationForestEngine.predict_normalized_batch',
+           side_effect=lambda matrix: [0.5] * len(matrix))
+    @patch('ai_security.registry.get_engine', return_value=IsolationForestEngine())
+    def test_scan_reports_baseline_deviation(self, mock_get_engine, mock_predict, mock_explain, mock_handle):
+        from django.conf import settings
+        from ai_security.models import UserBaseline
+        from ai_security.tasks import scan_user_batch
+        # Far from everything the receptionist usually does
+        self._seed(self.receptionist, 100, others=100)
+        ActivityLog.objects.create(
+            user=self.receptionist, action='GET', request_path='/api/documents/', request_method='GET',
+        )
+        ActivityLog.objects.create(
+            user=self.archivist, action='GET', request_path='/api/documents/', request_method='GET',
+        )
+        with override_settings(AI_SECURITY={**settings.AI_SECURITY, 'BASELINES': {'ENABLED': True}}):
+            scan_user_batch([str(self.archivist.id), str(self.receptionist.id)], '/tmp/model.joblib')
+        reports = {report.user_id: report for report in AnomalyReport.objects.all()}
+        self.assertNotIn('_baseline', reports[self.archivist.id].features)
+        self.assertGreater(reports[self.receptionist.id].features['_baseline']['score'], 0.9)
+        self.assertGreater(reports[self.receptionist.id].anomaly_score, 0.6)
+        self.assertEqual(UserBaseline.objects.get(user=self.archivist).observations, 1)
+
+
+class RealtimeScoringTest(TestCase):
+    def setUp(self):
+        import numpy as np
+        from ai_security import realtime
+        patcher = patch('notifications.tasks.send_welcome_email.delay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        realtime._active_model['checked_at'] = None
+        self.addCleanup(realtime._active_model.update, checked_at=None)
+        self.user = CustomUser.objects.create_user(
+            email='realtime@test.com', password='TestPass123!@#', first_name='R', last_name='T',
+        )
+        AIModelConfig.objects.create(
+            name='IF', model_type='isolation_forest', is_active=True, model_file_path='/tmp/model.joblib',
+        )
+        self.engine = IsolationForestEngine(n_estimators=20)
+        self.engine.train(np.random.RandomState(0).rand(50, len(FEATURE_NAMES)))
+        self.vector = np.ones((1, len(FEATURE_NAMES)))
+
+    def _score(self, client=None, **config):
+        from unittest.mock import MagicMock
+        from ai_security import realtime
+        if client is None:
+            client = MagicMock()
+            client.get.return_value = self.vector[0].astype('float32').tobytes()
+        with patch('ai_security.registry.get_engine', return_value=self.engine), \
+                patch('ai_security.realtime._get_client', return_value=client), \
+                override_settings(AI_SECURITY={'REALTIME_SCORING': config}), \
+                patch('ai_security.tasks.realtime_anomaly_check.delay') as mock_delay, \
+                patch('ai_security.response.AnomalyResponseHandler.CRITICAL_THRESHOLD', 0.0):
+            return realtime.check_user(self.user.pk), mock_delay
+
+    def test_inline_scoring_reads_one_precomputed_key(self):
+        from unittest.mock import MagicMock
+        from ai_security import feature_store
+        client = MagicMock()
+        client.get.return_value = self.vector[0].astype('float32').tobytes()
+        with patch('ai_security.feature_store.get_feature_matrix') as assemble:
+            result, _ = self._score(client=client, BUDGET_MS=1000)
+        assemble.assert_not_called()
+        client.get.assert_called_once_with(feature_store._vector_key(self.user.pk))
+        self.assertEqual(result['status'], 'scored')
+
+        client.get.return_value = None
+        result, mock_delay = self._score(client=client, BUDGET_MS=1000)
+        self.assertEqual(result, {'status': 'skipped', 'reason': 'no_activity'})
+        mock_delay.assert_not_called()
+
+    def test_feature_store_writes_refresh_vectors(self):
+        from unittest.mock import MagicMock
+        from ai_security import feature_store
+        client = MagicMock()
+        with patch('ai_security.feature_store.is_enabled', return_value=True), \
+                patch('ai_security.realtime.is_enabled', return_value=True), \
+                patch('ai_security.feature_store.get_client', return_value=client), \
+                patch('ai_security.feature_store.get_feature_matrix', return_value=self.vector):
+            feature_store.record_events([
+                {'kind': 'login_failure', 'user_id': self.user.pk, 'ts': timezone.now().timestamp()},
+            ])
+        client.pipeline.return_value.set.assert_called_once_with(
+            feature_store._vector_key(self.user.pk), self.vector[0].astype('float32').tobytes(), ex=3600,
+        )
+
+    def test_deferred_checks_are_queued_once_per_user(self):
+        from unittest.mock import MagicMock
+        client = MagicMock()
+        client.get.return_value = self.vector[0].astype('float32').tobytes()
+        client.set.side_effect = [True, None]
+        first, first_delay = self._score(client=client, BUDGET_MS=0)
+        second, second_delay = self._score(client=client, BUDGET_MS=0)
+        first_delay.assert_called_once_with(str(self.user.pk))
+        second_delay.assert_not_called()
+        self.assertEqual(second, {'status': 'deferred', 'queued': False})
+        client.set.assert_called_with(f'ai:rt:queued:{self.user.pk}', 1, nx=True, ex=60)
+
+    def test_critical_score_is_handed_to_celery(self):
+        result, mock_delay = self._score(BUDGET_MS=1000)
+        self.assertEqual(result['status'], 'scored')
+        self.assertAlmostEqual(result['score'], self.engine.predict_normalized(self.vector[0].tolist()), places=6)
+        user_id, score, features = mock_delay.call_args[0]
+        self.assertEqual(user_id, str(self.user.pk))
+        self.assertEqual(features['requests_count'], 1)
+
+    def test_exhausted_budget_defers_scoring(self):
+        result, mock_delay = self._score(BUDGET_MS=0)
+        self.assertEqual(result['status'], 'deferred')
+        mock_delay.assert_called_once_with(str(self.user.pk))
+
+    @patch('ai_security.response.AnomalyResponseHandler.handle_anomaly')
+    def test_task_reports_critical_anomaly_once(self, mock_handle):
+        from ai_security.tasks import realtime_anomaly_check
+        features = {'requests_count': 500}
+        result = realtime_anomaly_check(str(self.user.pk), 0.9, features)
+        self.assertEqual(result['action'], 'reported')
+        mock_handle.assert_called_once_with(0.9, self.user, features)
+        report = AnomalyReport.objects.get(user=self.user)
+        self.assertEqual(report.severity, 'critical')
+        self.assertEqual(realtime_anomaly_check(str(self.user.pk), 0.9, features)['action'], 'already_reported')
+        self.assertEqual(realtime_anomaly_check(str(self.user.pk), 0.2, features)['action'], 'none')
+
+    @patch('ai_security.realtime.check_user')
+    def test_mixin_scores_successful_requests_only(self, mock_check):
+        from rest_framework.response import Response
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from rest_framework.views import APIView
+        from ai_security.mixins import RealtimeScoringMixin
+
+        class SensitiveView(RealtimeScoringMixin, APIView):
+            def get(self, request, code):
+                return Response(status=code)
+
+        factory = APIRequestFactory()
+        with patch('ai_security.realtime.is_enabled', return_value=True):
+            for code in (200, 403):
+                request = factory.get('/sensitive/')
+                force_authenticate(request, user=self.user)
+                SensitiveView.as_view()(request, code=code)
+        mock_check.assert_called_once_with(self.user.pk)
+        with patch('ai_security.realtime.is_enabled', return_value=False):
+            request = factory.get('/sensitive/')
+            force_authenticate(request, user=self.user)
+            SensitiveView.as_view()(request, code=200)
+        self.assertEqual(mock_check.call_count, 1)
@@ -1,48 +1,115 @@
 """
 Separate training module for Isolation Forest with model evaluation metrics.
-Provides Precision, Recall, F1-score evaluation using cross-validation.
+Provides Precision, Recall, F1-score evaluation using cross-validation, and
+the float32 / reservoir-sampling helpers training uses to bound memory.
 """
 import logging
 
 import numpy as np
+from joblib import Parallel, delayed
 from sklearn.ensemble import IsolationForest
 from sklearn.metrics import precision_score, recall_score, f1_score
 from sklearn.model_selection import KFold
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
 
 from .features import FEATURE_NAMES
 
 logger = logging.getLogger(__name__)
 
 
+def as_float32(feature_matrix):
+    """Return the rows as a float32 array; float32 arrays and memmaps are not copied."""
+    return np.asarray(feature_matrix, dtype=np.float32)
+
+
+def reservoir_sample(chunks, size, random_state=42):
+    """Uniform sample of at most ``size`` rows from an iterable of row chunks.
+
+    Algorithm R applied a chunk at a time: memory stays at ``size`` rows
+    however many rows the chunks hold, and chunks may be memory-mapped.
+    """
+    rng = np.random.RandomState(random_state)
+    reservoir = np.empty((size, len(FEATURE_NAMES)), dtype=np.float32)
+    seen = 0
+    for chunk in chunks:
+        chunk = as_float32(chunk)
+        if not len(chunk):
+            continue
+        fill = min(max(size - seen, 0), len(chunk))
+        reservoir[seen:seen + fill] = chunk[:fill]
+        rest = np.arange(fill, len(chunk))
+        if len(rest):
+            # Row number n (0-based, over all chunks) replaces a random slot with probability size / (n + 1)
+            slots = rng.randint(0, seen + rest + 1)
+            kept = slots < size
+            reservoir[slots[kept]] = chunk[rest[kept]]
+        seen += len(chunk)
+    return reservoir[:min(seen, size)]
+
+
+def _evaluate_fold(model, X, y, train_idx, test_idx):
+    """Fit ``model`` on one CV fold and return its (precision, recall, f1)."""
+    model.fit(X[train_idx])
+    y_pred = model.predict(X[test_idx])
+
+    # Convert: -1 (anomaly) -> 1 (positive), 1 (normal) -> 0 (negative)
+    y_test_binary = (y[test_idx] == -1).astype(int)
+    y_pred_binary = (y_pred == -1).astype(int)
+
+    if y_test_binary.sum() == 0 and y_pred_binary.sum() == 0:
+        return 1.0, 1.0, 1.0
+    return (
+        precision_score(y_test_binary, y_pred_binary, zero_division=0),
+        recall_score(y_test_binary, y_pred_binary, zero_division=0),
+        f1_score(y_test_binary, y_pred_binary, zero_division=0),
+    )
+
+
 class ModelTrainer:
     """Handles training, retraining, and evaluation of the Isolation Forest model."""
 
-    def __init__(self, contamination=0.05, n_estimators=200, random_state=42):
+    def __init__(self, contamination=0.05, n_estimators=200, random_state=42, n_jobs=-1, max_samples='auto'):
         self.contamination = contamination
         self.n_estimators = n_estimators
+        self.max_samples = max_samples
         self.random_state = random_state
+        self.n_jobs = n_jobs
+
+    def _make_model(self, contamination=None, n_jobs=None):
+        """Scaler + Isolation Forest, fitted like IsolationForestEngine.train()."""
+        return make_pipeline(
+            StandardScaler(),
+            IsolationForest(
+                contamination=contamination or self.contamination,
+                n_estimators=self.n_estimators,
+                # Larger than a training fold means the whole fold, as in IsolationForestEngine.train()
+                max_samples=self.max_samples,
+                random_state=self.random_state,
+                n_jobs=self.n_jobs if n_jobs is None else n_jobs,
+            ),
+        )
 
     def train_model(self, feature_matrix):
         """Train an Isolation Forest model and return it."""
-        X = np.array(feature_matrix)
-        model = IsolationForest(
-            contamination=self.contamination,
-            n_estimators=self.n_estimators,
-            random_state=self.random_state,
-        )
+        X = as_float32(feature_matrix)
+        model = self._make_model()
         model.fit(X)
         return model
 
-    def evaluate_model(self, feature_matrix, labels=None, n_splits=5):
+    def evaluate_model(self, feature_matrix, labels=None, n_splits=5, n_jobs=1):
         """
         Evaluate model using cross-validation.
 
         If labels are provided (1=normal, -1=anomaly), compute Precision/Recall/F1.
         If no labels, use synthetic evaluation based on model's own predictions.
+        Folds are fitted concurrently on ``n_jobs`` threads; tree fitting
+        releases the GIL, and threads also work inside Celery's daemonic
+        worker processes, where joblib cannot start a process pool.
 
         Returns dict with precision, recall, f1, accuracy metrics.
         """
-        X = np.array(feature_matrix)
+        X = as_float32(feature_matrix)
 
         if len(X) < n_splits * 2:
             logger.warning('Not enough data for %d-fold CV. Using simple evaluation.', n_splits)
@@ -56,34 +123,13 @@ class ModelTrainer:
             y = model.predict(X)  # 1 = normal, -1 = anomaly
 
         kf = KFold(n_splits=n_splits, shuffle=True, random_state=self.random_state)
-        all_precision = []
-        all_recall = []
-        all_f1 = []
-
-        for train_idx, test_idx in kf.split(X):
-            X_train, X_test = X[train_idx], X[test_idx]
-            y_test = y[test_idx]
-
-            model = IsolationForest(
-                contamination=self.contamination,
-                n_estimators=self.n_estimators,
-                random_state=self.random_state,
-            )
-            model.fit(X_train)
-            y_pred = model.predict(X_test)
-
-            # Convert: -1 (anomaly) -> 1 (positive), 1 (normal) -> 0 (negative)
-            y_test_binary = (y_test == -1).astype(int)
-            y_pred_binary = (y_pred == -1).astype(int)
-
-            if y_test_binary.sum() == 0 and y_pred_binary.sum() == 0:
-                all_precision.append(1.0)
-                all_recall.append(1.0)
-                all_f1.append(1.0)
-            else:
-                all_precision.append(precision_score(y_test_binary, y_pred_binary, zero_division=0))
-                all_recall.append(recall_score(y_test_binary, y_pred_binary, zero_division=0))
-                all_f1.append(f1_score(y_test_binary, y_pred_binary, zero_division=0))
+        # With folds in parallel each forest fits single-threaded, so cores are not oversubscribed
+        forest_jobs = None if n_jobs == 1 else 1
+        scores = Parallel(n_jobs=n_jobs, prefer='threads')(
+            delayed(_evaluate_fold)(self._make_model(n_jobs=forest_jobs), X, y, train_idx, test_idx)
+            for train_idx, test_idx in kf.split(X)
+        )
+        all_precision, all_recall, all_f1 = zip(*scores)
 
         return {
             'precision': float(np.mean(all_precision)),
@@ -127,7 +173,7 @@ class ModelTrainer:
         Retrain model incorporating false positive feedback.
         False positives are explicitly marked as normal during retraining.
         """
-        X = np.array(feature_matrix)
+        X = as_float32(feature_matrix)
 
         if false_positive_indices:
             # Train initial model
@@ -138,11 +184,7 @@ class ModelTrainer:
             effective_anomalies = max(1, int(self.contamination * len(X)) - len(false_positive_indices))
             adjusted_contamination = max(0.01, effective_anomalies / len(X))
 
-            model = IsolationForest(
-                contamination=adjusted_contamination,
-                n_estimators=self.n_estimators,
-                random_state=self.random_state,
-            )
+            model = self._make_model(contamination=adjusted_contamination)
             model.fit(X)
             return model
 
@@ -14,4 +14,7 @@ urlpatterns = [
     path('model-status/', views.AIModelStatusView.as_view(), name='model-status'),
     path('scan/', views.ManualScanView.as_view(), name='manual-scan'),
     path('evaluate/', views.ModelEvaluationView.as_view(), name='model-evaluation'),
+    path('evaluate/<str:task_id>/', views.ModelEvaluationStatusView.as_view(), name='model-evaluation-status'),
+    path('shadow-models/', views.ShadowModelListView.as_view(), name='shadow-model-list'),
+    path('shadow-models/<uuid:pk>/promote/', views.ShadowModelPromoteView.as_view(), name='shadow-model-promote'),
 ]
@@ -1,4 +1,8 @@
+import uuid
+from datetime import timedelta
+
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.translation import gettext_lazy as _
 from rest_framework import generics, filters, status
 from rest_framework.permissions import IsAuthenticated
@@ -7,6 +11,7 @@ from rest_framework.views import APIView
 
 from accounts.permissions import IsSuperAdmin, IsKonfessiyaRahbari, IsKonfessiyaXodimi
 from accounts.models import Role
+from . import drift
 from .models import ActivityLog, AnomalyReport, AIModelConfig
 from .serializers import (
     ActivityLogSerializer,
@@ -106,7 +111,15 @@ class AIModelStatusView(APIView):
         ).first()
         if not config:
             return Response({'detail': _('No active AI model configured.')}, status=status.HTTP_404_NOT_FOUND)
-        return Response(AIModelConfigSerializer(config).data)
+        data = AIModelConfigSerializer(config).data
+        # The raw running statistics stay internal; the drift summary is reported on its own
+        data['parameters'] = {
+            key: value for key, value in (data['parameters'] or {}).items()
+            if key not in ('drift', 'drift_reference')
+        }
+        data['drift'] = drift.summary(config)
+        data['retrain_reason'] = drift.retrain_reason(config)
+        return Response(data)
 
 
 class ManualScanView(APIView):
@@ -118,39 +131,111 @@ class ManualScanView(APIView):
         return Response({'detail': _('Scan initiated.')}, status=status.HTTP_202_ACCEPTED)
 
 
+# A pending/running evaluation older than this is assumed lost (evaluate_model's hard time limit)
+EVALUATION_STALE_AFTER = timedelta(seconds=900)
+
+
+def _evaluation_record():
+    config = AIModelConfig.objects.filter(model_type='isolation_forest', is_active=True).first()
+    parameters = config.parameters if config else {}
+    return parameters.get('evaluation'), parameters.get('evaluation_result')
+
+
 class ModelEvaluationView(APIView):
-    """Evaluate the AI model and return Precision, Recall, F1 metrics."""
+    """Latest Precision, Recall, F1 metrics of the AI model (GET) and starting a new evaluation (POST)."""
     permission_classes = [IsSuperAdmin]
 
     def get(self, request):
-        from accounts.models import CustomUser
-        from .features import extract_user_features, features_to_vector
-        from .training import ModelTrainer
+        from .features import FEATURE_NAMES
 
-        users = CustomUser.objects.filter(is_active=True)
-        feature_matrix = []
+        evaluation, result = _evaluation_record()
+        return Response({
+            'evaluation': evaluation,
+            'metrics': result['metrics'] if result else None,
+            'evaluated_at': result['finished_at'] if result else None,
+            'feature_names': list(FEATURE_NAMES),
+        })
 
-        for user in users:
-            features = extract_user_features(user, hours=24)
-            vector = features_to_vector(features)
-            if any(v != 0 for v in vector):
-                feature_matrix.append(vector)
+    def post(self, request):
+        from .tasks import evaluate_model, set_evaluation_state
 
-        if len(feature_matrix) < 10:
-            return Response({
-                'detail': _('Not enough data for evaluation.'),
-                'samples': len(feature_matrix),
-            }, status=status.HTTP_400_BAD_REQUEST)
+        evaluation, _result = _evaluation_record()
+        if evaluation and evaluation.get('status') in ('pending', 'running'):
+            requested_at = parse_datetime(evaluation.get('requested_at') or '')
+            if requested_at and timezone.now() - requested_at < EVALUATION_STALE_AFTER:
+                return Response(evaluation, status=status.HTTP_202_ACCEPTED)
 
-        trainer = ModelTrainer()
-        metrics = trainer.evaluate_model(feature_matrix)
+        task_id = str(uuid.uuid4())
+        config = set_evaluation_state(task_id, status='pending', requested_at=timezone.now().isoformat())
+        evaluate_model.apply_async(task_id=task_id)
+        return Response(config.parameters['evaluation'], status=status.HTTP_202_ACCEPTED)
 
-        return Response({
-            'metrics': metrics,
-            'feature_names': list(
-                __import__('ai_security.features', fromlist=['FEATURE_NAMES']).FEATURE_NAMES
-            ),
-        })
+
+class ModelEvaluationStatusView(APIView):
+    """Status of an evaluation job started through ModelEvaluationView."""
+    permission_classes = [IsSuperAdmin]
+
+    def get(self, request, task_id):
+        evaluation, _result = _evaluation_record()
+        if not evaluation or evaluation.get('task_id') != task_id:
+            return Response({'detail': _('Not found.')}, status=status.HTTP_404_NOT_FOUND)
+        return Response(evaluation)
+
+
+def _shadow_data(config):
+    return {
+        'id': config.id,
+        'name': config.name,
+        'model_file_path': config.model_file_path,
+        'version': config.parameters.get('version'),
+        'last_trained_at': config.last_trained_at,
+        'registered_at': config.created_at,
+        'is_active': config.is_active,
+        'scoring': config.parameters.get('shadow'),
+    }
+
+
+class ShadowModelListView(APIView):
+    """Shadow models scored next to the active one (GET) and registering a new one (POST).
+
+    POST takes a saved model ``version`` or a ``model_file_path`` that is a
+    ``sha256:`` model store reference, and an optional ``name``.
+    """
+    permission_classes = [IsSuperAdmin]
+
+    def get(self, request):
+        from . import shadow
+        configs = AIModelConfig.objects.filter(model_type=shadow.MODEL_TYPE).order_by('created_at')
+        return Response([_shadow_data(config) for config in configs])
+
+    def post(self, request):
+        from . import shadow
+        try:
+            config = shadow.register(
+                version=request.data.get('version'),
+                model_file_path=request.data.get('model_file_path'),
+                name=request.data.get('name'),
+            )
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(_shadow_data(config), status=status.HTTP_201_CREATED)
+
+
+class ShadowModelPromoteView(APIView):
+    """Make a shadow model the active one; the replaced model becomes a shadow."""
+    permission_classes = [IsSuperAdmin]
+
+    def post(self, request, pk):
+        from . import shadow
+        try:
+            # Form and JSON bodies alike: only 'true' (any case) or true keeps the replaced model
+            keep_previous = str(request.data.get('keep_previous', 'true')).lower() == 'true'
+            config = shadow.promote(pk, keep_previous=keep_previous)
+        except AIModelConfig.DoesNotExist:
+            return Response({'detail': _('Not found.')}, status=status.HTTP_404_NOT_FOUND)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(AIModelConfigSerializer(config).data)
 
 
 class ReviewAnomalyView(APIView):
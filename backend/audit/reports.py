@@ -16,22 +16,9 @@ class ReportGenerator:
 
     @staticmethod
     def activity_report(date_from=None, date_to=None):
-        from ai_security.models import ActivityLog
+        from ai_security.rollups import request_breakdown
 
-        qs = ActivityLog.objects.select_related('user').all()
-        if date_from:
-            qs = qs.filter(created_at__gte=date_from)
-        if date_to:
-            qs = qs.filter(created_at__lte=date_to)
-
-        total = qs.count()
-        by_method = {}
-        by_status = {}
-        for log in qs[:1000]:
-            method = log.request_method or 'N/A'
-            by_method[method] = by_method.get(method, 0) + 1
-            status_group = f'{(log.response_status or 0) // 100}xx'
-            by_status[status_group] = by_status.get(status_group, 0) + 1
+        total, by_method, by_status = request_breakdown(date_from, date_to)
 
         return {
             'title': 'Activity Report',
@@ -7,7 +7,8 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from accounts.models import CustomUser, Role
-from ai_security.models import AnomalyReport, ActivityLog
+from ai_security.models import AnomalyReport
+from ai_security.rollups import daily_request_counts
 from confessions.models import Confession, Organization
 from documents.models import Document, DocumentAccessLog
 from notifications.models import Notification
@@ -70,15 +71,15 @@ class DashboardStatsView(APIView):
 
             # Weekly activity trend (last 7 days)
             activity_data = []
+            today = timezone.now().date()
+            request_counts = daily_request_counts(today - timedelta(days=6), today)
             for i in range(6, -1, -1):
-                day = timezone.now().date() - timedelta(days=i)
+                day = today - timedelta(days=i)
                 day_start = timezone.make_aware(
                     timezone.datetime.combine(day, timezone.datetime.min.time())
                 )
                 day_end = day_start + timedelta(days=1)
-                normal_count = ActivityLog.objects.filter(
-                    created_at__gte=day_start, created_at__lt=day_end,
-                ).count()
+                normal_count = request_counts.get(day, 0)
                 anomaly_count = AnomalyReport.objects.filter(
                     detected_at__gte=day_start, detected_at__lt=day_end,
                 ).count()
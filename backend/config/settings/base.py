@@ -173,6 +173,11 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': 60 * 15,  # Every 15 minutes
         'options': {'expires': 60 * 14},  # expires before next run
     },
+    'rollup-activity-logs': {
+        'task': 'ai_security.tasks.rollup_activity_logs',
+        'schedule': 60 * 5,  # Every 5 minutes
+        'options': {'expires': 60 * 4},  # expires before next run
+    },
     'cleanup-old-logs': {
         'task': 'ai_security.tasks.cleanup_old_logs',
         'schedule': 60 * 60 * 24 * 7,  # Weekly
@@ -202,6 +207,18 @@ CELERY_BEAT_SCHEDULE = {
 CELERY_TASK_TIME_LIMIT = 600  # Hard kill after 10 minutes
 CELERY_TASK_SOFT_TIME_LIMIT = 300  # Raise SoftTimeLimitExceeded after 5 minutes
 
+# Cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'ai_features': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://localhost:6379/0'),
+        'KEY_PREFIX': 'ai',
+    },
+}
+
 # Email
 EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
 EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
@@ -272,12 +289,137 @@ AI_SECURITY = {
     'ISOLATION_FOREST': {
         'CONTAMINATION': 0.05,
         'N_ESTIMATORS': 200,
+        'MAX_SAMPLES': 256,
         'THRESHOLD': -0.5,
+        'N_JOBS': -1,  # Fit trees on all cores
+        # Larger training sets (e.g. with backfilled history) are reservoir-sampled down
+        'MAX_TRAINING_SAMPLES': 200000,
+        # Grow the active forest by WARM_START_TREES trees per run instead of refitting it
+        'WARM_START': os.environ.get('AI_WARM_START', 'False').lower() == 'true',
+        'WARM_START_TREES': 50,
     },
     'SCAN_INTERVAL_MINUTES': 15,
+    # 'isolation_forest' or 'half_space_trees' (needs STREAMING and FEATURE_STORE enabled)
+    'DETECTOR': os.environ.get('AI_DETECTOR', 'isolation_forest'),
+    # With the streaming detector selected, the daily Isolation Forest retrain can be turned off
+    'DAILY_RETRAIN': os.environ.get('AI_DAILY_RETRAIN', 'True').lower() == 'true',
+    'SCAN_BATCH_SIZE': 500,  # Users per scan_user_batch subtask
+    'EXPLAIN_METHOD': 'perturbation',  # 'perturbation' or 'path' (isolation-path attribution)
+    'EVALUATION_N_JOBS': -1,  # Cross-validation folds evaluated in parallel by evaluate_model
     'LOG_RETENTION_DAYS': 730,  # TZ: 2 years retention
+    # zlib level for saved model bundles; 0 lets workers memory-map the compiled scorer's arrays
+    'MODEL_BUNDLE_COMPRESS': 0,
+    # Bundles are stored in the database by digest; each node caches the ones it loads here
+    'MODEL_STORE': {
+        'CACHE_DIR': os.environ.get('AI_MODEL_CACHE_DIR', str(BASE_DIR / 'ml_models' / 'store')),
+        'KEEP_BLOBS': 10,
+    },
+    # Isolation Forest parameter grid evaluated by run_hyperparameter_sweep / `manage.py sweep_hyperparameters`
+    'SWEEP': {
+        'GRID': {
+            # Only swept on feedback labels alone; other sweeps keep the active contamination
+            'contamination': [0.01, 0.03, 0.05, 0.1],
+            'n_estimators': [100, 200, 300],
+            'max_samples': [128, 256, 512],
+        },
+        'N_JOBS': -1,  # Configurations evaluated in parallel
+        'TEST_SIZE': 0.3,
+        'SYNTHETIC_DATASET': (
+            os.environ.get('AI_SYNTHETIC_DATASET')
+            or str(BASE_DIR.parent / 'ai_module' / 'dataset_activity_logs.csv')
+        ),
+    },
+    # Candidate / previous models scored next to the active one on every scan batch (ai_security.shadow)
+    'SHADOW': {
+        'MAX_MODELS': 2,
+        'MAX_DISAGREEMENTS': 20,  # Largest flag disagreements kept per shadow model
+    },
+    # Per-user EWMA baselines blended into scan scores (ai_security.baselines)
+    'BASELINES': {
+        'ENABLED': os.environ.get('AI_BASELINES_ENABLED', 'False').lower() == 'true',
+        'ALPHA': 0.05,  # EWMA weight of each new vector
+        'UPDATE_INTERVAL_MINUTES': 60,  # Scan windows overlap; learn from at most one per interval
+        'MIN_OBSERVATIONS': 8,  # Updates before a baseline affects scores
+        'WEIGHT': 0.3,  # Share of the blended score taken from the baseline deviation
+        'Z_FREE': 2.0,
+        'Z_SCALE': 3.0,
+        'SKIP_UPDATE_ABOVE': 0.7,  # Critical rows are not learned
+    },
+    # Scanned feature distributions compared with the training data (ai_security.drift)
+    'DRIFT': {
+        'ENABLED': True,
+        # Replace the daily retrain with an hourly check that retrains only on drift or MAX_AGE_HOURS
+        'GATE_RETRAINING': os.environ.get('AI_DRIFT_GATED_RETRAIN', 'False').lower() == 'true',
+        'PSI_THRESHOLD': 0.2,
+        'KS_THRESHOLD': 0.15,
+        'MIN_SAMPLES': 500,  # Scanned vectors needed before drift is judged
+        'WINDOW_SIZE': 20000,  # Older observations are halved away beyond this many
+        'MAX_AGE_HOURS': 24 * 7,
+    },
+    # Shards written by `manage.py backfill_features`, added to the training data when set
+    'TRAINING_DATASET_DIR': os.environ.get('AI_TRAINING_DATASET_DIR', ''),
+    # Inline scoring on sensitive endpoints (RealtimeScoringMixin); needs the feature store
+    'REALTIME_SCORING': {
+        'ENABLED': os.environ.get('AI_REALTIME_SCORING_ENABLED', 'False').lower() == 'true',
+        'BUDGET_MS': 1.0,
+        'SOCKET_TIMEOUT': 0.05,
+        'DEFER_SECONDS': 60,  # At most one realtime_anomaly_check queued per user in this time
+    },
+    # Per-user feature vectors shared by training, evaluation and scanning
+    'FEATURE_CACHE': {
+        'ENABLED': True,
+        'ALIAS': 'ai_features',
+        'BUCKET_SECONDS': 300,
+    },
+    # Half-Space Trees detector (ai_security.streaming), updated with the users of recent log flushes
+    'STREAMING': {
+        'ENABLED': os.environ.get('AI_STREAMING_ENABLED', 'False').lower() == 'true',
+        'N_TREES': 25,
+        'DEPTH': 8,
+        'WINDOW_SIZE': 256,
+        # 'CONTAMINATION' overrides ISOLATION_FOREST['CONTAMINATION'] for this detector
+        'LOCK_TIMEOUT': 30,
+        'UPDATE_SECONDS': 60,  # Queued users are added and the state written once per tick
+        'ADD_INTERVAL_SECONDS': 3600,  # A user's 1-hour vector is added at most this often
+        'MAX_USERS_PER_UPDATE': 5000,
+    },
+    # Rescore users as their events arrive instead of the 15-minute scan (needs FEATURE_STORE enabled)
+    'RESCORING': {
+        'ENABLED': os.environ.get('AI_RESCORING_ENABLED', 'False').lower() == 'true',
+        'TICK_SECONDS': 5,
+        'BUDGET': 500,  # Dirty users scored per tick, highest priority first
+    },
+    # Incremental per-user feature counters (Redis), updated as logs are written
+    'FEATURE_STORE': {
+        'ENABLED': os.environ.get('AI_FEATURE_STORE_ENABLED', 'False').lower() == 'true',
+        'URL': os.environ.get('REDIS_URL', 'redis://localhost:6379/0'),
+        'BUCKET_SECONDS': 300,
+        'RETENTION_HOURS': 25,
+    },
 }
 
+if AI_SECURITY['DRIFT']['GATE_RETRAINING']:
+    del CELERY_BEAT_SCHEDULE['train-isolation-forest']
+    CELERY_BEAT_SCHEDULE['retrain-if-needed'] = {
+        'task': 'ai_security.tasks.retrain_if_needed',
+        'schedule': 60 * 60,  # Hourly
+        'options': {'queue': 'default', 'expires': 60 * 55},
+    }
+
+if AI_SECURITY['STREAMING']['ENABLED']:
+    CELERY_BEAT_SCHEDULE['update-streaming-detector'] = {
+        'task': 'ai_security.tasks.update_streaming_detector',
+        'schedule': AI_SECURITY['STREAMING']['UPDATE_SECONDS'],
+        'options': {'expires': AI_SECURITY['STREAMING']['UPDATE_SECONDS']},  # expires before next run
+    }
+
+if AI_SECURITY['RESCORING']['ENABLED']:
+    CELERY_BEAT_SCHEDULE['rescore-dirty-users'] = {
+        'task': 'ai_security.tasks.rescore_dirty_users',
+        'schedule': AI_SECURITY['RESCORING']['TICK_SECONDS'],
+        'options': {'expires': AI_SECURITY['RESCORING']['TICK_SECONDS']},  # expires before next run
+    }
+
 # SMS 2FA
 SMS_BACKEND = os.environ.get('SMS_BACKEND', 'console')  # 'console', 'twilio'
 TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID', '')
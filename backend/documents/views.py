@@ -14,6 +14,7 @@ from rest_framework.views import APIView
 from accounts.models import Role
 from accounts.permissions import IsSuperAdmin
 from accounts.security import get_client_ip
+from ai_security.mixins import RealtimeScoringMixin
 from audit.mixins import AuditMixin
 from .encryption import encrypt_file, decrypt_file
 from .honeypot import HoneypotManager
@@ -225,7 +226,7 @@ class DocumentDetailView(AuditMixin, generics.RetrieveUpdateDestroyAPIView):
         return response
 
 
-class DocumentShareView(APIView):
+class DocumentShareView(RealtimeScoringMixin, APIView):
     """Share an existing document with other organizations."""
     permission_classes = [IsAuthenticated]
 
@@ -293,7 +294,7 @@ class DocumentMarkReadView(APIView):
         return Response({'detail': 'ok', 'updated': updated})
 
 
-class DocumentDownloadView(APIView):
+class DocumentDownloadView(RealtimeScoringMixin, APIView):
     """Download a document with confirmation for confidential/secret docs."""
     permission_classes = [IsAuthenticated]
 